@@ -1,6 +1,6 @@
 from invoke import Collection
 
-from tasks import doc, env, git, secure, style, test
+from tasks import bench, doc, env, git, secure, style, test
 from tasks.build import build_ns
 
 ns = Collection()
@@ -11,3 +11,4 @@ ns.add_collection(style)
 ns.add_collection(build_ns)
 ns.add_collection(doc)
 ns.add_collection(secure)
+ns.add_collection(bench)
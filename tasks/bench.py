@@ -0,0 +1,24 @@
+from invoke import task
+
+from tasks.common import USE_PTY, VENV_PREFIX
+
+
+@task(default=True)
+def run(
+    ctx,
+    output="benchmark.json",
+    compare=None,
+    media=None,
+    duration=10,
+    size="854x480",
+    repeat=3,
+    methods="PerceptualHashing",
+):
+    """Benchmark the decode -> hash -> write pipeline (on a testsrc synthetic video)"""
+    options = f"--output {output} --duration {duration} --size {size} --repeat {repeat}"
+    options += f" --methods {' '.join(methods.split(','))}"
+    if compare:
+        options += f" --compare {compare}"
+    if media:
+        options += f" --media {media}"
+    ctx.run(f"{VENV_PREFIX} python -m vhcalc.tools.benchmark {options}", pty=USE_PTY)
@@ -1,3 +1,6 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 import pytest
@@ -28,6 +31,15 @@ def big_buck_bunny_trailer(resource_video_path) -> Path:
     return resource_video_path("big_buck_bunny_trailer_480p.mkv")
 
 
+@pytest.fixture(scope="session", autouse=True)
+def cache_dir(tmp_path_factory):
+    """cache directory of the tests (instead of the user one)"""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        p_cache_dir = tmp_path_factory.mktemp("cache")
+        monkeypatch.setenv("VHCALC_CACHE_DIR", str(p_cache_dir))
+        yield p_cache_dir
+
+
 @pytest.fixture(scope="session", autouse=True)
 def ftp_server_up(ftpserver, big_buck_bunny_trailer):
     file_uploaded = ftpserver.put_files(
@@ -35,3 +47,74 @@ def ftp_server_up(ftpserver, big_buck_bunny_trailer):
     )
     assert len(file_uploaded) == 1
     return file_uploaded[0]
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serve the content of the server with range requests (keep-alive connections),
+    the nth responses can be cut (the connection is closed)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        content = server.content
+        with server.lock:
+            server.nb_requests += 1
+            request_index = server.nb_requests
+        if self.path != "/media.mkv":
+            self.send_error(404)
+            return
+
+        range_header = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers["Range"] or "")
+        if server.accept_ranges and range_header:
+            first, last = int(range_header[1]), int(range_header[2])
+            if first >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = content[first : last + 1]
+            self.send_response(206)
+            self.send_header(
+                "Content-Range",
+                f"bytes {first}-{first + len(body) - 1}/{len(content)}",
+            )
+        else:
+            body = content
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if request_index in server.cut_requests:
+            # disconnection in the middle of the body
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.nb_connections += 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server(big_buck_bunny_trailer):
+    """local HTTP server (stand-in of a media server) of the test media, at `url`"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+    server.daemon_threads = True
+    server.content = big_buck_bunny_trailer.read_bytes()
+    server.lock = threading.Lock()
+    server.nb_requests = 0
+    server.nb_connections = 0
+    server.accept_ranges = True
+    server.cut_requests = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/media.mkv"
+    yield server
+    server.shutdown()
+    server.server_close()
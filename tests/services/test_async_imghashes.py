@@ -0,0 +1,68 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from vhcalc.services.async_imghashes import (
+    async_b2b_stream_to_imghash,
+    async_b2u_stream_to_imghashes,
+)
+from vhcalc.services.imghashes import export_imghash_from_media
+
+
+async def _read_chunks(path, chunk_size=64 * 1024):
+    with path.open("rb") as fi:
+        while chunk := fi.read(chunk_size):
+            # let the other streams run, as an upload would
+            await asyncio.sleep(0)
+            yield chunk
+
+
+def test_async_b2u_stream_to_imghashes_concurrently(big_buck_bunny_trailer, tmp_path):
+    p_export = export_imghash_from_media(big_buck_bunny_trailer, output_dir=tmp_path)
+
+    async def _hash(path):
+        return [
+            chunk_imghashes
+            async for chunk_imghashes in async_b2u_stream_to_imghashes(
+                _read_chunks(path), chunk_size_in_frames=100
+            )
+        ]
+
+    async def _hash_concurrently():
+        return await asyncio.gather(*(_hash(big_buck_bunny_trailer) for _ in range(3)))
+
+    for chunks_imghashes in asyncio.run(_hash_concurrently()):
+        assert [len(chunk) for chunk in chunks_imghashes][:2] == [100, 100]
+        assert (
+            np.concatenate(chunks_imghashes).astype(">u8").tobytes()
+            == p_export.read_bytes()
+        )
+
+
+def test_async_b2b_stream_to_imghash_closed_early(big_buck_bunny_trailer, tmp_path):
+    p_export = export_imghash_from_media(big_buck_bunny_trailer, output_dir=tmp_path)
+
+    async def _first_imghashes():
+        it_imghash = async_b2b_stream_to_imghash(_read_chunks(big_buck_bunny_trailer))
+        imghashes = [await it_imghash.__anext__() for _ in range(2)]
+        # the ffmpeg process is killed
+        await it_imghash.aclose()
+        return imghashes
+
+    bin_imghashes = p_export.read_bytes()
+    assert asyncio.run(_first_imghashes()) == [bin_imghashes[:8], bin_imghashes[8:16]]
+
+
+def test_async_b2u_stream_to_imghashes_invalid_media():
+    async def _not_a_media():
+        yield b"not a media" * 1000
+
+    async def _hash():
+        return [
+            chunk_imghashes
+            async for chunk_imghashes in async_b2u_stream_to_imghashes(_not_a_media())
+        ]
+
+    with pytest.raises(RuntimeError, match="ffmpeg failed"):
+        asyncio.run(_hash())
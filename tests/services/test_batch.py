@@ -0,0 +1,81 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from vhcalc.services.batch import export_imghash_from_medias
+from vhcalc.services.imghashes import export_imghash_from_media
+
+
+def test_export_imghash_from_medias(big_buck_bunny_trailer, tmp_path):
+    p_small_video = tmp_path / "small.mkv"
+    p_small_video.write_bytes(big_buck_bunny_trailer.read_bytes()[:200_000])
+    p_missing_video = tmp_path / "missing.mkv"
+    output_dir = tmp_path / "phash"
+    output_dir.mkdir()
+
+    exports = export_imghash_from_medias(
+        [p_small_video, p_missing_video, big_buck_bunny_trailer],
+        output_dir=output_dir,
+        max_decoders=2,
+        max_hashers=2,
+    )
+
+    # largest medias first
+    assert list(exports) == [big_buck_bunny_trailer, p_small_video, p_missing_video]
+    # one failing media doesn't abort the others
+    assert isinstance(exports[p_missing_video], FileNotFoundError)
+    expected_export = export_imghash_from_media(
+        big_buck_bunny_trailer, tmp_path / "expected.phash"
+    )
+    assert isinstance(exports[big_buck_bunny_trailer], Path)
+    assert exports[big_buck_bunny_trailer].parent == output_dir
+    assert exports[big_buck_bunny_trailer].read_bytes() == expected_export.read_bytes()
+    assert exports[p_small_video].parent == output_dir
+
+
+def test_export_imghash_from_medias_keep_outputs_per_media(
+    big_buck_bunny_trailer, tmp_path
+):
+    p_videos = [tmp_path / f"video_{i}.mkv" for i in range(3)]
+    for p_video in p_videos:
+        shutil.copy(big_buck_bunny_trailer, p_video)
+
+    p_metrics = tmp_path / "metrics.jsonl"
+
+    exports = export_imghash_from_medias(
+        p_videos,
+        output_dir=tmp_path,
+        max_decoders=3,
+        max_hashers=2,
+        metrics_file=p_metrics,
+    )
+
+    assert len(set(exports.values())) == len(p_videos)
+    assert len({export.read_bytes() for export in exports.values()}) == 1
+    # the (process-wide) CPU time of the child processes isn't split per media
+    metrics_lines = [json.loads(line) for line in p_metrics.read_text().splitlines()]
+    assert len(metrics_lines) == len(p_videos)
+    assert not any("children_cpu_seconds" in line for line in metrics_lines)
+
+
+def test_export_imghash_from_medias_with_same_names(big_buck_bunny_trailer, tmp_path):
+    p_videos = [tmp_path / media_dir / "video.mkv" for media_dir in ("a", "b")]
+    for p_video in p_videos:
+        p_video.parent.mkdir()
+        shutil.copy(big_buck_bunny_trailer, p_video)
+    output_dir = tmp_path / "phash"
+
+    # their outputs would be the same file
+    with pytest.raises(ValueError, match="same file name"):
+        export_imghash_from_medias(p_videos, output_dir=output_dir, max_decoders=2)
+    assert not output_dir.exists()
+
+    # a media given many times is exported once
+    exports = export_imghash_from_medias(
+        [p_videos[0], tmp_path / "b" / ".." / "a" / "video.mkv"],
+        output_dir=tmp_path,
+        max_decoders=2,
+    )
+    assert list(exports) == [p_videos[0]]
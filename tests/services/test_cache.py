@@ -0,0 +1,61 @@
+from vhcalc.models import DECODE_PROFILES, DecodeProfile
+from vhcalc.services.cache import ImageHashesCache
+from vhcalc.services.imghashes import b2b_stream_to_imghash, export_imghash_from_media
+
+
+def test_export_imghash_from_media_with_cache(big_buck_bunny_trailer, tmp_path, mocker):
+    cache = ImageHashesCache(tmp_path / "cache")
+    p_export = export_imghash_from_media(
+        big_buck_bunny_trailer, tmp_path / "export.phash", cache=cache
+    )
+    # the media is not decoded again: images hashes come from the cache
+    spy_gen_chunk_imghashes = mocker.patch(
+        "vhcalc.services.imghashes._gen_chunk_imghashes"
+    )
+    p_cached_export = export_imghash_from_media(
+        big_buck_bunny_trailer, tmp_path / "cached_export.phash", cache=cache
+    )
+    spy_gen_chunk_imghashes.assert_not_called()
+    assert p_cached_export.read_bytes() == p_export.read_bytes()
+
+    # and are shared with the (file-backed) stream API
+    mocker.patch("vhcalc.services.imghashes.build_reader_frame_blocks")
+    with big_buck_bunny_trailer.open("rb") as fo:
+        assert b"".join(b2b_stream_to_imghash(fo, cache=cache)) == p_export.read_bytes()
+
+
+def test_cache_lru_eviction(big_buck_bunny_trailer, tmp_path):
+    cache = ImageHashesCache(tmp_path, max_size=2 * 8)
+    keys = [f"{i}" for i in range(3)]
+    cache.put(keys[0], b"\x00" * 8)
+    cache.put(keys[1], b"\x01" * 8)
+    # keys[0] is the most recently used
+    assert cache.get(keys[0]) == b"\x00" * 8
+    cache.put(keys[2], b"\x02" * 8)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == b"\x00" * 8
+    assert cache.get(keys[2]) == b"\x02" * 8
+
+
+def test_cache_key_with_decode_profile(tmp_path):
+    p_media = tmp_path / "media.bin"
+    p_media.write_bytes(b"\x00" * 1024)
+    key = ImageHashesCache.key(p_media)
+    # the decoding options which don't change the images hashes share the cache entry
+    assert DecodeProfile(threads=4).digest == ""
+    assert (
+        ImageHashesCache.key(
+            p_media, decode_profile=DecodeProfile(threads=4, drop_other_streams=True)
+        )
+        == key
+    )
+    assert ImageHashesCache.key(p_media, decode_profile=DECODE_PROFILES["fast"]) != key
+
+
+def test_cache_key_changes_with_content(tmp_path):
+    p_media = tmp_path / "media.bin"
+    p_media.write_bytes(b"\x00" * 1024)
+    key = ImageHashesCache.key(p_media)
+    p_media.write_bytes(b"\x01" * 1024)
+    assert ImageHashesCache.key(p_media) != key
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from vhcalc.services import index as index_module
+from vhcalc.services.imghashes import export_imghash_from_media
+from vhcalc.services.index import ImageHashesIndex
+from vhcalc.tools.imghash import hamming_distances, imghashes_to_uint64
+
+
+@pytest.fixture(scope="module")
+def p_export(big_buck_bunny_trailer, tmp_path_factory):
+    return export_imghash_from_media(
+        big_buck_bunny_trailer, output_dir=tmp_path_factory.mktemp("phash")
+    )
+
+
+# beyond 15, all the indexed frames are compared (by chunks)
+@pytest.mark.parametrize("max_distance", [0, 3, 8, 12, 15, 16, 32])
+def test_index_search_as_brute_force(max_distance: int, tmp_path, monkeypatch):
+    monkeypatch.setattr(index_module, "MAX_COMPARISONS_PER_CHUNK", 100 * 1000)
+    rng = np.random.default_rng(0)
+    imghashes = rng.integers(0, 2**64, size=5000, dtype=np.uint64)
+    # clusters of close images hashes
+    imghashes[1::2] = imghashes[::2] ^ (
+        np.uint64(1) << rng.integers(0, 64, 2500, dtype=np.uint64)
+    )
+    p_phash = tmp_path / "random.phash"
+    p_phash.write_bytes(imghashes.astype(">u8").tobytes())
+    index = ImageHashesIndex(tmp_path / "index")
+    index.add([p_phash])
+
+    clip_imghashes = imghashes[::50] ^ rng.integers(0, 2**64, 100, dtype=np.uint64) & (
+        rng.integers(0, 2**64, 100, dtype=np.uint64)
+        & rng.integers(0, 2**64, 100, dtype=np.uint64)
+        & rng.integers(0, 2**64, 100, dtype=np.uint64)
+    )
+    searched, frames, distances = index.search(clip_imghashes, max_distance)
+
+    expected_distances = hamming_distances(clip_imghashes[:, None], imghashes[None, :])
+    expected_searched, expected_frames = np.nonzero(expected_distances <= max_distance)
+    assert set(zip(searched.tolist(), frames.tolist())) == set(
+        zip(expected_searched.tolist(), expected_frames.tolist())
+    )
+    assert (distances == expected_distances[searched, frames]).all()
+
+
+def test_index_query(p_export, tmp_path):
+    p_index = tmp_path / "index"
+    p_other = tmp_path / "other.phash"
+    p_other.write_bytes(p_export.read_bytes()[::-1])
+    assert len(ImageHashesIndex(p_index).add([p_other, p_export])) == 2
+    # already indexed files are skipped
+    assert not ImageHashesIndex(p_index).add([p_export])
+
+    # clip: 4 seconds from 10s, with some bits flipped
+    clip_imghashes = imghashes_to_uint64(p_export.read_bytes()[250 * 8 : 350 * 8])
+    clip_imghashes ^= np.uint64(0b101)
+    matches = ImageHashesIndex(p_index).query(clip_imghashes, max_distance=4, top=1)
+
+    assert len(matches) == 1
+    assert matches[0].media == "big_buck_bunny_trailer_480p.mkv"
+    assert matches[0].offset == 250
+    assert matches[0].timestamp == 10.0
+    assert matches[0].nb_matching_frames == 100
+    assert matches[0].mean_distance == 2.0
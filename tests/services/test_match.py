@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from vhcalc.services.imghashes import export_imghash_from_media
+from vhcalc.services.match import align_imghashes, match_phash_files
+from vhcalc.tools.imghash import hamming_distances
+
+
+@pytest.mark.parametrize("max_comparisons_per_chunk", [1, 100, 2**22])
+def test_align_imghashes_as_brute_force(max_comparisons_per_chunk: int):
+    rng = np.random.default_rng(0)
+    media_imghashes = rng.integers(0, 2**64, size=500, dtype=np.uint64)
+    clip_imghashes = rng.integers(0, 2**64, size=20, dtype=np.uint64)
+
+    alignment = align_imghashes(
+        clip_imghashes,
+        media_imghashes,
+        max_comparisons_per_chunk=max_comparisons_per_chunk,
+    )
+
+    sum_distances = [
+        int(
+            hamming_distances(
+                media_imghashes[offset : offset + 20], clip_imghashes
+            ).sum()
+        )
+        for offset in range(500 - 20 + 1)
+    ]
+    assert alignment is not None
+    assert alignment.offset == int(np.argmin(sum_distances))
+    assert alignment.mean_distance == min(sum_distances) / 20
+
+
+def test_align_imghashes_clip_longer_than_media():
+    imghashes = np.zeros(10, dtype=np.uint64)
+    assert align_imghashes(imghashes, imghashes[:5]) is None
+    assert align_imghashes(imghashes[:0], imghashes) is None
+
+
+def test_match_phash_files(big_buck_bunny_trailer, tmp_path):
+    p_media = export_imghash_from_media(big_buck_bunny_trailer, output_dir=tmp_path)
+    p_clip = tmp_path / "clip.phash"
+    p_clip.write_bytes(p_media.read_bytes()[300 * 8 : 400 * 8])
+
+    alignment = match_phash_files(p_clip, p_media, min_segment_nb_frames=10)
+
+    assert alignment.offset == 300
+    assert alignment.mean_distance == 0
+    assert len(alignment.segments) == 1
+    assert alignment.segments[0].media_start == 300
+    assert alignment.segments[0].nb_frames == 100
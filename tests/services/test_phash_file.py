@@ -0,0 +1,169 @@
+import numpy as np
+
+from vhcalc.models import DECODE_PROFILES, DecodeProfile, FrameSampling
+from vhcalc.services import imghashes
+from vhcalc.services.imghashes import (
+    a2b_imghash,
+    b2u_stream_to_imghashes,
+    export_imghash_from_media,
+    read_imghashes,
+)
+from vhcalc.services.phash_file import PhashFile
+
+
+def test_phash_file(big_buck_bunny_trailer, tmp_path):
+    p_export = export_imghash_from_media(big_buck_bunny_trailer, output_dir=tmp_path)
+
+    with PhashFile(p_export) as phash_file, p_export.open("rb") as fo:
+        assert phash_file.fps == 25.0
+        assert len(phash_file) == 812
+        assert list(phash_file) == list(a2b_imghash(fo))
+        assert (
+            phash_file.between(10, 12).tobytes()
+            == p_export.read_bytes()[250 * 8 : 300 * 8]
+        )
+        assert phash_file.values[100] == int.from_bytes(
+            phash_file[100:101].tobytes(), "big"
+        )
+
+
+def test_imghashes_as_uint64(big_buck_bunny_trailer, tmp_path):
+    p_export = export_imghash_from_media(big_buck_bunny_trailer, output_dir=tmp_path)
+
+    with PhashFile(p_export) as phash_file, p_export.open("rb") as fo:
+        # an image hash is split between two blocks of 1000 bytes
+        np.testing.assert_array_equal(
+            np.concatenate(list(read_imghashes(fo, chunk_size=1000))),
+            phash_file.values,
+        )
+        with big_buck_bunny_trailer.open("rb") as fi:
+            chunks_imghashes = list(b2u_stream_to_imghashes(fi))
+        assert [len(chunk) for chunk in chunks_imghashes] == [375, 375, 62]
+        np.testing.assert_array_equal(
+            np.concatenate(chunks_imghashes), phash_file.values
+        )
+        assert chunks_imghashes[0].tobytes() == p_export.read_bytes()[: 375 * 8]
+
+
+def test_phash_file_views_after_close(big_buck_bunny_trailer, tmp_path):
+    p_export = export_imghash_from_media(big_buck_bunny_trailer, output_dir=tmp_path)
+
+    with PhashFile(p_export) as phash_file:
+        values = phash_file.values
+        imghashes_slice = phash_file[:2]
+    # the views are still valid (the mapping is released with them)
+    assert hex(values[0]) == "0xd5d52ad52ad42ad4"
+    assert imghashes_slice.tobytes() == p_export.read_bytes()[:16]
+
+
+def test_phash_file_frame_index(tmp_path):
+    p_phash = tmp_path / "media.mkv.100.0fps.phash"
+    p_phash.write_bytes(b"\x00" * 8 * 100)
+
+    with PhashFile(p_phash) as phash_file:
+        # 0.29 * 100 == 28.999999999999996
+        assert phash_file.frame_index(0.29) == 29
+        assert phash_file.frame_index(0.295) == 29
+
+
+def test_phash_file_empty(tmp_path):
+    p_export = tmp_path / "empty.phash"
+    p_export.touch()
+
+    with PhashFile(p_export) as phash_file:
+        assert len(phash_file) == 0
+        assert phash_file.values.shape == (0,)
+        assert list(phash_file) == []
+
+
+def test_phash_file_container(big_buck_bunny_trailer, tmp_path, mocker):
+    p_phash = export_imghash_from_media(big_buck_bunny_trailer, output_dir=tmp_path)
+    p_container = export_imghash_from_media(
+        big_buck_bunny_trailer, output_dir=tmp_path, container=True
+    )
+    assert p_container.name == f"{big_buck_bunny_trailer.name}.25.0fps.vhc"
+
+    with PhashFile(p_container) as phash_file:
+        assert phash_file.header.method == "PerceptualHashing"
+        assert phash_file.header.frame_size == 32
+        assert phash_file.header.nb_frames == 812
+        assert phash_file.header.duration == 33.033
+        assert not phash_file.header.has_pts
+        assert phash_file.fps == 25.0
+        assert phash_file.imghashes.tobytes() == p_phash.read_bytes()
+        assert phash_file.frame_index(10) == 250
+
+    # an up to date container is reused (without decoding the media)
+    spy_gen_chunk_imghashes = mocker.spy(imghashes, "_gen_chunk_imghashes")
+    export_imghash_from_media(
+        big_buck_bunny_trailer, output_dir=tmp_path, container=True
+    )
+    assert spy_gen_chunk_imghashes.call_count == 0
+
+
+def test_phash_file_container_decode_profile(big_buck_bunny_trailer, tmp_path, mocker):
+    p_fast = export_imghash_from_media(
+        big_buck_bunny_trailer,
+        output_dir=tmp_path,
+        container=True,
+        decode_profile=DECODE_PROFILES["fast"],
+    )
+    with PhashFile(p_fast) as phash_file:
+        assert phash_file.header.decode_profile == DECODE_PROFILES["fast"].digest
+    fast_imghashes = p_fast.read_bytes()
+
+    # a container exported with other decoding options isn't reused
+    spy_gen_chunk_imghashes = mocker.spy(imghashes, "_gen_chunk_imghashes")
+    p_default = export_imghash_from_media(
+        big_buck_bunny_trailer, output_dir=tmp_path, container=True
+    )
+    assert p_default == p_fast
+    assert spy_gen_chunk_imghashes.call_count == 1
+    assert p_default.read_bytes() != fast_imghashes
+    with PhashFile(p_default) as phash_file:
+        assert phash_file.header.decode_profile == ""
+
+    # the decoder threads don't change the images hashes
+    spy_gen_chunk_imghashes.reset_mock()
+    export_imghash_from_media(
+        big_buck_bunny_trailer,
+        output_dir=tmp_path,
+        container=True,
+        decode_profile=DecodeProfile(threads=2),
+    )
+    assert spy_gen_chunk_imghashes.call_count == 0
+
+    # but it is with the same decoding options
+    export_imghash_from_media(
+        big_buck_bunny_trailer,
+        output_dir=tmp_path,
+        container=True,
+        decode_profile=DECODE_PROFILES["fast"],
+    )
+    spy_gen_chunk_imghashes.reset_mock()
+    export_imghash_from_media(
+        big_buck_bunny_trailer,
+        output_dir=tmp_path,
+        container=True,
+        decode_profile=DECODE_PROFILES["fast"],
+    )
+    assert spy_gen_chunk_imghashes.call_count == 0
+
+
+def test_phash_file_container_with_timestamps(big_buck_bunny_trailer, tmp_path):
+    p_container = export_imghash_from_media(
+        big_buck_bunny_trailer,
+        output_dir=tmp_path,
+        sampling=FrameSampling(keyframes=True),
+        container=True,
+    )
+    assert p_container.name == f"{big_buck_bunny_trailer.name}.keyframes.vhc"
+
+    with PhashFile(p_container) as phash_file:
+        assert phash_file.header.sampling == "keyframes"
+        assert phash_file.header.has_pts
+        assert phash_file.fps is None
+        assert len(phash_file) == 14
+        assert phash_file.timestamps[:3].tolist() == [0, 7, 9.08]
+        assert phash_file.frame_index(8) == 1
+        assert phash_file.between(7, 9.5).shape == (1, 8)
@@ -0,0 +1,76 @@
+import os
+import shutil
+
+from imageio_ffmpeg import count_frames_and_secs
+
+import vhcalc.services.probe as probe
+from vhcalc.services.probe import probe_media_metadata
+
+
+def test_probe_media_metadata_without_decoding(big_buck_bunny_trailer):
+    metadata = probe_media_metadata(big_buck_bunny_trailer)
+    assert metadata.fps == 25
+    assert metadata.nb_frames == count_frames_and_secs(str(big_buck_bunny_trailer))[0]
+
+
+def test_probe_media_metadata_cache(big_buck_bunny_trailer, tmp_path, mocker):
+    p_video = tmp_path / big_buck_bunny_trailer.name
+    shutil.copy(big_buck_bunny_trailer, p_video)
+    spy_probe = mocker.spy(probe, "_probe_with_mediainfo")
+
+    metadata = probe_media_metadata(p_video)
+    assert probe_media_metadata(p_video) == metadata
+    assert spy_probe.call_count == 1
+
+    # cached metadata are keyed by size and modification time
+    os.utime(p_video, ns=(0, 0))
+    assert probe_media_metadata(p_video) == metadata
+    assert spy_probe.call_count == 2
+
+
+def test_probe_media_metadata_cached_on_disk(
+    big_buck_bunny_trailer, tmp_path, mocker, monkeypatch
+):
+    monkeypatch.setenv("VHCALC_CACHE_DIR", str(tmp_path / "cache"))
+    p_video = tmp_path / big_buck_bunny_trailer.name
+    shutil.copy(big_buck_bunny_trailer, p_video)
+    spy_probe = mocker.spy(probe, "_probe_with_mediainfo")
+
+    metadata = probe_media_metadata(p_video)
+    assert len(list((tmp_path / "cache" / "probe").glob("*.json"))) == 1
+    # a new run (without the in-memory cache) reads the metadata cached on disk
+    probe._probe_media_metadata.cache_clear()
+    assert probe_media_metadata(p_video) == metadata
+    assert spy_probe.call_count == 1
+
+    # the exact number of frames is cached apart
+    probe._probe_media_metadata.cache_clear()
+    assert probe_media_metadata(p_video, exact_nb_frames=True).nb_frames == 812
+    assert len(list((tmp_path / "cache" / "probe").glob("*.json"))) == 2
+
+
+def test_probe_media_metadata_read_only_cache(
+    big_buck_bunny_trailer, tmp_path, monkeypatch
+):
+    # the cache directory can't be created: the metadata are probed anyway
+    p_not_a_dir = tmp_path / "not_a_dir"
+    p_not_a_dir.touch()
+    monkeypatch.setenv("VHCALC_CACHE_DIR", str(p_not_a_dir))
+    p_video = tmp_path / big_buck_bunny_trailer.name
+    shutil.copy(big_buck_bunny_trailer, p_video)
+    assert probe_media_metadata(p_video).nb_frames == 812
+
+
+def test_probe_media_metadata_fallback_on_ffmpeg_header(
+    big_buck_bunny_trailer, tmp_path, mocker
+):
+    p_video = tmp_path / big_buck_bunny_trailer.name
+    shutil.copy(big_buck_bunny_trailer, p_video)
+    mocker.patch.object(probe, "_probe_with_mediainfo", return_value=None)
+    mocker.patch.object(probe, "_probe_with_ffprobe", return_value=None)
+
+    metadata = probe_media_metadata(p_video)
+    assert metadata.fps == 25
+    # estimated from fps and duration
+    assert abs(metadata.nb_frames - 812) <= metadata.fps
+    assert probe_media_metadata(p_video, exact_nb_frames=True).nb_frames == 812
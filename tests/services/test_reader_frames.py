@@ -1,10 +1,27 @@
+import io
+import os
+import subprocess  # nosec
+from pathlib import Path
+
 # https://docs.python.org/3/library/typing.html#callable
 from typing import Callable
 
+import numpy as np
 import pytest
+from imageio_ffmpeg import get_ffmpeg_exe
 
-from vhcalc.models import URL, MetaData
-from vhcalc.services.reader_frames import build_reader_frames
+from vhcalc.models import DECODE_PROFILES, URL, DecodeProfile, MediaSegment, MetaData
+from vhcalc.services.reader_frames import (
+    build_reader_frame_blocks,
+    build_reader_frames,
+    file_backed_path,
+)
+from vhcalc.tools.imghash import (
+    hamming_distances,
+    imghashes_to_uint64,
+    rawframes_to_imghashes,
+)
+from vhcalc.tools.metrics import PipelineMetrics
 
 
 @pytest.mark.parametrize(
@@ -46,9 +63,58 @@ def test_build_reader_frames_with_binary_stream_input(
     gen_reader_frame, metadata_video = build_reader_frames(p_video.open("rb"))
     # consume reader frames
     nb_frames_read = len(list(gen_reader_frame))
-    nb_frames_expected = metadata_video.nb_frames
-    # FIXME: need to be more accurate
-    assert abs(nb_frames_read - nb_frames_expected) <= int(metadata_video.fps)
+    # a file-backed stream is read (and probed) as a path
+    assert nb_frames_read == metadata_video.nb_frames
+
+
+def test_file_backed_path(big_buck_bunny_trailer, tmp_path):
+    with big_buck_bunny_trailer.open("rb") as fo:
+        assert file_backed_path(fo) == big_buck_bunny_trailer.resolve()
+        # a stream without the name of its file (e.g. stdin)
+        with os.fdopen(os.dup(fo.fileno()), "rb") as fd_stream:
+            p_fd = file_backed_path(fd_stream)
+            assert p_fd == Path(f"/proc/{os.getpid()}/fd/{fd_stream.fileno()}")
+            assert p_fd.read_bytes() == big_buck_bunny_trailer.read_bytes()
+        # the media doesn't start at the beginning of the file
+        fo.read(1)
+        assert file_backed_path(fo) is None
+
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(read_fd, "rb") as pipe, os.fdopen(write_fd, "wb"):
+        assert file_backed_path(pipe) is None
+    assert file_backed_path(io.BufferedReader(io.BytesIO(b"in memory"))) is None
+
+
+def test_build_reader_frame_blocks_with_file_backed_stream(
+    big_buck_bunny_trailer, tmp_path
+):
+    # MP4 with its moov atom at its end: can't be demuxed from a pipe
+    p_mp4 = tmp_path / "moov_at_end.mp4"
+    subprocess.run(  # nosec
+        [
+            get_ffmpeg_exe(),
+            *("-v", "error", "-t", "4"),
+            *("-i", str(big_buck_bunny_trailer)),
+            *("-an", "-c:v", "mpeg4", str(p_mp4)),
+        ],
+        check=True,
+    )
+    segment = MediaSegment(start_frame=50, nb_frames=25, seek_time=2.0)
+    reader, _ = build_reader_frame_blocks(
+        p_mp4, nb_frames_per_block=25, segment=segment
+    )
+    expected_frames = np.concatenate(list(reader))
+
+    metrics = PipelineMetrics(str(p_mp4))
+    with p_mp4.open("rb") as fo:
+        # ffmpeg reads the file itself (no pump), and seeks to the segment
+        reader, metadata = build_reader_frame_blocks(
+            fo, nb_frames_per_block=25, segment=segment, metrics=metrics
+        )
+        frames = np.concatenate(list(reader))
+    assert metadata.nb_frames == 100
+    assert (frames == expected_frames).all()
+    assert "pump" not in metrics.stages
 
 
 def test_build_reader_frames_from_url(ftp_server_up):
@@ -65,3 +131,54 @@ def test_build_reader_frames_from_url(ftp_server_up):
     assert nb_frames_expected > 0
     # FIXME: need to be more accurate
     assert abs(nb_frames_read - nb_frames_expected) <= int(metadata.fps)
+
+
+@pytest.mark.parametrize("nb_frames_per_block", [1, 7, 25])
+@pytest.mark.parametrize("open_media", [lambda p: p, lambda p: p.open("rb")])
+def test_build_reader_frame_blocks(
+    nb_frames_per_block: int, open_media, big_buck_bunny_trailer
+):
+    p_video = big_buck_bunny_trailer
+    gen_reader_frame, _ = build_reader_frames(open_media(p_video))
+    gen_reader_frame_blocks, _ = build_reader_frame_blocks(
+        open_media(p_video), nb_frames_per_block=nb_frames_per_block
+    )
+    # blocks are views into a ring buffer => consume (copy) them on the fly
+    frames_from_blocks = [block.tobytes() for block in gen_reader_frame_blocks]
+    assert all(
+        len(block) == nb_frames_per_block * 32 * 32 for block in frames_from_blocks[:-1]
+    )
+    assert b"".join(frames_from_blocks) == b"".join(gen_reader_frame)
+
+
+def test_build_reader_frame_blocks_without_block_size(big_buck_bunny_trailer):
+    with pytest.raises(ValueError, match="block size"):
+        build_reader_frame_blocks(big_buck_bunny_trailer)
+
+
+@pytest.mark.parametrize(
+    "decode_profile,max_mean_distance",
+    [
+        (DecodeProfile(threads=1, drop_other_streams=True), 0),
+        (DECODE_PROFILES["fast"], 2),
+        (DECODE_PROFILES["fastest"], 4),
+    ],
+)
+def test_build_reader_frame_blocks_with_decode_profile(
+    decode_profile: DecodeProfile, max_mean_distance: float, big_buck_bunny_trailer
+):
+    def _imghashes(**kwargs):
+        reader, _ = build_reader_frame_blocks(
+            big_buck_bunny_trailer, nb_frames_per_block=375, **kwargs
+        )
+        return np.concatenate(
+            [imghashes_to_uint64(rawframes_to_imghashes(frames)) for frames in reader]
+        )
+
+    imghashes = _imghashes()
+    imghashes_with_profile = _imghashes(decode_profile=decode_profile)
+
+    assert len(imghashes_with_profile) == len(imghashes)
+    assert (
+        hamming_distances(imghashes_with_profile, imghashes).mean() <= max_mean_distance
+    )
@@ -0,0 +1,34 @@
+import pytest
+
+from vhcalc.services.imghashes import export_imghash_from_media
+
+
+@pytest.fixture(scope="module")
+def full_export(big_buck_bunny_trailer, tmp_path_factory) -> bytes:
+    return export_imghash_from_media(
+        big_buck_bunny_trailer, tmp_path_factory.mktemp("phash") / "full.phash"
+    ).read_bytes()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.parametrize("nb_bytes_exported", [0, 8 * 100 + 5, 8 * 500, 8 * 812])
+def test_export_imghash_from_media_resume(
+    jobs: int, nb_bytes_exported: int, full_export, big_buck_bunny_trailer, tmp_path
+):
+    p_export = tmp_path / "partial.phash"
+    p_export.write_bytes(full_export[:nb_bytes_exported])
+
+    export_imghash_from_media(big_buck_bunny_trailer, p_export, jobs=jobs, resume=True)
+
+    assert p_export.read_bytes() == full_export
+
+
+def test_export_imghash_from_media_resume_mismatch(
+    full_export, big_buck_bunny_trailer, tmp_path
+):
+    p_export = tmp_path / "partial.phash"
+    p_export.write_bytes(b"\x00" * 8 * 200)
+
+    export_imghash_from_media(big_buck_bunny_trailer, p_export, resume=True)
+
+    assert p_export.read_bytes() == full_export
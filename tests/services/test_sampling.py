@@ -0,0 +1,137 @@
+import subprocess  # nosec
+
+import numpy as np
+import pytest
+from imageio_ffmpeg import get_ffmpeg_exe
+
+from vhcalc.models import URL, FrameSampling
+from vhcalc.services import sampling as sampling_service
+from vhcalc.services.imghashes import (
+    b2b_stream_to_imghash,
+    b2b_stream_to_timestamped_imghash,
+    export_imghash_from_media,
+    timestamps_file,
+)
+
+
+@pytest.fixture(scope="module")
+def big_buck_bunny_trailer_imghashes(big_buck_bunny_trailer, tmp_path_factory):
+    p_export = export_imghash_from_media(
+        big_buck_bunny_trailer, output_dir=tmp_path_factory.mktemp("export")
+    )
+    return np.frombuffer(p_export.read_bytes(), dtype=">u8")
+
+
+def _read_export(p_export):
+    imghashes = np.frombuffer(p_export.read_bytes(), dtype=">u8")
+    timestamps = np.frombuffer(timestamps_file(p_export).read_bytes(), dtype="<f8")
+    assert len(imghashes) == len(timestamps)
+    return imghashes, timestamps
+
+
+def test_frame_sampling_modes_are_exclusive():
+    with pytest.raises(ValueError):
+        FrameSampling()
+    with pytest.raises(ValueError):
+        FrameSampling(fps=5, scene_threshold=0.3)
+
+
+def test_export_imghash_sampled_at_fps(big_buck_bunny_trailer, tmp_path):
+    p_export = export_imghash_from_media(
+        big_buck_bunny_trailer, output_dir=tmp_path, sampling=FrameSampling(fps=5)
+    )
+    assert p_export.name == f"{big_buck_bunny_trailer.name}.5.0fps.phash"
+
+    imghashes, timestamps = _read_export(p_export)
+    assert len(imghashes) == 162
+    np.testing.assert_allclose(timestamps, np.arange(162) / 5)
+
+
+@pytest.mark.parametrize(
+    "sampling, nb_frames_expected",
+    [(FrameSampling(keyframes=True), 14), (FrameSampling(scene_threshold=0.3), 16)],
+)
+def test_export_imghash_sampled_frames_are_media_frames(
+    big_buck_bunny_trailer,
+    big_buck_bunny_trailer_imghashes,
+    tmp_path,
+    sampling,
+    nb_frames_expected,
+):
+    p_export = export_imghash_from_media(
+        big_buck_bunny_trailer, output_dir=tmp_path, sampling=sampling
+    )
+
+    imghashes, timestamps = _read_export(p_export)
+    assert len(imghashes) == nb_frames_expected
+    assert timestamps[0] == 0
+    assert np.all(np.diff(timestamps) > 0)
+    # each sampled image hash is the one of the (not sampled) frame at its timestamp
+    frames_indices = np.round(timestamps * 25).astype(int)
+    np.testing.assert_array_equal(
+        imghashes, big_buck_bunny_trailer_imghashes[frames_indices]
+    )
+
+
+def test_export_imghash_scene_changes_timestamps_of_vfr_media(
+    big_buck_bunny_trailer, big_buck_bunny_trailer_imghashes, tmp_path
+):
+    # variable frame rate media: the frames 50 to 99 (2s to 4s) are cut (lossless)
+    p_vfr = tmp_path / "vfr.mkv"
+    subprocess.run(  # nosec
+        [
+            get_ffmpeg_exe(),
+            *("-v", "error", "-t", "6"),
+            *("-i", str(big_buck_bunny_trailer)),
+            *("-an", "-vf", "select='not(between(n,50,99))'", "-vsync", "vfr"),
+            *("-c:v", "ffv1", str(p_vfr)),
+        ],
+        check=True,
+    )
+    p_export = export_imghash_from_media(
+        p_vfr, output_dir=tmp_path, sampling=FrameSampling(scene_threshold=0.3)
+    )
+
+    imghashes, timestamps = _read_export(p_export)
+    # the cut is a scene change, at the presentation timestamp of its frame
+    assert timestamps.tolist() == [0.0, 4.0]
+    np.testing.assert_array_equal(imghashes, big_buck_bunny_trailer_imghashes[[0, 100]])
+
+
+def test_b2b_stream_to_imghash_sampled(big_buck_bunny_trailer):
+    sampling = FrameSampling(scene_threshold=0.3)
+    with big_buck_bunny_trailer.open("rb") as fi:
+        timestamped_imghashes = list(b2b_stream_to_timestamped_imghash(fi, sampling))
+    with big_buck_bunny_trailer.open("rb") as fi:
+        imghashes = list(b2b_stream_to_imghash(fi, sampling=sampling))
+
+    assert [imghash for _, imghash in timestamped_imghashes] == imghashes
+    assert len(imghashes) == 16
+
+
+def test_keyframes_sampling_requires_a_seekable_media(big_buck_bunny_trailer):
+    with big_buck_bunny_trailer.open("rb") as fi:
+        with pytest.raises(ValueError):
+            next(
+                b2b_stream_to_timestamped_imghash(
+                    _NotAFile(fi), FrameSampling(keyframes=True)
+                )
+            )
+
+
+def test_keyframes_sampling_of_url_is_not_demuxed(mocker):
+    spy_probe_video_packets = mocker.spy(sampling_service, "probe_video_packets")
+    with pytest.raises(ValueError):
+        sampling_service.build_sampled_reader_frame_blocks(
+            URL("http://localhost/media.mkv"), FrameSampling(keyframes=True)
+        )
+    # the URL isn't downloaded (twice) to read its packets
+    assert spy_probe_video_packets.call_count == 0
+
+
+class _NotAFile:
+    def __init__(self, fi):
+        self.fi = fi
+
+    def read(self, size=-1):
+        return self.fi.read(size)
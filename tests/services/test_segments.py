@@ -0,0 +1,28 @@
+import pytest
+
+from vhcalc.services.imghashes import export_imghash_from_media
+from vhcalc.services.segments import split_media_into_segments
+
+
+@pytest.mark.parametrize("nb_segments", [1, 2, 5, 100])
+def test_split_media_into_segments(nb_segments: int, big_buck_bunny_trailer):
+    segments = split_media_into_segments(big_buck_bunny_trailer, nb_segments)
+    assert 1 <= len(segments) <= nb_segments
+    # segments are contiguous and cover the whole media
+    assert segments[0].start_frame == 0
+    for segment, next_segment in zip(segments, segments[1:]):
+        assert segment.start_frame + segment.nb_frames == next_segment.start_frame
+    assert sum(segment.nb_frames for segment in segments) == 812
+
+
+@pytest.mark.parametrize("jobs", [2, 4])
+def test_export_imghash_from_media_in_parallel(
+    jobs: int, big_buck_bunny_trailer, tmp_path
+):
+    p_sequential = export_imghash_from_media(
+        big_buck_bunny_trailer, tmp_path / "sequential.phash"
+    )
+    p_parallel = export_imghash_from_media(
+        big_buck_bunny_trailer, tmp_path / "parallel.phash", jobs=jobs
+    )
+    assert p_parallel.read_bytes() == p_sequential.read_bytes()
@@ -0,0 +1,77 @@
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+
+from vhcalc.services import shm_hashing
+from vhcalc.services.imghashes import (
+    b2u_stream_to_imghashes,
+    export_imghash_from_media,
+)
+from vhcalc.services.shm_hashing import shm_hash_frame_blocks
+
+
+@pytest.fixture
+def shm_names(monkeypatch):
+    """names of the shared memories created by the shared memory hashing"""
+    names = []
+
+    class RecordedSharedMemory(SharedMemory):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            names.append(self.name)
+
+    monkeypatch.setattr(shm_hashing, "SharedMemory", RecordedSharedMemory)
+    return names
+
+
+@pytest.mark.parametrize("hashing_processes", [1, 2])
+def test_export_imghash_from_media_with_hashing_processes(
+    hashing_processes: int, big_buck_bunny_trailer, tmp_path
+):
+    p_sequential = export_imghash_from_media(
+        big_buck_bunny_trailer, tmp_path / "sequential.phash"
+    )
+    p_shm = export_imghash_from_media(
+        big_buck_bunny_trailer,
+        tmp_path / "shm.phash",
+        # more blocks than slabs: the slabs are reused
+        chunk_nb_seconds=1,
+        hashing_processes=hashing_processes,
+    )
+    assert p_shm.read_bytes() == p_sequential.read_bytes()
+
+
+def test_b2u_stream_to_imghashes_with_hashing_processes(
+    big_buck_bunny_trailer, shm_names
+):
+    with big_buck_bunny_trailer.open("rb") as fo:
+        imghashes = np.concatenate(list(b2u_stream_to_imghashes(fo)))
+    with big_buck_bunny_trailer.open("rb") as fo:
+        shm_chunks_imghashes = list(
+            b2u_stream_to_imghashes(fo, chunk_size_in_frames=50, hashing_processes=2)
+        )
+    assert [len(chunk) for chunk in shm_chunks_imghashes] == [50] * 16 + [12]
+    assert (np.concatenate(shm_chunks_imghashes) == imghashes).all()
+    assert len(shm_names) == 1
+
+
+def test_shm_hash_frame_blocks_released_on_close(big_buck_bunny_trailer, shm_names):
+    gen_chunk_imghashes = shm_hash_frame_blocks(big_buck_bunny_trailer, 25, processes=2)
+    assert len(next(gen_chunk_imghashes)) == 25
+    gen_chunk_imghashes.close()
+
+    assert len(shm_names) == 1
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=shm_names[0])
+
+
+def test_shm_hash_frame_blocks_released_on_error(tmp_path, shm_names):
+    p_not_a_media = tmp_path / "not_a_media.mkv"
+    p_not_a_media.write_bytes(b"\x00" * 1024)
+    with pytest.raises(OSError):
+        list(shm_hash_frame_blocks(p_not_a_media, 25, processes=2))
+
+    assert len(shm_names) == 1
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=shm_names[0])
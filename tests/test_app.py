@@ -7,7 +7,15 @@ from tempfile import gettempdir
 
 from flatten_dict import flatten
 
-from vhcalc.app import cli, export_imghash_from_media, mediainfo
+from vhcalc.app import (
+    cli,
+    export_imghash_from_media,
+    index,
+    match,
+    mediainfo,
+    query,
+)
+from vhcalc.services import a2b_imghash
 from vhcalc.services.imghashes import (
     export_imghash_from_media as svc_export_imghash_from_media,
 )
@@ -69,6 +77,140 @@ def test_cli_export_imghash(big_buck_bunny_trailer, cli_runner, tmpdir):
     )
 
 
+def test_cli_export_imghash_with_jobs(big_buck_bunny_trailer, cli_runner, tmpdir):
+    p_video = big_buck_bunny_trailer
+    resource_video_name = p_video.stem
+
+    binary_img_hash_file = Path(tmpdir.mkdir("phash") / f"{resource_video_name}.phash")
+
+    result = cli_runner.invoke(
+        export_imghash_from_media,
+        args=f"-r {stringify_path(p_video)} -o {stringify_path(binary_img_hash_file)} --jobs 3",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+
+    assert_export_imghash_from_media_outputs(
+        p_video, binary_img_hash_file, result.output
+    )
+
+
+def test_cli_export_imghash_with_hashing_processes(
+    big_buck_bunny_trailer, cli_runner, tmpdir
+):
+    p_video = big_buck_bunny_trailer
+    resource_video_name = p_video.stem
+
+    binary_img_hash_file = Path(tmpdir.mkdir("phash") / f"{resource_video_name}.phash")
+
+    result = cli_runner.invoke(
+        export_imghash_from_media,
+        args=f"-r {stringify_path(p_video)} -o {stringify_path(binary_img_hash_file)} --hashing-processes 2",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+
+    assert_export_imghash_from_media_outputs(
+        p_video, binary_img_hash_file, result.output
+    )
+
+
+def test_cli_export_imghash_many_medias(big_buck_bunny_trailer, cli_runner, tmpdir):
+    medias_dir = Path(tmpdir.mkdir("medias"))
+    for media_name in ("a.mkv", "b.mkv"):
+        (medias_dir / media_name).write_bytes(big_buck_bunny_trailer.read_bytes())
+    output_dir = Path(tmpdir) / "phash"
+
+    result = cli_runner.invoke(
+        export_imghash_from_media,
+        args=f"-r {stringify_path(medias_dir)}/*.mkv --output-dir {stringify_path(output_dir)} --max-decoders 2",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    assert sorted(p.name for p in output_dir.iterdir()) == [
+        "a.mkv.25.0fps.phash",
+        "b.mkv.25.0fps.phash",
+    ]
+
+    result = cli_runner.invoke(
+        export_imghash_from_media,
+        args=f"-r {stringify_path(medias_dir)}/*.mkv -o {stringify_path(output_dir)}/out.phash",
+    )
+    assert result.exit_code != 0
+
+    # medias with the same name in distinct directories
+    for media_dir in ("x", "y"):
+        (medias_dir / media_dir).mkdir()
+        (medias_dir / media_dir / "a.mkv").write_bytes(
+            big_buck_bunny_trailer.read_bytes()
+        )
+    result = cli_runner.invoke(
+        export_imghash_from_media,
+        args=f"-r {stringify_path(medias_dir)}/*/a.mkv --output-dir {stringify_path(output_dir)}",
+    )
+    assert result.exit_code == 2
+    assert "same file name" in result.output
+
+
+def test_cli_index_and_query(big_buck_bunny_trailer, cli_runner, tmpdir):
+    output_dir = Path(tmpdir.mkdir("phash"))
+    p_export = svc_export_imghash_from_media(
+        big_buck_bunny_trailer, output_dir=output_dir
+    )
+    index_dir = Path(tmpdir) / "index"
+
+    result = cli_runner.invoke(
+        index,
+        args=f"{stringify_path(index_dir)} -r {stringify_path(output_dir)}/*.phash",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    assert result.output == "big_buck_bunny_trailer_480p.mkv: 812 frames indexed\n"
+
+    p_clip = Path(tmpdir) / "clip.phash"
+    p_clip.write_bytes(p_export.read_bytes()[500 * 8 : 550 * 8])
+    result = cli_runner.invoke(
+        query,
+        args=f"{stringify_path(index_dir)} {stringify_path(p_clip)} --top 1",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    assert json.loads(result.output) == {
+        "media": "big_buck_bunny_trailer_480p.mkv",
+        "offset": 500,
+        "timestamp": 20.0,
+        "nb_matching_frames": 50,
+        "mean_distance": 0.0,
+    }
+
+
+def test_cli_match(big_buck_bunny_trailer, cli_runner, tmpdir):
+    p_export = svc_export_imghash_from_media(
+        big_buck_bunny_trailer, output_dir=Path(tmpdir)
+    )
+    p_clip = Path(tmpdir) / "clip.phash"
+    p_clip.write_bytes(p_export.read_bytes()[100 * 8 : 150 * 8])
+
+    result = cli_runner.invoke(
+        match,
+        args=f"{stringify_path(p_clip)} {stringify_path(p_export)} --distance-profile",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    assert json.loads(result.output) == {
+        "offset": 100,
+        "timestamp": 4.0,
+        "mean_distance": 0.0,
+        "distances": [0] * 50,
+        "segments": [{"clip_start": 0, "media_start": 100, "nb_frames": 50}],
+    }
+
+    result = cli_runner.invoke(
+        match, args=f"{stringify_path(p_export)} {stringify_path(p_clip)}"
+    )
+    assert result.exit_code != 0
+
+
 def test_cli_export_imghash_without_export_file(big_buck_bunny_trailer, cli_runner):
     p_video = big_buck_bunny_trailer
 
@@ -120,12 +262,194 @@ def test_cli_imghash(big_buck_bunny_trailer, cli_runner, tmpdir):
     expected_size_binary_file = metadata.nb_frames * 8
     assert Path(binary_img_hash_file).stat().st_size == expected_size_binary_file
 
+    hex_img_hash_file = binary_img_hash_file.with_suffix(".txt")
+    result = cli_runner.invoke(
+        cli,
+        args=f"--decompress {stringify_path(binary_img_hash_file)} {stringify_path(hex_img_hash_file)}",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    with binary_img_hash_file.open("rb") as fo:
+        assert hex_img_hash_file.read_text() == "".join(map(str, a2b_imghash(fo)))
+
     result = cli_runner.invoke(
         cli,
-        args=f"--decompress {stringify_path(binary_img_hash_file)}",
+        args=f"--decompress --decompress-format ndjson --fps 25 {stringify_path(binary_img_hash_file)} {stringify_path(hex_img_hash_file)}",
         catch_exceptions=False,
     )
     assert result.exit_code == 0
+    ndjson_lines = hex_img_hash_file.read_text().splitlines()
+    assert len(ndjson_lines) == metadata.nb_frames
+    assert json.loads(ndjson_lines[-1]) == {
+        "frame": 811,
+        "timestamp": 811 / 25,
+        "imghash": str(list(a2b_imghash(binary_img_hash_file.open("rb")))[-1]),
+    }
+
+
+def test_cli_imghash_with_sampling(big_buck_bunny_trailer, cli_runner, tmpdir):
+    p_phash = Path(tmpdir / "keyframes.phash")
+    p_pts = Path(tmpdir / "keyframes.pts")
+
+    result = cli_runner.invoke(
+        cli,
+        args=f"--keyframes --timestamps-output {stringify_path(p_pts)} {stringify_path(big_buck_bunny_trailer)} {stringify_path(p_phash)}",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    assert p_phash.stat().st_size == 14 * 8
+    assert p_pts.stat().st_size == 14 * 8
+
+    result = cli_runner.invoke(
+        cli,
+        args=f"--keyframes --sampling-fps 5 {stringify_path(big_buck_bunny_trailer)} {stringify_path(p_phash)}",
+    )
+    assert result.exit_code == 2
+
+    # the packets timestamps of an URL would be read by downloading it twice
+    for sampling_option in ("--keyframes", "--scene-threshold 0.3"):
+        result = cli_runner.invoke(
+            cli,
+            args=f"{sampling_option} --from-url http://localhost/media.mkv - {stringify_path(p_phash)}",
+        )
+        assert result.exit_code == 2
+        assert "'--from-url' can't be used" in result.output
+
+    result = cli_runner.invoke(
+        cli,
+        args=f"--keyframes --cache {stringify_path(big_buck_bunny_trailer)} {stringify_path(p_phash)}",
+    )
+    assert result.exit_code == 2
+    assert "'--cache' can't be used" in result.output
+
+
+def test_cli_imghash_with_many_methods(big_buck_bunny_trailer, cli_runner, tmpdir):
+    methods = ("PerceptualHashing", "DifferenceHashing", "WaveletHashing")
+    p_multi = Path(tmpdir / "multi.hashes")
+
+    result = cli_runner.invoke(
+        cli,
+        args=" ".join(
+            [f"--image-hashing-method {method}" for method in methods]
+            + [stringify_path(big_buck_bunny_trailer), stringify_path(p_multi)]
+        ),
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+
+    # same images hashes as one decoding per method, frame by frame
+    bin_multi_imghashes = p_multi.read_bytes()
+    assert len(bin_multi_imghashes) == 812 * len(methods) * 8
+    for column, method in enumerate(methods):
+        p_method = Path(tmpdir / f"{method}.hashes")
+        result = cli_runner.invoke(
+            cli,
+            args=f"--image-hashing-method {method} {stringify_path(big_buck_bunny_trailer)} {stringify_path(p_method)}",
+            catch_exceptions=False,
+        )
+        assert result.exit_code == 0
+        assert p_method.read_bytes() == b"".join(
+            bin_multi_imghashes[offset : offset + 8]
+            for offset in range(column * 8, len(bin_multi_imghashes), len(methods) * 8)
+        )
+
+    # decompressed with a column per method (and the timestamps of the frames)
+    result = cli_runner.invoke(
+        cli,
+        args=" ".join(
+            [f"--image-hashing-method {method}" for method in methods]
+            + ["--decompress --decompress-format csv --fps 25"]
+            + [stringify_path(p_multi), "-"]
+        ),
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    csv_lines = result.output.splitlines()
+    assert csv_lines[0] == f"frame,timestamp,{','.join(methods)}"
+    assert len(csv_lines) == 1 + 812
+    assert csv_lines[-1].split(",")[:2] == ["811", "32.440000"]
+    assert csv_lines[1].split(",")[2:] == [
+        bin_multi_imghashes[offset : offset + 8].hex()
+        for offset in range(0, len(methods) * 8, 8)
+    ]
+
+    result = cli_runner.invoke(
+        cli,
+        args=f"--image-hashing-method PerceptualHashing --image-hashing-method DifferenceHashing --cache {stringify_path(big_buck_bunny_trailer)} {stringify_path(p_multi)}",
+    )
+    assert result.exit_code == 2
+
+
+def test_cli_imghash_from_http_url(
+    big_buck_bunny_trailer, cli_runner, http_server, tmpdir
+):
+    p_phash = Path(tmpdir / "file.phash")
+    p_phash_from_url = Path(tmpdir / "url.phash")
+
+    result = cli_runner.invoke(
+        cli,
+        args=f"{stringify_path(big_buck_bunny_trailer)} {stringify_path(p_phash)}",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    # fetched by range requests, resumed after a disconnection
+    http_server.cut_requests = {1}
+    result = cli_runner.invoke(
+        cli,
+        args=f"--from-url {http_server.url} - {stringify_path(p_phash_from_url)}",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    assert p_phash_from_url.read_bytes() == p_phash.read_bytes()
+
+
+def test_cli_export_imghash_with_sampling(big_buck_bunny_trailer, cli_runner, tmpdir):
+    result = cli_runner.invoke(
+        export_imghash_from_media,
+        args=f"-r {stringify_path(big_buck_bunny_trailer)} --output-dir {tmpdir} --scene-threshold 0.3",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    p_export = Path(tmpdir) / f"{big_buck_bunny_trailer.name}.scene.phash"
+    assert p_export.stat().st_size == 16 * 8
+    assert Path(f"{p_export}.pts").stat().st_size == 16 * 8
+
+
+def test_cli_export_imghash_with_decode_profile(
+    big_buck_bunny_trailer, cli_runner, tmpdir
+):
+    p_export = Path(tmpdir / "export.phash")
+
+    result = cli_runner.invoke(
+        export_imghash_from_media,
+        args=f"-r {stringify_path(big_buck_bunny_trailer)} -o {stringify_path(p_export)} --decode-profile fast --decoder-threads 2",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    assert p_export.stat().st_size == 812 * 8
+
+
+def test_cli_metrics_file(big_buck_bunny_trailer, cli_runner, tmpdir):
+    p_metrics = Path(tmpdir / "metrics.jsonl")
+
+    result = cli_runner.invoke(
+        cli,
+        args=f"--metrics-file {stringify_path(p_metrics)} {stringify_path(big_buck_bunny_trailer)} {stringify_path(Path(tmpdir / 'export.phash'))}",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+    result = cli_runner.invoke(
+        export_imghash_from_media,
+        args=f"-r {stringify_path(big_buck_bunny_trailer)} --output-dir {tmpdir} --metrics-file {stringify_path(p_metrics)}",
+        catch_exceptions=False,
+    )
+    assert result.exit_code == 0
+
+    metrics_lines = [json.loads(line) for line in p_metrics.read_text().splitlines()]
+    assert len(metrics_lines) == 2
+    for metrics_line in metrics_lines:
+        assert {"read", "hash", "write"} <= set(metrics_line["stages"])
+        assert metrics_line["stages"]["hash"]["count"] == 812
 
 
 def test_cli_imghash_without_export_file(big_buck_bunny_trailer, cli_runner):
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from vhcalc.models import ImageHashingFunction
+from vhcalc.services.reader_frames import build_reader_frames
+from vhcalc.tools.imghash import (
+    FRAME_SIZE,
+    imghash_to_bytes,
+    rawframe_to_imghash,
+    rawframes_to_imghashes,
+)
+
+
+@pytest.fixture(scope="module")
+def raw_frames(big_buck_bunny_trailer) -> np.ndarray:
+    it_reader_frame, _ = build_reader_frames(
+        big_buck_bunny_trailer, nb_seconds_to_extract=5
+    )
+    frames_from_media = np.frombuffer(
+        b"".join(it_reader_frame), dtype=np.uint8
+    ).reshape(-1, FRAME_SIZE, FRAME_SIZE)
+    random_frames = np.random.default_rng(0).integers(
+        0, 256, (64, FRAME_SIZE, FRAME_SIZE), dtype=np.uint8
+    )
+    # flat frames: all the (high) frequencies are close to the median
+    flat_frames = np.stack(
+        [np.full((FRAME_SIZE, FRAME_SIZE), value, dtype=np.uint8) for value in (0, 128)]
+    )
+    return np.concatenate([frames_from_media, random_frames, flat_frames])
+
+
+@pytest.mark.parametrize("fn_imagehash", list(ImageHashingFunction))
+def test_rawframes_to_imghashes_is_bit_identical(
+    raw_frames: np.ndarray, fn_imagehash: ImageHashingFunction
+):
+    expected = b"".join(
+        imghash_to_bytes(rawframe_to_imghash(raw_frame, fn_imagehash=fn_imagehash))
+        for raw_frame in raw_frames
+    )
+    imghashes = rawframes_to_imghashes(raw_frames, fn_imagehash=fn_imagehash)
+    assert imghashes.shape == (len(raw_frames), 8)
+    assert imghashes.tobytes() == expected
@@ -0,0 +1,50 @@
+import json
+
+from vhcalc.tools.benchmark import generate_testsrc_video, main
+
+
+def test_benchmark(tmp_path):
+    p_results = tmp_path / "benchmark.json"
+
+    main(
+        [
+            "--duration",
+            "1",
+            "--size",
+            "64x48",
+            "--repeat",
+            "1",
+            "--output",
+            str(p_results),
+        ]
+    )
+    results = json.loads(p_results.read_text())
+    stages = {stage["name"]: stage for stage in results["stages"]}
+    assert list(stages) == [
+        "decode",
+        "read[default]",
+        "read[fast]",
+        "read[fastest]",
+        "rawframe_to_imghash[PerceptualHashing]",
+        "rawframes_to_imghashes[PerceptualHashing]",
+        "imghash_to_bytes",
+        "write",
+    ]
+    assert all(stage["nb_frames"] == 25 for stage in stages.values())
+    assert all(stage["fps"] > 0 for stage in stages.values())
+    # peak of the whole run (not measurable per stage)
+    assert results["peak_rss_kib"] > 0
+    assert results["peak_children_rss_kib"] > 0
+
+    # a second run compared with the first one
+    main(
+        [
+            *(
+                "--media",
+                str(generate_testsrc_video(tmp_path / "testsrc.mkv", 1, "64x48")),
+            ),
+            *("--repeat", "1", "--output", str(tmp_path / "benchmark2.json")),
+            *("--compare", str(p_results)),
+        ]
+    )
+    assert len(json.loads((tmp_path / "benchmark2.json").read_text())["stages"]) == 8
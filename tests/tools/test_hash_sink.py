@@ -0,0 +1,28 @@
+import os
+
+import numpy as np
+import pytest
+
+from vhcalc.tools.hash_sink import HashSink
+
+
+@pytest.mark.parametrize("fsync_on_checkpoint", [False, True])
+def test_hash_sink_checkpoint(fsync_on_checkpoint: bool, tmp_path, mocker):
+    spy_fsync = mocker.spy(os, "fsync")
+    p_export = tmp_path / "export.phash"
+    p_export.write_bytes(b"\x01" * 8)
+
+    with HashSink(p_export, fsync_on_checkpoint=fsync_on_checkpoint) as sink:
+        sink.write(np.empty((0, 8), dtype=np.uint8))
+        # non contiguous chunk of images hashes
+        sink.write(np.arange(32, dtype=np.uint8).reshape(4, 8)[::2])
+        sink.checkpoint()
+
+    assert p_export.read_bytes() == b"\x01" * 8 + bytes(range(8)) + bytes(range(16, 24))
+    # on checkpoint and close
+    assert spy_fsync.call_count == (2 if fsync_on_checkpoint else 0)
+
+
+def test_hash_sink_not_opened(tmp_path):
+    with pytest.raises(ValueError):
+        HashSink(tmp_path / "export.phash").write(b"\x00" * 8)
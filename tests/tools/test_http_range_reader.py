@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from vhcalc.services.imghashes import b2u_stream_to_imghashes
+from vhcalc.tools.http_range_reader import HTTPRangeReader, open_url
+from vhcalc.tools.metrics import PipelineMetrics
+
+
+def test_http_range_reader(http_server):
+    metrics = PipelineMetrics(http_server.url)
+    with open_url(
+        http_server.url, range_size=64 * 1024, read_ahead=256 * 1024, metrics=metrics
+    ) as stream:
+        assert stream.read() == http_server.content
+        assert stream.raw.size == len(http_server.content)
+        assert stream.raw.nb_retries == 0
+    # ranges requested on a single (keep-alive) connection
+    assert http_server.nb_requests == -(-len(http_server.content) // (64 * 1024))
+    assert http_server.nb_connections == 1
+    assert metrics.stages["fetch"].count == len(http_server.content)
+
+
+def test_http_range_reader_resumes_after_disconnections(http_server):
+    http_server.cut_requests = {2, 5}
+    with HTTPRangeReader(
+        http_server.url, range_size=64 * 1024, retry_delay=0
+    ) as reader:
+        assert reader.readall() == http_server.content
+        # the cut ranges are resumed (from their first byte not received)
+        assert reader.nb_retries == 2
+
+
+def test_http_range_reader_without_range_requests(http_server):
+    http_server.accept_ranges = False
+    http_server.cut_requests = {1}
+    with HTTPRangeReader(
+        http_server.url, range_size=64 * 1024, retry_delay=0
+    ) as reader:
+        assert reader.readall() == http_server.content
+        assert reader.nb_retries == 1
+    # the bytes received before the disconnection are skipped on the retry
+    assert http_server.nb_requests == 2
+
+
+def test_http_range_reader_errors(http_server):
+    with open_url(http_server.url.replace("media", "missing")) as stream:
+        with pytest.raises(RuntimeError, match="404"):
+            stream.read()
+    with pytest.raises(ValueError):
+        HTTPRangeReader("ftp://127.0.0.1/media.mkv")
+
+
+def test_b2u_stream_to_imghashes_from_http_range_reader(
+    http_server, big_buck_bunny_trailer
+):
+    with big_buck_bunny_trailer.open("rb") as fo:
+        imghashes = np.concatenate(list(b2u_stream_to_imghashes(fo)))
+    with open_url(http_server.url, range_size=256 * 1024) as stream:
+        assert (
+            np.concatenate(list(b2u_stream_to_imghashes(stream))) == imghashes
+        ).all()
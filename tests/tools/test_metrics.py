@@ -0,0 +1,34 @@
+import json
+
+from vhcalc.services.imghashes import export_imghash_from_media
+from vhcalc.tools.metrics import STALL_SECONDS, PipelineMetrics
+
+
+def test_pipeline_metrics_stalls():
+    metrics = PipelineMetrics("media.mkv")
+    metrics.record("read", STALL_SECONDS / 2, count=375)
+    metrics.record("read", STALL_SECONDS * 2, count=375)
+
+    assert metrics.stages["read"].count == 750
+    assert metrics.stages["read"].stalls == 1
+    assert metrics.stages["read"].max_seconds == STALL_SECONDS * 2
+
+
+def test_export_imghash_metrics(big_buck_bunny_trailer, tmp_path):
+    p_metrics = tmp_path / "metrics.jsonl"
+    for _ in range(2):
+        metrics = PipelineMetrics(str(big_buck_bunny_trailer))
+        export_imghash_from_media(
+            big_buck_bunny_trailer, output_dir=tmp_path, metrics=metrics
+        )
+        metrics.write(p_metrics)
+
+    lines = p_metrics.read_text().splitlines()
+    assert len(lines) == 2
+    metrics_dict = json.loads(lines[0])
+    assert metrics_dict["media"] == str(big_buck_bunny_trailer)
+    stages = metrics_dict["stages"]
+    assert {"probe", "read", "hash", "write"} <= set(stages)
+    assert stages["read"]["count"] == stages["hash"]["count"] == 812
+    assert stages["write"]["count"] == 812
+    assert metrics_dict["children_cpu_seconds"] > 0
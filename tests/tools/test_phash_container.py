@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from vhcalc.models import PhashHeader
+from vhcalc.services.phash_file import PhashFile
+from vhcalc.tools.phash_container import (
+    HEADER_SIZE,
+    VERSION,
+    PhashContainerSink,
+    pack_header,
+    unpack_header,
+)
+
+
+@pytest.fixture
+def header():
+    return PhashHeader(
+        method="PerceptualHashing",
+        frame_size=32,
+        duration=60.0,
+        sampling="scene=0.3",
+        source_fingerprint="ab" * 32,
+        has_pts=True,
+    )
+
+
+@pytest.mark.parametrize("seek_index_interval", [1, 7, 256])
+def test_phash_container_frame_index(header, tmp_path, seek_index_interval: int):
+    rng = np.random.default_rng(0)
+    imghashes = rng.integers(0, 256, size=(1000, 8), dtype=np.uint8)
+    timestamps = np.cumsum(rng.uniform(0.01, 0.5, size=1000))
+    p_container = tmp_path / "export.vhc"
+
+    with PhashContainerSink(
+        p_container, header, seek_index_interval=seek_index_interval
+    ) as sink:
+        for chunk in range(0, 1000, 300):
+            sink.write(imghashes[chunk : chunk + 300])
+            sink.write_timestamps(timestamps[chunk : chunk + 300])
+
+    with PhashFile(p_container) as phash_file:
+        assert phash_file.header == header
+        np.testing.assert_array_equal(phash_file.imghashes, imghashes)
+        np.testing.assert_array_equal(phash_file.timestamps, timestamps)
+        for timestamp in rng.uniform(0, timestamps[-1] + 1, size=100):
+            expected_frame_index = max(
+                np.searchsorted(timestamps, timestamp, "right") - 1, 0
+            )
+            assert phash_file.frame_index(timestamp) == expected_frame_index
+
+
+def test_phash_container_interrupted(header, tmp_path):
+    p_container = tmp_path / "export.vhc"
+
+    with pytest.raises(RuntimeError):
+        with PhashContainerSink(p_container, header) as sink:
+            sink.write(np.zeros((2, 8), dtype=np.uint8))
+            raise RuntimeError("export interrupted")
+
+    with pytest.raises(ValueError, match="Incomplete"):
+        PhashFile(p_container).open()
+
+
+def test_phash_container_missing_timestamps(header, tmp_path):
+    with pytest.raises(ValueError):
+        with PhashContainerSink(tmp_path / "export.vhc", header) as sink:
+            sink.write(np.zeros((2, 8), dtype=np.uint8))
+
+
+def test_unpack_header_errors(header):
+    with pytest.raises(ValueError, match="Not an images hashes container"):
+        unpack_header(b"\x00" * HEADER_SIZE)
+    binary_header = bytearray(pack_header(header))
+    binary_header[8:10] = (VERSION + 1).to_bytes(2, "little")
+    with pytest.raises(ValueError, match="Unsupported"):
+        unpack_header(bytes(binary_header))
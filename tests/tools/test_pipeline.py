@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from vhcalc.services.imghashes import b2b_stream_to_imghash
+from vhcalc.tools.metrics import PipelineMetrics
+from vhcalc.tools.pipeline import pipelined_map
+
+
+def _slow_square(x):
+    time.sleep(random.uniform(0, 0.01))
+    return x * x
+
+
+def test_pipelined_map_preserves_order():
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(
+            pipelined_map(_slow_square, range(50), executor, max_pending=8)
+        ) == [x * x for x in range(50)]
+
+
+def test_pipelined_map_backpressure():
+    nb_items_read = 0
+
+    def _items():
+        nonlocal nb_items_read
+        for item in range(100):
+            nb_items_read += 1
+            yield item
+
+    metrics = PipelineMetrics("items")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = pipelined_map(
+            lambda x: x, _items(), executor, max_pending=3, metrics=metrics
+        )
+        assert next(results) == 0
+        # the reader thread is blocked: 3 items queued (and 1 waiting for a slot)
+        time.sleep(0.2)
+        assert nb_items_read <= 1 + 3 + 1
+        assert list(results) == list(range(1, 100))
+    assert metrics.gauges["pending_blocks"].max <= 3
+
+
+def test_pipelined_map_raises_errors():
+    def _items():
+        yield 1
+        raise ValueError("reader error")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = pipelined_map(lambda x: 1 / x, [1, 0, 2], executor)
+        assert next(results) == 1
+        with pytest.raises(ZeroDivisionError):
+            next(results)
+
+        results = pipelined_map(lambda x: x, _items(), executor)
+        assert next(results) == 1
+        with pytest.raises(ValueError, match="reader error"):
+            next(results)
+
+
+def test_pipelined_map_stops_reader_on_close():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = pipelined_map(lambda x: x, iter(range(10**9)), executor)
+        assert next(results) == 0
+        results.close()
+    assert not any(thread.name == "pipeline-reader" for thread in threading.enumerate())
+
+
+def test_b2b_stream_to_imghash_pipelined(big_buck_bunny_trailer):
+    with big_buck_bunny_trailer.open("rb") as fi:
+        imghashes = list(b2b_stream_to_imghash(fi, chunk_size_in_frames=25))
+    metrics = PipelineMetrics(str(big_buck_bunny_trailer))
+    with big_buck_bunny_trailer.open("rb") as fi:
+        pipelined_imghashes = list(
+            b2b_stream_to_imghash(
+                fi, chunk_size_in_frames=25, metrics=metrics, hashing_workers=2
+            )
+        )
+
+    assert pipelined_imghashes == imghashes
+    assert metrics.stages["hash"].count == 812
+    assert metrics.gauges["pending_blocks"].max <= 4
@@ -0,0 +1,91 @@
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from vhcalc.services.imghashes import b2u_stream_to_imghashes
+from vhcalc.tools.metrics import PipelineMetrics
+from vhcalc.tools.stdin_pump import pump_to_pipe
+
+CONTENT = bytes(range(256)) * 16 * 1024
+
+
+def pump_and_drain(stream, buffer_size=None, read_delay=0.0):
+    """pump `stream` into a pipe drained (by a thread) like ffmpeg stdin"""
+    read_fd, write_fd = os.pipe()
+    chunks = []
+
+    def drain():
+        with os.fdopen(read_fd, "rb", buffering=0) as pipe:
+            while chunk := pipe.read(256 * 1024):
+                chunks.append(chunk)
+                time.sleep(read_delay)
+
+    thread_drain = threading.Thread(target=drain)
+    thread_drain.start()
+    try:
+        stats = pump_to_pipe(stream, write_fd, buffer_size=buffer_size)
+    finally:
+        os.close(write_fd)
+        thread_drain.join()
+    return stats, b"".join(chunks)
+
+
+def test_pump_to_pipe_with_sendfile(tmp_path):
+    p_media = tmp_path / "media.bin"
+    p_media.write_bytes(CONTENT)
+    with p_media.open("rb") as fo:
+        # the bytes already read (and buffered) aren't pumped
+        assert fo.read(10) == CONTENT[:10]
+        stats, pumped = pump_and_drain(fo)
+        # the stream is consumed
+        assert fo.read() == b""
+    assert stats.method == "sendfile"
+    assert pumped == CONTENT[10:]
+    assert stats.nb_bytes == len(CONTENT) - 10
+
+
+def test_pump_to_pipe_with_splice():
+    if not hasattr(os, "splice"):
+        pytest.skip("os.splice is only available on Linux (Python >= 3.10)")
+    source_read_fd, source_write_fd = os.pipe()
+
+    def feed():
+        with os.fdopen(source_write_fd, "wb") as source:
+            source.write(CONTENT)
+
+    thread_feed = threading.Thread(target=feed)
+    thread_feed.start()
+    with os.fdopen(source_read_fd, "rb") as stdin:
+        # the bytes buffered by the stream (from the source pipe) are pumped first
+        assert stdin.read(10) == CONTENT[:10]
+        stats, pumped = pump_and_drain(stdin, buffer_size=64 * 1024)
+    thread_feed.join()
+    assert stats.method == "splice"
+    assert pumped == CONTENT[10:]
+
+
+def test_pump_to_pipe_with_readinto():
+    stats, pumped = pump_and_drain(io.BytesIO(CONTENT), read_delay=0.01)
+    assert stats.method == "readinto"
+    assert pumped == CONTENT
+    assert stats.nb_bytes == len(CONTENT)
+    # the pump waits for the (slow) reader of the pipe
+    assert 0 < stats.stall_seconds <= stats.seconds
+    assert stats.throughput > 0
+
+
+def test_b2u_stream_to_imghashes_pump_metrics(big_buck_bunny_trailer):
+    metrics = PipelineMetrics(str(big_buck_bunny_trailer))
+    # the content of a stream which isn't file-backed is pumped into ffmpeg stdin
+    with io.BufferedReader(io.BytesIO(big_buck_bunny_trailer.read_bytes())) as stream:
+        imghashes = np.concatenate(
+            list(b2u_stream_to_imghashes(stream, metrics=metrics))
+        )
+    assert len(imghashes) == 812
+    assert hex(imghashes[0]) == "0xd5d52ad52ad42ad4"
+    assert metrics.stages["pump"].count == big_buck_bunny_trailer.stat().st_size
+    assert "pump_stall" in metrics.stages
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
+import json
 import pathlib
 import sys
+from dataclasses import asdict, replace
 from importlib.metadata import version
 from io import BufferedReader, BufferedWriter
-from typing import Iterable, Optional, Union
+from typing import Any, Callable, Iterable, Optional, Tuple, TypeVar, Union
 
 import rich_click as click
 from loguru import logger
@@ -29,11 +31,115 @@ except OSError:
     MediaInfo = mock_MediaInfo
 
 import vhcalc.services as services
-from vhcalc.models import URL, ImageHashingFunction
+from vhcalc.models import (
+    DECODE_PROFILES,
+    URL,
+    DecodeProfile,
+    FrameSampling,
+    ImageHashingFunction,
+)
 from vhcalc.tools.forked.click_default_group import DefaultGroup
 from vhcalc.tools.forked.click_path import GlobPaths
+from vhcalc.tools.http_range_reader import open_url
+from vhcalc.tools.imghash import imghashes_to_uint64
+from vhcalc.tools.metrics import PipelineMetrics
 from vhcalc.tools.version_extended_informations import get_version_extended_informations
 
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def sampling_options(f: F) -> F:
+    """click options of the frames sampling (see `build_frame_sampling`)"""
+    for option in reversed(
+        (
+            click.option(
+                "--sampling-fps",
+                type=click.FloatRange(min=0, min_open=True),
+                default=None,
+                help="Only hash frames sampled at this frame rate.",
+            ),
+            click.option(
+                "--keyframes",
+                is_flag=True,
+                type=bool,
+                default=False,
+                help="Only hash the keyframes (the other frames are not decoded).",
+            ),
+            click.option(
+                "--scene-threshold",
+                type=click.FloatRange(min=0, max=1),
+                default=None,
+                help="Only hash the frames with a scene change score above this threshold.",
+            ),
+        )
+    ):
+        f = option(f)
+    return f
+
+
+def build_frame_sampling(
+    sampling_fps: Optional[float],
+    keyframes: bool,
+    scene_threshold: Optional[float],
+) -> Optional[FrameSampling]:
+    """frames sampling from the click options (None: all the frames are hashed)"""
+    if sampling_fps is None and not keyframes and scene_threshold is None:
+        return None
+    try:
+        return FrameSampling(
+            fps=sampling_fps, keyframes=keyframes, scene_threshold=scene_threshold
+        )
+    except ValueError as e:
+        raise click.UsageError(
+            "'--sampling-fps', '--keyframes' and '--scene-threshold' are mutually exclusive."
+        ) from e
+
+
+def decode_profile_options(f: F) -> F:
+    """click options of the ffmpeg decoding (see `build_decode_profile`)"""
+    f = click.option(
+        "--decoder-threads",
+        type=click.IntRange(min=0),
+        default=0,
+        show_default=True,
+        help="Number of decoder threads (0: chosen by ffmpeg).",
+    )(f)
+    return click.option(
+        "--decode-profile",
+        type=click.Choice(list(DECODE_PROFILES)),
+        default="default",
+        show_default=True,
+        help="ffmpeg decoding options, faster profiles slightly change the images hashes.",
+    )(f)
+
+
+def build_decode_profile(
+    decode_profile: str, decoder_threads: int
+) -> Optional[DecodeProfile]:
+    """ffmpeg decoding options from the click options (None: ffmpeg defaults)"""
+    if decode_profile == "default" and not decoder_threads:
+        return None
+    return replace(DECODE_PROFILES[decode_profile], threads=decoder_threads)
+
+
+def metrics_file_option(f: F) -> F:
+    return click.option(
+        "--metrics-file",
+        type=click.Path(dir_okay=False, writable=True, path_type=pathlib.Path),
+        default=None,
+        help="File where to append the pipeline metrics (time and frames per stage, CPU time of the child processes unless medias are decoded concurrently) as JSON lines.",
+    )(f)
+
+
+def hashing_processes_option(f: F) -> F:
+    return click.option(
+        "--hashing-processes",
+        type=click.IntRange(min=0),
+        default=0,
+        show_default=True,
+        help="Number of processes hashing the frames in place, in a shared memory, while the next ones are decoded (0: no hashing process).",
+    )(f)
+
 
 @click.version_option(
     version=version("vhcalc"),
@@ -66,11 +172,12 @@ def cli() -> None:
 @click.option(
     "--image-hashing-method",
     type=click.Choice(ImageHashingFunction.names()),
-    default="PerceptualHashing",
+    default=["PerceptualHashing"],
+    multiple=True,
     show_default=True,
     # TODO: post validation and transform this option string to callable image hashing function
     # see: [Python Enum support for click.Choice #605](https://github.com/pallets/click/issues/605#issuecomment-901099036)
-    help="The image hashing method to use.",
+    help="The image hashing method to use. Repeat it to compute many images hashes from a single decoding: the images hashes of a frame are written one after the other (in the options order). Repeat it with '--decompress' to decompress them (one column per method).",
 )
 @click.option(
     "--decompress",
@@ -80,17 +187,74 @@ def cli() -> None:
     default=False,
     help="Decompress images hashes from binary streams.",
 )
+@click.option(
+    "--decompress-format",
+    type=click.Choice(["hex", "csv", "ndjson"]),
+    default="hex",
+    show_default=True,
+    help="Text format of the decompressed images hashes.",
+)
+@click.option(
+    "--fps",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Frame rate of the hashed media, to add timestamps to decompressed images hashes.",
+)
 @click.option(
     "--from-url",
     type=URL,
-    help="Allow to pass an URL for INPUT",
+    help="Allow to pass an URL for INPUT (not with '--keyframes' or '--scene-threshold').",
+)
+@click.option(
+    "--url-read-ahead",
+    type=click.IntRange(min=0),
+    default=8,
+    show_default=True,
+    help="Read-ahead buffer (in MiB) of the HTTP(S) range requests fetching the '--from-url' media, resumed after disconnections (0: ffmpeg pulls the URL itself).",
+)
+@click.option(
+    "--cache",
+    is_flag=True,
+    type=bool,
+    default=False,
+    help="Use (and fill) the images hashes cache (default: $VHCALC_CACHE_DIR or ~/.cache/vhcalc).",
+)
+@sampling_options
+@click.option(
+    "--timestamps-output",
+    type=click.File("wb"),
+    default=None,
+    help="File where to write the timestamps (little-endian float64, in seconds) of the sampled frames.",
+)
+@decode_profile_options
+@click.option(
+    "--hashing-workers",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="Number of threads hashing the frames while the next ones are decoded (0: decode and hash in turn).",
 )
+@hashing_processes_option
+@metrics_file_option
 def imghash(
     input_stream: BufferedReader,
     output_stream: BufferedWriter,
-    image_hashing_method: str,
+    image_hashing_method: Tuple[str, ...],
     decompress: bool,
+    decompress_format: str,
+    fps: Optional[float],
     from_url: Optional[URL],
+    url_read_ahead: int,
+    cache: bool,
+    sampling_fps: Optional[float],
+    keyframes: bool,
+    scene_threshold: Optional[float],
+    timestamps_output: Optional[BufferedWriter],
+    decode_profile: str,
+    decoder_threads: int,
+    hashing_workers: int,
+    hashing_processes: int,
+    metrics_file: Optional[pathlib.Path],
 ) -> None:
     """Generate images hashes from INPUT binary stream and send it to OUTPUT stream.
 
@@ -98,21 +262,93 @@ def imghash(
     OUTPUT stream (default: stdout)
     """
     if decompress:
-        for imghash_binary in services.a2b_imghash(input_stream):
-            output_stream.write(str(imghash_binary).encode())
+        # one column per image hashing method (of the compressed images hashes)
+        columns = (
+            image_hashing_method if len(image_hashing_method) > 1 else ("imghash",)
+        )
+        for imghashes_text in services.b2a_imghash(
+            input_stream, output_format=decompress_format, fps=fps, columns=columns
+        ):
+            output_stream.write(imghashes_text)
         return
 
+    sampling = build_frame_sampling(sampling_fps, keyframes, scene_threshold)
+    if from_url and sampling is not None and not sampling.fps:
+        # the packets timestamps would be read by downloading the media twice
+        raise click.UsageError(
+            "'--from-url' can't be used with '--keyframes' or '--scene-threshold'."
+        )
+    if sampling is not None and cache:
+        # only the images hashes of all the frames are cached
+        raise click.UsageError("'--cache' can't be used with a frames sampling.")
+    metrics = PipelineMetrics(str(from_url or input_stream.name))
     # FIXME: ugly need to refactor
     b2a_imghash_input: Union[BufferedReader, URL]
-    if from_url:
+    if from_url and url_read_ahead and from_url.startswith(("http://", "https://")):
+        # fetched (in Python) by range requests and sent to ffmpeg stdin,
+        # closed with the command context (as the click files)
+        click_context = click.get_current_context()
+        assert click_context is not None  # nosec
+        b2a_imghash_input = click_context.with_resource(
+            open_url(from_url, read_ahead=url_read_ahead * 1024 * 1024, metrics=metrics)
+        )
+    elif from_url:
         b2a_imghash_input = from_url
     else:
         b2a_imghash_input = input_stream
-    for frame_hash_binary in services.b2b_stream_to_imghash(
-        b2a_imghash_input,
-        fn_imagehash=ImageHashingFunction[image_hashing_method],
-    ):
-        output_stream.write(frame_hash_binary)
+    ffmpeg_decode_profile = build_decode_profile(decode_profile, decoder_threads)
+    if sampling is None and timestamps_output:
+        raise click.UsageError("'--timestamps-output' requires a frames sampling.")
+    fn_imagehashes = [ImageHashingFunction[method] for method in image_hashing_method]
+    if len(fn_imagehashes) > 1:
+        for option, is_set in (
+            ("--cache", cache),
+            ("--hashing-processes", hashing_processes),
+            ("a frames sampling", sampling is not None),
+        ):
+            if is_set:
+                raise click.UsageError(
+                    f"{option} can't be used with many image hashing methods."
+                )
+        for chunk_imghashes in services.b2u_stream_to_multi_imghashes(
+            b2a_imghash_input,
+            fn_imagehashes,
+            decode_profile=ffmpeg_decode_profile,
+            metrics=metrics,
+            hashing_workers=hashing_workers,
+        ):
+            with metrics.timed("write", count=len(chunk_imghashes)):
+                output_stream.write(chunk_imghashes.tobytes())
+    elif sampling is not None:
+        for (
+            chunk_imghashes,
+            chunk_timestamps,
+        ) in services.b2u_stream_to_timestamped_imghashes(
+            b2a_imghash_input,
+            sampling,
+            fn_imagehash=fn_imagehashes[0],
+            decode_profile=ffmpeg_decode_profile,
+            metrics=metrics,
+        ):
+            # one write per chunk of images hashes (in their binary layout)
+            with metrics.timed("write", count=len(chunk_imghashes)):
+                output_stream.write(chunk_imghashes.tobytes())
+                if timestamps_output:
+                    timestamps_output.write(chunk_timestamps.astype("<f8").tobytes())
+    else:
+        for chunk_imghashes in services.b2u_stream_to_imghashes(
+            b2a_imghash_input,
+            fn_imagehash=fn_imagehashes[0],
+            cache=services.ImageHashesCache() if cache else None,
+            decode_profile=ffmpeg_decode_profile,
+            metrics=metrics,
+            hashing_workers=hashing_workers,
+            hashing_processes=hashing_processes,
+        ):
+            with metrics.timed("write", count=len(chunk_imghashes)):
+                output_stream.write(chunk_imghashes.tobytes())
+    if metrics_file:
+        metrics.write(metrics_file)
 
 
 @cli.command(short_help="Generate media informations (with `mediainfo` tool).")
@@ -149,15 +385,265 @@ def mediainfo(filename: str) -> None:
     "-o",
     default=None,
     type=click.Path(writable=True, path_type=pathlib.Path),
-    help="File where to write images hashes.",
+    help="File where to write images hashes (only for one media).",
+)
+@click.option(
+    "--output-dir",
+    default=None,
+    type=click.Path(file_okay=False, writable=True, path_type=pathlib.Path),
+    help="Directory where to write images hashes files (default: temporary directory).",
+)
+@click.option(
+    "--max-decoders",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Maximum number of medias decoded at the same time.",
+)
+@click.option(
+    "--max-hashers",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Maximum number of chunks of frames hashed at the same time.",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of segments of the media decoded and hashed in parallel (processes).",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    type=bool,
+    default=False,
+    help="Resume exports from existing (partial) output files.",
+)
+@click.option(
+    "--cache",
+    is_flag=True,
+    type=bool,
+    default=False,
+    help="Use (and fill) the images hashes cache (default: $VHCALC_CACHE_DIR or ~/.cache/vhcalc).",
+)
+@sampling_options
+@click.option(
+    "--container",
+    is_flag=True,
+    type=bool,
+    default=False,
+    help="Write images hashes in containers (.vhc) with the media metadata and fingerprint (reused if up to date).",
 )
-@logger.catch
+@decode_profile_options
+@hashing_processes_option
+@metrics_file_option
+@logger.catch(exclude=click.ClickException)
 def export_imghash_from_media(
-    medias_pattern: Iterable[pathlib.Path], output_file: Optional[pathlib.Path]
+    medias_pattern: Iterable[pathlib.Path],
+    output_file: Optional[pathlib.Path],
+    output_dir: Optional[pathlib.Path],
+    max_decoders: int,
+    max_hashers: int,
+    jobs: int,
+    resume: bool,
+    cache: bool,
+    sampling_fps: Optional[float],
+    keyframes: bool,
+    scene_threshold: Optional[float],
+    container: bool,
+    decode_profile: str,
+    decoder_threads: int,
+    hashing_processes: int,
+    metrics_file: Optional[pathlib.Path],
 ) -> None:
     """Click entrypoint for extracting and exporting binary video hashes (fingerprints) from any video source"""
-    for media in medias_pattern:
-        services.export_imghash_from_media(media, output_file)
+    medias = list(medias_pattern)
+    imghashes_cache = services.ImageHashesCache() if cache else None
+    sampling = build_frame_sampling(sampling_fps, keyframes, scene_threshold)
+    ffmpeg_decode_profile = build_decode_profile(decode_profile, decoder_threads)
+    if output_file:
+        if len(medias) > 1:
+            raise click.UsageError(
+                "'--output-file' can't be used with many medias, use '--output-dir'."
+            )
+        metrics = PipelineMetrics(str(medias[0]))
+        try:
+            services.export_imghash_from_media(
+                medias[0],
+                output_file,
+                jobs=jobs,
+                resume=resume,
+                cache=imghashes_cache,
+                sampling=sampling,
+                container=container,
+                decode_profile=ffmpeg_decode_profile,
+                metrics=metrics,
+                hashing_processes=hashing_processes,
+            )
+        finally:
+            if metrics_file:
+                metrics.write(metrics_file)
+        return
+
+    if output_dir:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        exports = services.export_imghash_from_medias(
+            medias,
+            output_dir=output_dir,
+            max_decoders=max_decoders,
+            max_hashers=max_hashers,
+            jobs=jobs,
+            resume=resume,
+            cache=imghashes_cache,
+            sampling=sampling,
+            container=container,
+            decode_profile=ffmpeg_decode_profile,
+            metrics_file=metrics_file,
+            hashing_processes=hashing_processes,
+        )
+    except ValueError as e:
+        raise click.UsageError(str(e)) from e
+    nb_failures = sum(isinstance(export, Exception) for export in exports.values())
+    if nb_failures:
+        raise click.ClickException(f"{nb_failures}/{len(exports)} exports failed.")
+
+
+@cli.command(
+    short_help="Index images hashes files for similarity search (see `query`)."
+)
+@click.argument(
+    "index_dir",
+    type=click.Path(file_okay=False, writable=True, path_type=pathlib.Path),
+)
+@click.option(
+    "--phash_pattern",
+    "-r",
+    required=True,
+    type=GlobPaths(
+        files_okay=True,
+        dirs_okay=False,
+        readable_only=True,
+        at_least_one=True,
+    ),
+    help="Pattern to find images hashes files",
+)
+def index(index_dir: pathlib.Path, phash_pattern: Iterable[pathlib.Path]) -> None:
+    """Add images hashes files to the index stored in INDEX_DIR (created if needed)."""
+    for indexed_media in services.ImageHashesIndex(index_dir).add(phash_pattern):
+        click.echo(f"{indexed_media.name}: {indexed_media.nb_frames} frames indexed")
+
+
+@cli.command(short_help="Search the medias matching a clip in an index.")
+@click.argument(
+    "index_dir",
+    type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path),
+)
+@click.argument(
+    "input_stream",
+    type=click.File("rb"),
+    default=sys.stdin.buffer,
+)
+@click.option(
+    "--max-distance",
+    default=8,
+    type=click.IntRange(min=0, max=64),
+    show_default=True,
+    help="Maximum Hamming distance between matching frames (beyond 15, all the indexed frames are compared).",
+)
+@click.option(
+    "--top",
+    default=10,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Maximum number of matches.",
+)
+def query(
+    index_dir: pathlib.Path,
+    input_stream: BufferedReader,
+    max_distance: int,
+    top: int,
+) -> None:
+    """Search the medias (and offsets) matching the binary images hashes of a clip
+    from INPUT stream (default: stdin), in the index stored in INDEX_DIR.
+
+    Matches are written (best first) as JSON lines.
+    """
+    bin_imghashes = input_stream.read()
+    matches = services.ImageHashesIndex(index_dir).query(
+        imghashes_to_uint64(bin_imghashes[: len(bin_imghashes) // 8 * 8]),
+        max_distance=max_distance,
+        top=top,
+    )
+    for match in matches:
+        click.echo(json.dumps(asdict(match)))
+
+
+@cli.command(
+    short_help="Find the best alignment of a clip in a media (images hashes files)."
+)
+@click.argument(
+    "clip_phash_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+)
+@click.argument(
+    "media_phash_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+)
+@click.option(
+    "--max-distance",
+    default=10,
+    type=click.IntRange(min=0, max=64),
+    show_default=True,
+    help="Maximum Hamming distance between matching frames.",
+)
+@click.option(
+    "--min-segment-frames",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Minimum number of frames of a matching segment.",
+)
+@click.option(
+    "--distance-profile",
+    is_flag=True,
+    type=bool,
+    default=False,
+    help="Add the distance (per clip frame) profile of the alignment.",
+)
+def match(
+    clip_phash_file: pathlib.Path,
+    media_phash_file: pathlib.Path,
+    max_distance: int,
+    min_segment_frames: int,
+    distance_profile: bool,
+) -> None:
+    """Find the best alignment of the clip CLIP_PHASH_FILE in the media MEDIA_PHASH_FILE,
+    from their binary images hashes files.
+
+    The alignment (offset, mean distance and matching segments) is written as JSON.
+    """
+    alignment = services.match_phash_files(
+        clip_phash_file,
+        media_phash_file,
+        max_distance=max_distance,
+        min_segment_nb_frames=min_segment_frames,
+    )
+    if alignment is None:
+        raise click.ClickException("The clip is empty or longer than the media.")
+    json_alignment = asdict(alignment)
+    json_alignment["timestamp"] = (
+        alignment.offset / fps
+        if (fps := services.PhashFile(media_phash_file).fps)
+        else None
+    )
+    json_alignment["distances"] = (
+        alignment.distances.tolist() if distance_profile else None
+    )
+    click.echo(json.dumps(json_alignment))
 
 
 if __name__ == "__main__":
@@ -1,9 +1,24 @@
+from vhcalc.models.alignment import Alignment, MatchingSegment
+from vhcalc.models.decode_profile import DECODE_PROFILES, DecodeProfile
 from vhcalc.models.imghash_function import ImageHashingFunction
+from vhcalc.models.index import IndexedMedia, IndexMatch
 from vhcalc.models.metadata import MetaData
+from vhcalc.models.phash_header import PhashHeader
+from vhcalc.models.sampling import FrameSampling
+from vhcalc.models.segment import MediaSegment
 from vhcalc.models.url import URL
 
 __all__ = [
     "MetaData",
+    "MediaSegment",
     "URL",
     "ImageHashingFunction",
+    "IndexedMedia",
+    "IndexMatch",
+    "Alignment",
+    "MatchingSegment",
+    "FrameSampling",
+    "PhashHeader",
+    "DecodeProfile",
+    "DECODE_PROFILES",
 ]
@@ -0,0 +1,28 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import numpy.typing as npt
+
+
+@dataclass
+class MatchingSegment:
+    """`nb_frames` frames of a clip, from its frame `clip_start`, matching the frames
+    of a media from its frame `media_start`."""
+
+    clip_start: int
+    media_start: int
+    nb_frames: int
+
+
+@dataclass
+class Alignment:
+    """Best alignment of a clip in a media: the first frame of the clip is aligned on the
+    frame `offset` of the media, with a Hamming `mean_distance` between aligned frames.
+
+    `distances` is the distance profile (per clip frame) of the alignment and `segments`
+    the segments of the clip matching the media."""
+
+    offset: int
+    mean_distance: float
+    distances: npt.NDArray[np.uint8]
+    segments: list[MatchingSegment] = field(default_factory=list)
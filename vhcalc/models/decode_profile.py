@@ -0,0 +1,56 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Final, Optional
+
+
+@dataclass(frozen=True)
+class DecodeProfile:
+    """ffmpeg decoding options (traded between speed and fidelity of the frames hashed):
+    number of decoder `threads` (0: chosen by ffmpeg), frames on which the decoder skips
+    the loop (deblocking) filter (`skip_loop_filter`) or the IDCT (`skip_idct`), from
+    "none" to "all" (see `-skip_frame` in the ffmpeg codecs options), `scaler`
+    algorithm used to rescale the frames (ffmpeg `sws_flags`, default: bicubic) and
+    dropping the (not decoded) audio, subtitles and data streams
+    (`drop_other_streams`).
+
+    >>> DECODE_PROFILES["fast"]
+    DecodeProfile(threads=0, skip_loop_filter='all', skip_idct=None, scaler=None, drop_other_streams=True)
+    """
+
+    threads: int = 0
+    skip_loop_filter: Optional[str] = None
+    skip_idct: Optional[str] = None
+    scaler: Optional[str] = None
+    drop_other_streams: bool = False
+
+    @property
+    def digest(self) -> str:
+        """short digest of the decoding options changing the frames decoded (empty for
+        the ffmpeg defaults): the frames decoded with other options have (slightly)
+        different images hashes, the `threads` and `drop_other_streams` options
+        don't change them
+
+        >>> DecodeProfile(threads=4).digest, len(DECODE_PROFILES["fast"].digest)
+        ('', 16)
+        """
+        frames_options = (self.skip_loop_filter, self.skip_idct, self.scaler)
+        if frames_options == (None, None, None):
+            return ""
+        return hashlib.blake2b(repr(frames_options).encode(), digest_size=8).hexdigest()
+
+
+# images hashes of the frames decoded with a profile differ by (measured on h264 media):
+#   - "fast": ~1 bit (mean Hamming distance) from the deblocking filter skipped
+#   - "fastest": ~3 bits, mainly from the area scaler (a point sampling scaler like
+#     fast_bilinear differs by ~13 bits when downscaling to FRAME_SIZE)
+DECODE_PROFILES: Final[dict[str, DecodeProfile]] = {
+    # frames decoded (and rescaled) as by default with ffmpeg
+    "default": DecodeProfile(),
+    "fast": DecodeProfile(skip_loop_filter="all", drop_other_streams=True),
+    "fastest": DecodeProfile(
+        skip_loop_filter="all",
+        skip_idct="bidir",
+        scaler="area",
+        drop_other_streams=True,
+    ),
+}
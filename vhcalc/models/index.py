@@ -0,0 +1,27 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class IndexedMedia:
+    """Images hashes of a media (exported in `phash_file`), indexed as the `nb_frames`
+    frames of an index starting at frame `first_frame`."""
+
+    name: str
+    phash_file: str
+    first_frame: int
+    nb_frames: int
+    fps: Optional[float] = None
+
+
+@dataclass
+class IndexMatch:
+    """Clip matching a media from its frame `offset` (timestamp in seconds, if the media
+    frame rate is known): `nb_matching_frames` frames of the clip are within the distance
+    threshold, with a mean Hamming distance of `mean_distance`."""
+
+    media: str
+    offset: int
+    timestamp: Optional[float]
+    nb_matching_frames: int
+    mean_distance: float
@@ -0,0 +1,23 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class PhashHeader:
+    """Header of an images hashes container file: images hashes of `nb_frames` frames
+    (hashed with `method` on frames rescaled to `frame_size`) of a media (with its
+    `fps`, `duration` and content `source_fingerprint`, if known), sampled with
+    `sampling` (empty if all the frames are hashed), decoded with the options of
+    `decode_profile` (its `DecodeProfile.digest`, empty for the ffmpeg defaults). The
+    presentation timestamps of the frames are stored if `has_pts` (else they are
+    computed from the fps)."""
+
+    method: str
+    frame_size: int
+    fps: Optional[float] = None
+    duration: Optional[float] = None
+    sampling: str = ""
+    source_fingerprint: Optional[str] = None
+    nb_frames: int = 0
+    has_pts: bool = False
+    decode_profile: str = ""
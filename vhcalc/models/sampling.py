@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class FrameSampling:
+    """Frames sampled (decoded and hashed) from a media: frames at a fixed frame rate
+    `fps`, only the keyframes (`keyframes`), or only the frames starting a new scene
+    (`scene_threshold`: minimum scene change score, between 0 and 1).
+
+    >>> str(FrameSampling(fps=5)), str(FrameSampling(scene_threshold=0.3))
+    ('fps=5.0', 'scene=0.3')
+    >>> FrameSampling(fps=5, keyframes=True)
+    Traceback (most recent call last):
+    ...
+    ValueError: One (and only one) sampling mode must be set: FrameSampling(fps=5, keyframes=True, scene_threshold=None)
+    """
+
+    fps: Optional[float] = None
+    keyframes: bool = False
+    scene_threshold: Optional[float] = None
+
+    def __post_init__(self) -> None:
+        nb_sampling_modes = sum(
+            (self.fps is not None, self.keyframes, self.scene_threshold is not None)
+        )
+        if nb_sampling_modes != 1:
+            raise ValueError(f"One (and only one) sampling mode must be set: {self!r}")
+
+    def __str__(self) -> str:
+        if self.fps is not None:
+            return f"fps={float(self.fps)}"
+        if self.keyframes:
+            return "keyframes"
+        return f"scene={self.scene_threshold}"
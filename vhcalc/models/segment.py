@@ -0,0 +1,14 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class MediaSegment:
+    """Segment of a media: `nb_frames` frames starting at frame `start_frame`.
+
+    `seek_time` (in seconds) is the (ffmpeg input) seek position to decode
+    the segment from its first frame.
+    """
+
+    start_frame: int
+    nb_frames: int
+    seek_time: float = 0
@@ -1,7 +1,43 @@
-from .imghashes import a2b_imghash, b2b_stream_to_imghash, export_imghash_from_media
+from .async_imghashes import async_b2b_stream_to_imghash, async_b2u_stream_to_imghashes
+from .batch import export_imghash_from_medias
+from .cache import ImageHashesCache
+from .imghashes import (
+    a2b_imghash,
+    b2a_imghash,
+    b2b_stream_to_imghash,
+    b2b_stream_to_timestamped_imghash,
+    b2u_stream_to_imghashes,
+    b2u_stream_to_multi_imghashes,
+    b2u_stream_to_timestamped_imghashes,
+    export_imghash_from_media,
+    read_imghashes,
+    timestamps_file,
+)
+from .index import ImageHashesIndex
+from .match import align_imghashes, match_phash_files
+from .phash_file import PhashFile
+from .probe import probe_media_metadata
+from .shm_hashing import shm_hash_frame_blocks
 
 __all__ = [
     "export_imghash_from_media",
+    "export_imghash_from_medias",
     "b2b_stream_to_imghash",
+    "b2b_stream_to_timestamped_imghash",
+    "b2u_stream_to_imghashes",
+    "b2u_stream_to_multi_imghashes",
+    "b2u_stream_to_timestamped_imghashes",
+    "timestamps_file",
     "a2b_imghash",
+    "read_imghashes",
+    "async_b2b_stream_to_imghash",
+    "async_b2u_stream_to_imghashes",
+    "b2a_imghash",
+    "shm_hash_frame_blocks",
+    "probe_media_metadata",
+    "ImageHashesCache",
+    "PhashFile",
+    "ImageHashesIndex",
+    "align_imghashes",
+    "match_phash_files",
 ]
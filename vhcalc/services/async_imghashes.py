@@ -0,0 +1,111 @@
+"""
+asyncio API: compute images hashes of many (async) binary streams concurrently in
+one event loop (e.g. medias uploaded to a web service, hashed on the fly).
+"""
+
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from pathlib import Path  # noqa: F401 (used by the doctests)
+from typing import AsyncGenerator, AsyncIterable, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from vhcalc.models import DecodeProfile, ImageHashingFunction
+from vhcalc.services.reader_frames import ffmpeg_decode_params
+from vhcalc.tools.aio_ffmpeg_io import aread_frame_blocks_from_stream
+from vhcalc.tools.imghash import FRAME_SIZE, imghashes_as_uint64, rawframes_to_imghashes
+
+
+async def async_b2u_stream_to_imghashes(
+    binary_stream: AsyncIterable[bytes],
+    chunk_size_in_frames: int = 15 * 25,
+    fn_imagehash: ImageHashingFunction = ImageHashingFunction.PerceptualHashing,
+    decode_profile: Optional[DecodeProfile] = None,
+    hashing_executor: Optional[Executor] = None,
+) -> AsyncGenerator[npt.NDArray[np.uint64], None]:
+    """
+    Compute images hashes from an async binary stream of a media (sent to ffmpeg), by
+    chunks of frames (see `vhcalc.services.imghashes.b2u_stream_to_imghashes`).
+
+    The ffmpeg process is driven by the event loop (no thread per stream), the chunks
+    of frames are hashed in `hashing_executor` so the event loop is not blocked.
+
+    Args:
+        binary_stream (AsyncIterable[bytes]): chunks of the media content
+        chunk_size_in_frames (int): Chunk size in frames
+        fn_imagehash (ImageHashingFunction): ImageHash function
+        decode_profile (Optional[DecodeProfile]): ffmpeg decoding options
+            (see `vhcalc.models.DECODE_PROFILES`).
+        hashing_executor (Optional[Executor]): executor (shared between streams) where
+            chunks of frames are hashed, default to the event loop default executor.
+
+    Yields:
+        npt.NDArray[np.uint64]: images hashes of the next chunk of frames
+
+    Example:
+        >>> async def read_chunks(path, chunk_size=64 * 1024):
+        ...     with path.open("rb") as fi:
+        ...         while chunk := fi.read(chunk_size):
+        ...             yield chunk
+        >>> async def first_imghash(path):
+        ...     async for chunk_imghashes in async_b2u_stream_to_imghashes(read_chunks(path)):
+        ...         return hex(chunk_imghashes[0])
+        >>> asyncio.run(first_imghash(Path("tests/data/big_buck_bunny_trailer_480p.mkv")))
+        '0xd5d52ad52ad42ad4'
+    """
+    input_params, output_params, video_filters = ffmpeg_decode_params(decode_profile)
+    loop = asyncio.get_running_loop()
+    it_reader_chunk_frames = aread_frame_blocks_from_stream(
+        binary_stream,
+        framesize_bytes=FRAME_SIZE * FRAME_SIZE,
+        nb_frames_per_block=chunk_size_in_frames,
+        input_params=input_params,
+        output_params=[*output_params, "-vf", video_filters],
+    )
+    try:
+        async for raw_frames in it_reader_chunk_frames:
+            # the blocks own their memory: no copy before hashing them in the executor
+            yield imghashes_as_uint64(
+                await loop.run_in_executor(
+                    hashing_executor,
+                    partial(
+                        rawframes_to_imghashes,
+                        raw_frames.reshape(-1, FRAME_SIZE, FRAME_SIZE),
+                        fn_imagehash=fn_imagehash,
+                    ),
+                )
+            )
+    finally:
+        # stop ffmpeg now (not when the reader is garbage collected) if closed early
+        await it_reader_chunk_frames.aclose()
+
+
+async def async_b2b_stream_to_imghash(
+    binary_stream: AsyncIterable[bytes],
+    chunk_size_in_frames: int = 15 * 25,
+    fn_imagehash: ImageHashingFunction = ImageHashingFunction.PerceptualHashing,
+    decode_profile: Optional[DecodeProfile] = None,
+    hashing_executor: Optional[Executor] = None,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Same as `async_b2u_stream_to_imghashes`, but image hash by image hash (as bytes).
+
+    Yields:
+        bytes: The next binary image hash from the media stream
+    """
+    it_chunk_imghashes = async_b2u_stream_to_imghashes(
+        binary_stream,
+        chunk_size_in_frames,
+        fn_imagehash,
+        decode_profile,
+        hashing_executor,
+    )
+    try:
+        async for chunk_imghashes in it_chunk_imghashes:
+            bin_imghashes = chunk_imghashes.tobytes()
+            for offset in range(0, len(bin_imghashes), 8):
+                yield bin_imghashes[offset : offset + 8]
+    finally:
+        await it_chunk_imghashes.aclose()
@@ -0,0 +1,143 @@
+"""
+Export images hashes from many medias at once.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Iterable, Optional, Union
+
+from loguru import logger
+from rich import get_console
+
+from vhcalc.models import DecodeProfile, FrameSampling
+from vhcalc.services.cache import ImageHashesCache
+from vhcalc.services.imghashes import export_imghash_from_media
+from vhcalc.tools.metrics import PipelineMetrics
+from vhcalc.tools.progress_bar import build_progress_bar
+
+console = get_console()
+
+
+def export_imghash_from_medias(
+    medias: Iterable[Path],
+    output_dir: Optional[Path] = None,
+    max_decoders: int = 1,
+    max_hashers: int = 1,
+    jobs: int = 1,
+    chunk_nb_seconds: int = 15,
+    resume: bool = False,
+    cache: Optional[ImageHashesCache] = None,
+    sampling: Optional[FrameSampling] = None,
+    container: bool = False,
+    decode_profile: Optional[DecodeProfile] = None,
+    metrics_file: Optional[Path] = None,
+    hashing_processes: int = 0,
+) -> dict[Path, Union[Path, Exception]]:
+    """
+    Export images hashes from many medias, with a bounded pool of workers.
+
+    Medias are scheduled largest first (by file size) to reduce the tail latency:
+    the longest exports start first and the smallest ones fill the gaps at the end.
+    An export failure is logged and reported, but doesn't abort the other exports.
+    A media given many times is exported once, but distinct medias with the same
+    file name are rejected: their default outputs files would be the same.
+
+    Args:
+        medias (Iterable[Path]): medias to export images hashes from
+        output_dir (Optional[Path]): directory of the outputs files,
+            see `export_imghash_from_media`
+        max_decoders (int): maximum number of medias decoded at the same time
+            (i.e. number of ffmpeg processes if `jobs` is 1)
+        max_hashers (int): maximum number of chunks of frames hashed at the same time
+        jobs (int): number of segments (processes) per media,
+            see `export_imghash_from_media`
+        chunk_nb_seconds (int): see `export_imghash_from_media`
+        resume (bool): see `export_imghash_from_media`
+        cache (Optional[ImageHashesCache]): see `export_imghash_from_media`
+        sampling (Optional[FrameSampling]): see `export_imghash_from_media`
+        container (bool): see `export_imghash_from_media`
+        decode_profile (Optional[DecodeProfile]): see `export_imghash_from_media`
+        metrics_file (Optional[Path]): file where the metrics of each export are
+            appended (one JSON line per media, see `vhcalc.tools.metrics`), without
+            the CPU time of the child processes if medias are exported concurrently
+        hashing_processes (int): number of processes (per media) hashing the frames
+            in a shared memory, instead of the `max_hashers` threads,
+            see `export_imghash_from_media`
+
+    Returns:
+        dict[Path, Union[Path, Exception]]: for each media (in scheduling order),
+            the output file or the exception raised by its export.
+
+    Raises:
+        ValueError: if distinct medias have the same file name
+    """
+    # the (concurrent) exports of medias with the same name would append their
+    # images hashes into the same output file
+    resolved_medias: dict[Path, Path] = {}
+    for media in medias:
+        resolved_medias.setdefault(media.resolve(), media)
+    unique_medias = list(resolved_medias.values())
+    medias_by_name: dict[str, list[Path]] = {}
+    for media in unique_medias:
+        medias_by_name.setdefault(media.name, []).append(media)
+    same_name_medias = [
+        same_name for same_name in medias_by_name.values() if len(same_name) > 1
+    ]
+    if same_name_medias:
+        raise ValueError(
+            "Medias with the same file name would be exported into the same output "
+            f"file: {', '.join(map(str, same_name_medias[0]))}"
+        )
+    # largest medias first (missing medias are reported by their export)
+    sorted_medias = sorted(
+        unique_medias,
+        key=lambda media: media.stat().st_size if media.exists() else 0,
+        reverse=True,
+    )
+    exports: dict[Path, Union[Path, Exception]] = {}
+    # the CPU time of the child processes (process-wide) can't be split per media
+    # between concurrent exports
+    concurrent_exports = max_decoders > 1 and len(sorted_medias) > 1
+
+    def _export(media: Path, **kwargs: Any) -> Path:
+        metrics = PipelineMetrics(str(media), children_cpu=not concurrent_exports)
+        try:
+            return export_imghash_from_media(media, metrics=metrics, **kwargs)
+        finally:
+            # the metrics of a failed export are written too (up to its failure)
+            if metrics_file is not None:
+                metrics.write(metrics_file)
+
+    progress_bar = build_progress_bar(console)
+    with progress_bar, ThreadPoolExecutor(
+        max_workers=max_hashers, thread_name_prefix="hasher"
+    ) as hashing_executor, ThreadPoolExecutor(
+        max_workers=max_decoders, thread_name_prefix="decoder"
+    ) as decoding_executor:
+        future_to_media = {
+            decoding_executor.submit(
+                _export,
+                media,
+                chunk_nb_seconds=chunk_nb_seconds,
+                jobs=jobs,
+                output_dir=output_dir,
+                progress_bar=progress_bar,
+                hashing_executor=hashing_executor,
+                resume=resume,
+                cache=cache,
+                sampling=sampling,
+                container=container,
+                decode_profile=decode_profile,
+                hashing_processes=hashing_processes,
+            ): media
+            for media in sorted_medias
+        }
+        for future in as_completed(future_to_media):
+            media = future_to_media[future]
+            try:
+                exports[media] = future.result()
+            except Exception as error:
+                logger.opt(exception=error).error(f"Can't export {media}")
+                exports[media] = error
+
+    return {media: exports[media] for media in sorted_medias}
@@ -0,0 +1,181 @@
+"""
+Persistent (local disk) cache of images hashes, keyed by a fast fingerprint of the media content.
+
+The fingerprint of a media is computed from its size, its modification time and a
+(blake2b) hash of sampled blocks at its head, middle and tail: media are never
+decoded (again) to know if their images hashes are already cached.
+"""
+
+import hashlib
+import os
+import stat
+import tempfile
+import time
+from io import BufferedReader
+from pathlib import Path
+from typing import BinaryIO, Final, Optional, Union
+
+from loguru import logger
+
+from vhcalc.models import DecodeProfile, ImageHashingFunction
+from vhcalc.tools.imghash import FRAME_SIZE
+
+SAMPLE_BLOCK_SIZE: Final[int] = 64 * 1024
+DEFAULT_CACHE_MAX_SIZE: Final[int] = 1024**3
+
+
+def default_cache_dir() -> Path:
+    """`$VHCALC_CACHE_DIR` or `$XDG_CACHE_HOME/vhcalc` (default: ~/.cache/vhcalc)"""
+    if cache_dir := os.environ.get("VHCALC_CACHE_DIR"):
+        return Path(cache_dir)
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "vhcalc"
+
+
+def media_fingerprint(media: Union[Path, BufferedReader, BinaryIO]) -> Optional[str]:
+    """
+    Fast fingerprint of a media content (file or file-backed seekable stream).
+
+    Args:
+        media (Union[Path, BufferedReader, BinaryIO]): path to the media or binary
+            stream on it (the stream position is not modified).
+
+    Returns:
+        Optional[str]: hexadecimal fingerprint, or None for non file-backed streams
+            (pipes, sockets, ...)
+
+    Examples:
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> fingerprint = media_fingerprint(media_path)
+        >>> len(fingerprint)
+        64
+        >>> with media_path.open("rb") as fo:
+        ...     media_fingerprint(fo) == fingerprint
+        True
+        >>> from io import BytesIO
+        >>> media_fingerprint(BytesIO(b"not file-backed")) is None
+        True
+    """
+    if isinstance(media, Path):
+        with media.open("rb") as fo:
+            return media_fingerprint(fo)
+
+    try:
+        fd = media.fileno()
+        position = media.tell()
+        media_stat = os.fstat(fd)
+    except (AttributeError, OSError, ValueError):
+        return None
+    if not stat.S_ISREG(media_stat.st_mode):
+        return None
+
+    size = media_stat.st_size
+    fingerprint = hashlib.blake2b(digest_size=32)
+    fingerprint.update(f"{size}:{media_stat.st_mtime_ns}:{position}".encode())
+    for offset in (position, (position + size) // 2, size - SAMPLE_BLOCK_SIZE):
+        fingerprint.update(os.pread(fd, SAMPLE_BLOCK_SIZE, max(offset, position)))
+    return fingerprint.hexdigest()
+
+
+class ImageHashesCache:
+    """
+    Cache of images hashes, stored in files on local disk, with a LRU eviction bounding
+    the cache size (the modification time of the cached files is their last access).
+
+    Examples:
+        >>> cache = ImageHashesCache(Path(tempfile.mkdtemp()), max_size=16)
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> cache_key = cache.key(media_path)
+        >>> cache.get(cache_key) is None
+        True
+        >>> cache.put(cache_key, b"\\x00" * 16)
+        >>> cache.get(cache_key)
+        b'\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x00'
+        >>> cache.put(cache.key(media_path, ImageHashingFunction.WaveletHashing), b"\\x00" * 8)
+        >>> cache.get(cache_key) is None
+        True
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_size: int = DEFAULT_CACHE_MAX_SIZE,
+    ):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(
+        media: Union[Path, BufferedReader, BinaryIO],
+        fn_imagehash: ImageHashingFunction = ImageHashingFunction.PerceptualHashing,
+        decode_profile: Optional[DecodeProfile] = None,
+    ) -> Optional[str]:
+        """Cache key of the images hashes of a media (None if the media can't be cached)
+
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> ImageHashesCache.key(media_path) == ImageHashesCache.key(
+        ...     media_path, decode_profile=DecodeProfile()
+        ... )
+        True
+        >>> ImageHashesCache.key(media_path) == ImageHashesCache.key(
+        ...     media_path, decode_profile=DecodeProfile(scaler="area")
+        ... )
+        False
+        """
+        fingerprint = media_fingerprint(media)
+        if fingerprint is None:
+            return None
+        key = f"{fingerprint}.{fn_imagehash.name}.{FRAME_SIZE}"
+        if decode_profile is not None and decode_profile.digest:
+            key += f".{decode_profile.digest}"
+        return key
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.phash"
+
+    @staticmethod
+    def _touch(cached_path: Path) -> None:
+        # last access for the LRU eviction (precise clock, not the filesystem one)
+        now_ns = time.time_ns()
+        os.utime(cached_path, ns=(now_ns, now_ns))
+
+    def get(self, key: Optional[str]) -> Optional[bytes]:
+        if key is None:
+            return None
+        cached_path = self._path(key)
+        try:
+            imghashes = cached_path.read_bytes()
+            self._touch(cached_path)
+        except FileNotFoundError:
+            return None
+        logger.debug(f"images hashes found in cache: {cached_path}")
+        return imghashes
+
+    def put(self, key: Optional[str], imghashes: bytes) -> None:
+        if key is None or len(imghashes) > self.max_size:
+            return
+        # atomic write: readers never see a partial file
+        with tempfile.NamedTemporaryFile(
+            dir=self.cache_dir, suffix=".tmp", delete=False
+        ) as fo:
+            fo.write(imghashes)
+        os.replace(fo.name, self._path(key))
+        self._touch(self._path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used files until the cache size is bounded"""
+        cached_files = []
+        for cached_path in self.cache_dir.glob("*.phash"):
+            try:
+                cached_files.append((cached_path.stat(), cached_path))
+            except FileNotFoundError:
+                continue
+        cache_size = sum(cached_stat.st_size for cached_stat, _ in cached_files)
+        for cached_stat, cached_path in sorted(
+            cached_files, key=lambda cached_file: cached_file[0].st_mtime_ns
+        ):
+            if cache_size <= self.max_size:
+                break
+            cached_path.unlink(missing_ok=True)
+            cache_size -= cached_stat.st_size
@@ -1,36 +1,233 @@
+import binascii
+import math
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import AbstractContextManager, ExitStack, closing, nullcontext
+from dataclasses import replace
 from functools import partial
-from io import BufferedReader, BytesIO
+from io import BufferedReader, BytesIO  # noqa: F401 (used by the doctests)
+from itertools import chain, repeat
 from pathlib import Path
 
 # https://pypi.org/project/click-pathlib/
 from tempfile import gettempdir
-from typing import Iterable, Optional, Union
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Final,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+import numpy as np
+import numpy.typing as npt
 from imagehash import ImageHash
+from loguru import logger
 from rich import get_console
+from rich.progress import Progress
 
-from vhcalc.models import URL, ImageHashingFunction
-from vhcalc.services.reader_frames import build_reader_frames
-from vhcalc.tools.chunk import chunks
-from vhcalc.tools.imghash import bytes_to_imghash, imghash_to_bytes, rawframe_to_imghash
-from vhcalc.tools.progress_bar import configure_progress_bar
+from vhcalc.models import (
+    URL,
+    DecodeProfile,
+    FrameSampling,
+    ImageHashingFunction,
+    PhashHeader,
+)
+from vhcalc.services.cache import ImageHashesCache, media_fingerprint
+from vhcalc.services.phash_file import PhashFile
+from vhcalc.services.probe import probe_media_metadata
+from vhcalc.services.reader_frames import build_reader_frame_blocks
+from vhcalc.services.sampling import build_sampled_reader_frame_blocks
+from vhcalc.services.segments import (
+    segments_to_imghashes,
+    split_media_into_segments,
+)
+from vhcalc.services.shm_hashing import shm_hash_frame_blocks
+from vhcalc.tools.hash_sink import HashSink
+from vhcalc.tools.imghash import (
+    FRAME_SIZE,
+    imghashes_as_uint64,
+    rawframes_to_imghashes,
+    uint64_to_imghash,
+)
+from vhcalc.tools.metrics import PipelineMetrics
+from vhcalc.tools.phash_container import PhashContainerSink
+from vhcalc.tools.pipeline import (
+    DEFAULT_MAX_PENDING,
+    pipelined_map,
+    ring_buffer_size,
+)
+from vhcalc.tools.progress_bar import add_progress_task, configure_progress_bar
 
 console = get_console()
 
+NB_FRAMES_TO_VERIFY_ON_RESUME: Final[int] = 3
 
-def b2b_stream_to_imghash(
+
+def b2u_stream_to_imghashes(
     # FIXME: ugly need to refactor
     binary_stream: Union[BufferedReader, URL],
     chunk_size_in_frames: int = 15 * 25,
     fn_imagehash: ImageHashingFunction = ImageHashingFunction.PerceptualHashing,
-) -> Iterable[bytes]:
+    cache: Optional[ImageHashesCache] = None,
+    sampling: Optional[FrameSampling] = None,
+    decode_profile: Optional[DecodeProfile] = None,
+    metrics: Optional[PipelineMetrics] = None,
+    hashing_workers: int = 0,
+    hashing_processes: int = 0,
+) -> Iterator[npt.NDArray[np.uint64]]:
     """
-    Compute images hashes from file (media/video) binary content stream (send to ffmpeg)
+    Compute images hashes from file (media/video) binary content stream (send to ffmpeg),
+    by chunks of (big-endian) 64 bits integers (see `imghashes_as_uint64`): no Python
+    object is created per frame.
 
     Args:
         binary_stream (BufferedReader): binary stream read from media file input
         chunk_size_in_frames (int): Chunk size in frames used for generating images hashes from media decompression.
         fn_imagehash (ImageHashingFunction): ImageHash function for transforming PIL.Image to ImageHash
+        cache (Optional[ImageHashesCache]): cache of images hashes, used (and filled)
+            if the binary stream is file-backed.
+        sampling (Optional[FrameSampling]): only hash the sampled frames (not cached),
+            see `b2u_stream_to_timestamped_imghashes` to get their timestamps.
+        decode_profile (Optional[DecodeProfile]): ffmpeg decoding options
+            (see `vhcalc.models.DECODE_PROFILES`).
+        metrics (Optional[PipelineMetrics]): metrics where the time spent in each
+            stage (cache, read, hash) is recorded.
+        hashing_workers (int): if set, the chunks of frames are read (from ffmpeg)
+            in a reader thread and hashed by a pool of `hashing_workers` threads, so
+            decoding and hashing overlap (see `vhcalc.tools.pipeline`). Else they
+            are read and hashed in the calling thread.
+        hashing_processes (int): if set, the chunks of frames are read into a shared
+            memory and hashed (in place) by a pool of `hashing_processes` processes
+            (see `vhcalc.services.shm_hashing`), instead of `hashing_workers`
+            threads.
+
+    Yields:
+        npt.NDArray[np.uint64]: images hashes of the next chunk of frames
+
+    Example:
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> chunk_imghashes = next(b2u_stream_to_imghashes(media_path.open("rb")))
+        >>> len(chunk_imghashes), hex(chunk_imghashes[0])
+        (375, '0xd5d52ad52ad42ad4')
+    """
+    if sampling is not None:
+        for chunk_imghashes, _ in b2u_stream_to_timestamped_imghashes(
+            binary_stream,
+            sampling,
+            chunk_size_in_frames,
+            fn_imagehash,
+            decode_profile,
+            metrics,
+        ):
+            yield chunk_imghashes
+        return
+
+    metrics = metrics or PipelineMetrics(str(binary_stream))
+    cache_key = (
+        cache.key(binary_stream, fn_imagehash, decode_profile)
+        if cache is not None and not isinstance(binary_stream, URL)
+        else None
+    )
+    with metrics.timed("cache"):
+        cached_imghashes = cache.get(cache_key) if cache is not None else None
+    if cached_imghashes is not None:
+        yield imghashes_as_uint64(cached_imghashes)
+        return
+
+    with ExitStack() as stack:
+        gen_chunk_imghashes: Iterator[npt.NDArray[np.uint64]]
+        if hashing_processes:
+            # closed (i.e. the shared memory released) with this generator
+            gen_chunk_imghashes = stack.enter_context(
+                closing(
+                    shm_hash_frame_blocks(
+                        binary_stream,
+                        chunk_size_in_frames,
+                        hashing_processes,
+                        fn_imagehash,
+                        decode_profile,
+                        metrics=metrics,
+                    )
+                )
+            )
+        else:
+            gen_chunk_imghashes = _gen_stream_chunk_imghashes(
+                stack,
+                binary_stream,
+                chunk_size_in_frames,
+                partial(_hash_chunk_frames, fn_imagehash=fn_imagehash, metrics=metrics),
+                decode_profile,
+                metrics,
+                hashing_workers,
+            )
+        imghashes_to_cache = []
+        for chunk_imghashes in gen_chunk_imghashes:
+            if cache_key is not None:
+                imghashes_to_cache.append(chunk_imghashes.tobytes())
+            yield chunk_imghashes
+    if cache is not None:
+        # only complete images hashes (all the stream is hashed) are cached
+        with metrics.timed("cache"):
+            cache.put(cache_key, b"".join(imghashes_to_cache))
+
+
+def _gen_stream_chunk_imghashes(
+    stack: ExitStack,
+    binary_stream: Union[BufferedReader, URL],
+    chunk_size_in_frames: int,
+    fn_hash_chunk_frames: Callable[[npt.NDArray[np.uint8]], npt.NDArray[np.uint64]],
+    decode_profile: Optional[DecodeProfile],
+    metrics: PipelineMetrics,
+    hashing_workers: int,
+) -> Iterator[npt.NDArray[np.uint64]]:
+    # Read a video file (by chunks of frames)
+    max_pending = DEFAULT_MAX_PENDING * hashing_workers
+    it_reader_chunk_frames, _ = build_reader_frame_blocks(
+        binary_stream,
+        nb_frames_per_block=chunk_size_in_frames,
+        nb_blocks_in_ring_buffer=(
+            ring_buffer_size(max_pending) if hashing_workers else 2
+        ),
+        decode_profile=decode_profile,
+        metrics=metrics,
+    )
+    it_reader_chunk_frames = metrics.timed_iter(
+        "read", it_reader_chunk_frames, count=len
+    )
+    # for each chunk of frames: compute (in batch) the images hashes
+    if hashing_workers:
+        hashing_executor = stack.enter_context(
+            ThreadPoolExecutor(hashing_workers, thread_name_prefix="hasher")
+        )
+        return pipelined_map(
+            fn_hash_chunk_frames,
+            it_reader_chunk_frames,
+            hashing_executor,
+            max_pending=max_pending,
+            metrics=metrics,
+        )
+    return map(fn_hash_chunk_frames, it_reader_chunk_frames)
+
+
+def b2b_stream_to_imghash(
+    binary_stream: Union[BufferedReader, URL],
+    chunk_size_in_frames: int = 15 * 25,
+    fn_imagehash: ImageHashingFunction = ImageHashingFunction.PerceptualHashing,
+    cache: Optional[ImageHashesCache] = None,
+    sampling: Optional[FrameSampling] = None,
+    decode_profile: Optional[DecodeProfile] = None,
+    metrics: Optional[PipelineMetrics] = None,
+    hashing_workers: int = 0,
+    hashing_processes: int = 0,
+) -> Iterable[bytes]:
+    """
+    Same as `b2u_stream_to_imghashes`, but image hash by image hash (as bytes).
 
     Yields:
         Iterable[bytes]: The next binary image hash from media input stream
@@ -40,20 +237,180 @@ def b2b_stream_to_imghash(
         >>> next(b2b_stream_to_imghash(media_path.open("rb")))
         b'\xd5\xd5*\xd5*\xd4*\xd4'
     """
-    # Read a video file
-    it_reader_frame, _ = build_reader_frames(binary_stream)
-    chunk_size = chunk_size_in_frames
+    for chunk_imghashes in b2u_stream_to_imghashes(
+        binary_stream,
+        chunk_size_in_frames,
+        fn_imagehash,
+        cache,
+        sampling,
+        decode_profile,
+        metrics,
+        hashing_workers,
+        hashing_processes,
+    ):
+        bin_imghashes = chunk_imghashes.tobytes()
+        for offset in range(0, len(bin_imghashes), 8):
+            yield bin_imghashes[offset : offset + 8]
+
+
+def b2u_stream_to_multi_imghashes(
+    binary_stream: Union[BufferedReader, URL],
+    fn_imagehashes: Sequence[ImageHashingFunction],
+    chunk_size_in_frames: int = 15 * 25,
+    decode_profile: Optional[DecodeProfile] = None,
+    metrics: Optional[PipelineMetrics] = None,
+    hashing_workers: int = 0,
+) -> Iterator[npt.NDArray[np.uint64]]:
+    """
+    Compute the images hashes of many ImageHash functions from a single decoding of
+    a media binary stream: each chunk of frames is hashed by all the functions.
+
+    The images hashes of a chunk are in columns (one per ImageHash function, in the
+    `fn_imagehashes` order): written as bytes, the images hashes of a frame are
+    contiguous (a multi-columns fingerprint stream, with `len(fn_imagehashes) * 8`
+    bytes per frame).
+
+    Args:
+        binary_stream (BufferedReader): binary stream read from media file input
+        fn_imagehashes (Sequence[ImageHashingFunction]): ImageHash functions
+        chunk_size_in_frames (int): Chunk size in frames
+        decode_profile (Optional[DecodeProfile]): ffmpeg decoding options
+        metrics (Optional[PipelineMetrics]): metrics of the read and hash stages
+        hashing_workers (int): see `b2u_stream_to_imghashes`
 
-    # configure chunk
-    gen_imghashes = map(
-        partial(rawframe_to_imghash, fn_imagehash=fn_imagehash), it_reader_frame
+    Yields:
+        npt.NDArray[np.uint64]: images hashes of the next chunk of frames, with shape
+            (nb_frames, len(fn_imagehashes))
+
+    Example:
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> chunk_imghashes = next(b2u_stream_to_multi_imghashes(
+        ...     media_path.open("rb"),
+        ...     [ImageHashingFunction.PerceptualHashing, ImageHashingFunction.DifferenceHashing],
+        ... ))
+        >>> chunk_imghashes.shape, [hex(imghash) for imghash in chunk_imghashes[0]]
+        ((375, 2), ['0xd5d52ad52ad42ad4', '0x202020202020202'])
+    """
+    metrics = metrics or PipelineMetrics(str(binary_stream))
+    with ExitStack() as stack:
+        yield from _gen_stream_chunk_imghashes(
+            stack,
+            binary_stream,
+            chunk_size_in_frames,
+            partial(
+                _multi_hash_chunk_frames, fn_imagehashes=fn_imagehashes, metrics=metrics
+            ),
+            decode_profile,
+            metrics,
+            hashing_workers,
+        )
+
+
+def b2u_stream_to_timestamped_imghashes(
+    binary_stream: Union[BufferedReader, URL],
+    sampling: FrameSampling,
+    chunk_size_in_frames: int = 15 * 25,
+    fn_imagehash: ImageHashingFunction = ImageHashingFunction.PerceptualHashing,
+    decode_profile: Optional[DecodeProfile] = None,
+    metrics: Optional[PipelineMetrics] = None,
+) -> Iterator[Tuple[npt.NDArray[np.uint64], npt.NDArray[np.float64]]]:
+    """
+    Compute images hashes of the sampled frames of a media binary stream, by chunks
+    (see `b2u_stream_to_imghashes`)
+
+    Args:
+        binary_stream (BufferedReader): binary stream read from media file input
+        sampling (FrameSampling): frames to sample (and hash)
+        chunk_size_in_frames (int): Chunk size in (decoded) frames
+        fn_imagehash (ImageHashingFunction): ImageHash function
+        decode_profile (Optional[DecodeProfile]): ffmpeg decoding options
+        metrics (Optional[PipelineMetrics]): metrics of the read and hash stages
+
+    Yields:
+        Tuple[npt.NDArray[np.uint64], npt.NDArray[np.float64]]: images hashes of the
+            next chunk of sampled frames and their timestamps (in seconds, from the
+            first frame)
+    """
+    it_reader_chunk_frames, _ = build_sampled_reader_frame_blocks(
+        binary_stream,
+        sampling,
+        nb_frames_per_block=chunk_size_in_frames,
+        decode_profile=decode_profile,
     )
-    gen_chunk_imghashes = chunks(gen_imghashes, chunk_size)
-    # for each chunk of frames
-    for chunk_imghashes in gen_chunk_imghashes:
-        for bin_imghash in map(imghash_to_bytes, chunk_imghashes):
-            # and write (chunk of) images hashes result on export file
-            yield bin_imghash
+    metrics = metrics or PipelineMetrics(str(binary_stream))
+    for chunk_frames, chunk_timestamps in metrics.timed_iter(
+        "read", it_reader_chunk_frames, count=lambda chunk: len(chunk[0])
+    ):
+        yield _hash_chunk_frames(
+            chunk_frames, fn_imagehash=fn_imagehash, metrics=metrics
+        ), chunk_timestamps
+
+
+def b2b_stream_to_timestamped_imghash(
+    binary_stream: Union[BufferedReader, URL],
+    sampling: FrameSampling,
+    chunk_size_in_frames: int = 15 * 25,
+    fn_imagehash: ImageHashingFunction = ImageHashingFunction.PerceptualHashing,
+    decode_profile: Optional[DecodeProfile] = None,
+    metrics: Optional[PipelineMetrics] = None,
+) -> Iterator[Tuple[float, bytes]]:
+    """
+    Same as `b2u_stream_to_timestamped_imghashes`, but sampled frame by sampled frame
+
+    Yields:
+        Tuple[float, bytes]: timestamp (in seconds, from the first frame) and binary
+            image hash of the next sampled frame
+
+    Example:
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> it_imghash = b2b_stream_to_timestamped_imghash(
+        ...     media_path.open("rb"), FrameSampling(keyframes=True)
+        ... )
+        >>> next(it_imghash)
+        (0.0, b'\xd5\xd5*\xd5*\xd4*\xd4')
+        >>> next(it_imghash)[0]
+        7.0
+    """
+    for chunk_imghashes, chunk_timestamps in b2u_stream_to_timestamped_imghashes(
+        binary_stream,
+        sampling,
+        chunk_size_in_frames,
+        fn_imagehash,
+        decode_profile,
+        metrics,
+    ):
+        bin_imghashes = chunk_imghashes.tobytes()
+        for index, timestamp in enumerate(chunk_timestamps.tolist()):
+            yield timestamp, bin_imghashes[index * 8 : (index + 1) * 8]
+
+
+def read_imghashes(
+    binary_stream: BinaryIO,
+    chunk_size: int = 1024 * 1024,
+) -> Iterator[npt.NDArray[np.uint64]]:
+    """
+    Read binary images hashes by chunks of (big-endian) 64 bits integers.
+
+    Args:
+        binary_stream (BinaryIO): binary stream of images hashes
+        chunk_size (int): size (in bytes) of the blocks read from the binary stream
+
+    Yields:
+        npt.NDArray[np.uint64]: images hashes of the next block
+
+    Examples:
+        >>> bin_imghashes = b'\\xd5\\xd5*\\xd5*\\xd4*\\xd4' * 3
+        >>> [len(chunk) for chunk in read_imghashes(BytesIO(bin_imghashes), chunk_size=20)]
+        [2, 1]
+    """
+    remaining_bytes = b""
+    while chunk_bin_imghashes := binary_stream.read(chunk_size):
+        chunk_bin_imghashes = remaining_bytes + chunk_bin_imghashes
+        # an image hash can be split between two blocks
+        nb_bytes = len(chunk_bin_imghashes) // 8 * 8
+        remaining_bytes = chunk_bin_imghashes[nb_bytes:]
+        if nb_bytes:
+            yield imghashes_as_uint64(chunk_bin_imghashes[:nb_bytes])
 
 
 def a2b_imghash(
@@ -61,10 +418,12 @@ def a2b_imghash(
     chunk_size: int = 8 * 1024,
 ) -> Iterable[ImageHash]:
     """
+    Read binary images hashes as `ImageHash` (see `read_imghashes` to read them
+    without creating Python objects per image hash).
 
     Args:
         binary_stream (BufferedReader): expected binary stream to read compatible with images hashes binary format.
-        chunk_size: size (in bits) used for chunk reading from input stream
+        chunk_size: size (in bytes) used for chunk reading from input stream
 
     Returns:
 
@@ -75,10 +434,320 @@ def a2b_imghash(
         >>> str(imghash_reconstructed)
         'd5d52ad52ad42ad4'
     """
-    while chunk_bin_imghash := binary_stream.read(chunk_size):
-        stream_bin_imghash = BytesIO(chunk_bin_imghash)
-        while bin_imghash := stream_bin_imghash.read(8):
-            yield bytes_to_imghash(bin_imghash)
+    for chunk_imghashes in read_imghashes(binary_stream, chunk_size):
+        yield from map(uint64_to_imghash, chunk_imghashes.tolist())
+
+
+DECOMPRESS_FORMATS: Final[dict[str, dict[bool, Tuple[str, str]]]] = {
+    # output format: (with timestamps?) header (formatted with the columns names) and
+    # template of a line, formatted with the frame index, its timestamp and its
+    # (hexadecimal) images hashes columns
+    "csv": {
+        True: ("frame,timestamp,{}\n", "{0},{1:.6f},{2}\n"),
+        False: ("frame,{}\n", "{0},{2}\n"),
+    },
+    "ndjson": {
+        True: ("", '{{"frame":{0},"timestamp":{1:.6f},{2}}}\n'),
+        False: ("", '{{"frame":{0},{2}}}\n'),
+    },
+}
+# output format: template of a column, formatted with its name and its image hash
+DECOMPRESS_COLUMN_FORMATS: Final[dict[str, str]] = {
+    "csv": "{1}",
+    "ndjson": '"{0}":"{1}"',
+}
+
+
+def b2a_imghash(
+    binary_stream: BinaryIO,
+    output_format: str = "hex",
+    fps: Optional[float] = None,
+    chunk_size: int = 1024 * 1024,
+    columns: Sequence[str] = ("imghash",),
+) -> Iterator[bytes]:
+    """
+    Convert (in bulk) binary images hashes to text.
+
+    Args:
+        binary_stream (BinaryIO): binary stream of images hashes
+        output_format (str): "hex" (concatenated hexadecimal images hashes),
+            "csv" or "ndjson" (one line per frame, with its index and timestamp)
+        fps (Optional[float]): frame rate of the hashed media, to compute timestamps
+            (the timestamp column is omitted if not given)
+        chunk_size (int): size (in bytes) of the blocks read from the binary stream
+        columns (Sequence[str]): names of the images hashes of a frame, written one
+            after the other in the binary stream (e.g. one per image hashing method,
+            see `b2u_stream_to_multi_imghashes`)
+
+    Yields:
+        bytes: text of each block of images hashes
+
+    Examples:
+        >>> bin_imghashes = b'\\xd5\\xd5*\\xd5*\\xd4*\\xd4' * 2
+        >>> b"".join(b2a_imghash(BytesIO(bin_imghashes)))
+        b'd5d52ad52ad42ad4d5d52ad52ad42ad4'
+        >>> print(b"".join(b2a_imghash(BytesIO(bin_imghashes), "csv", fps=25)).decode())
+        frame,timestamp,imghash
+        0,0.000000,d5d52ad52ad42ad4
+        1,0.040000,d5d52ad52ad42ad4
+        <BLANKLINE>
+        >>> print(b"".join(b2a_imghash(BytesIO(bin_imghashes), "ndjson")).decode())
+        {"frame":0,"imghash":"d5d52ad52ad42ad4"}
+        {"frame":1,"imghash":"d5d52ad52ad42ad4"}
+        <BLANKLINE>
+        >>> print(
+        ...     b"".join(
+        ...         b2a_imghash(BytesIO(bin_imghashes), "csv", columns=("phash", "dhash"))
+        ...     ).decode()
+        ... )
+        frame,phash,dhash
+        0,d5d52ad52ad42ad4,d5d52ad52ad42ad4
+        <BLANKLINE>
+    """
+    if output_format != "hex" and output_format not in DECOMPRESS_FORMATS:
+        raise ValueError(f"Unknown decompress format: {output_format}")
+    header, template = DECOMPRESS_FORMATS.get(output_format, {}).get(
+        bool(fps), ("", "")
+    )
+    if header:
+        yield header.format(",".join(columns)).encode()
+    column_template = DECOMPRESS_COLUMN_FORMATS.get(output_format, "")
+    frame_size = len(columns) * 8
+
+    nb_frames_read = 0
+    remaining_bytes = b""
+    while chunk_bin_imghashes := binary_stream.read(chunk_size):
+        chunk_bin_imghashes = remaining_bytes + chunk_bin_imghashes
+        # the images hashes of a frame can be split between two blocks
+        nb_bytes = len(chunk_bin_imghashes) // frame_size * frame_size
+        remaining_bytes = chunk_bin_imghashes[nb_bytes:]
+        hex_imghashes = binascii.hexlify(chunk_bin_imghashes[:nb_bytes])
+        if output_format == "hex":
+            yield hex_imghashes
+            continue
+
+        nb_frames = nb_bytes // frame_size
+        frames = range(nb_frames_read, nb_frames_read + nb_frames)
+        timestamps = (np.asarray(frames) / fps).tolist() if fps else repeat(None)
+        str_hex_imghashes = hex_imghashes.decode()
+        frames_columns = (
+            ",".join(
+                column_template.format(column, str_hex_imghashes[i : i + 16])
+                for column, i in zip(
+                    columns, range(offset, offset + frame_size * 2, 16)
+                )
+            )
+            for offset in range(0, nb_bytes * 2, frame_size * 2)
+        )
+        yield "".join(map(template.format, frames, timestamps, frames_columns)).encode()
+        nb_frames_read += nb_frames
+
+
+def _gen_chunk_imghashes(
+    input_media: Path,
+    chunk_size: int,
+    jobs: int = 1,
+    start_frame: int = 0,
+    hashing_executor: Optional[Executor] = None,
+    decode_profile: Optional[DecodeProfile] = None,
+    metrics: Optional[PipelineMetrics] = None,
+    hashing_processes: int = 0,
+) -> Iterator[npt.NDArray[np.uint64]]:
+    metrics = metrics or PipelineMetrics(str(input_media))
+    if jobs > 1:
+        # decode and hash segments of the media in parallel (the read and hash stages
+        # run in the pool processes: only the wait for their results is recorded)
+        return map(
+            imghashes_as_uint64,
+            metrics.timed_iter(
+                "segments",
+                segments_to_imghashes(
+                    input_media,
+                    jobs=jobs,
+                    nb_frames_per_block=chunk_size,
+                    start_frame=start_frame,
+                    decode_profile=decode_profile,
+                ),
+                count=len,
+            ),
+        )
+
+    segment = (
+        split_media_into_segments(input_media, 1, start_frame=start_frame)[0]
+        if start_frame
+        else None
+    )
+    if hashing_processes:
+        # the chunks of frames are hashed in place, in a shared memory
+        return shm_hash_frame_blocks(
+            input_media,
+            chunk_size,
+            hashing_processes,
+            decode_profile=decode_profile,
+            segment=segment,
+            metrics=metrics,
+        )
+
+    # Read a video file
+    it_reader_chunk_frames, _ = build_reader_frame_blocks(
+        input_media,
+        nb_frames_per_block=chunk_size,
+        nb_blocks_in_ring_buffer=(
+            ring_buffer_size(DEFAULT_MAX_PENDING) if hashing_executor else 2
+        ),
+        segment=segment,
+        decode_profile=decode_profile,
+    )
+
+    it_reader_chunk_frames = metrics.timed_iter(
+        "read", it_reader_chunk_frames, count=len
+    )
+    fn_hash_chunk_frames = partial(_hash_chunk_frames, metrics=metrics)
+    if hashing_executor is not None:
+        # read the next chunks of frames while the previous ones are hashed
+        return pipelined_map(
+            fn_hash_chunk_frames,
+            it_reader_chunk_frames,
+            hashing_executor,
+            metrics=metrics,
+        )
+    # for each chunk of frames: compute (in batch) the images hashes
+    return map(fn_hash_chunk_frames, it_reader_chunk_frames)
+
+
+def _gen_sampled_chunk_imghashes(
+    input_media: Path,
+    chunk_size: int,
+    sampling: FrameSampling,
+    hashing_executor: Optional[Executor] = None,
+    decode_profile: Optional[DecodeProfile] = None,
+    metrics: Optional[PipelineMetrics] = None,
+) -> Iterator[Tuple[npt.NDArray[np.uint64], npt.NDArray[np.float64]]]:
+    metrics = metrics or PipelineMetrics(str(input_media))
+    it_reader_chunk_frames, _ = build_sampled_reader_frame_blocks(
+        input_media,
+        sampling,
+        nb_frames_per_block=chunk_size,
+        decode_profile=decode_profile,
+    )
+    for chunk_frames, chunk_timestamps in metrics.timed_iter(
+        "read", it_reader_chunk_frames, count=lambda chunk: len(chunk[0])
+    ):
+        yield _hash_chunk_frames(
+            chunk_frames, hashing_executor, metrics=metrics
+        ), chunk_timestamps
+
+
+def _hash_chunk_frames(
+    raw_frames: npt.NDArray[np.uint8],
+    hashing_executor: Optional[Executor] = None,
+    fn_imagehash: ImageHashingFunction = ImageHashingFunction.PerceptualHashing,
+    metrics: Optional[PipelineMetrics] = None,
+) -> npt.NDArray[np.uint64]:
+    with metrics.timed("hash", len(raw_frames)) if metrics else nullcontext():
+        if hashing_executor is None:
+            imghashes = rawframes_to_imghashes(raw_frames, fn_imagehash=fn_imagehash)
+        else:
+            # wait for the result: the chunk of frames is a view into the reader buffer
+            imghashes = hashing_executor.submit(
+                rawframes_to_imghashes, raw_frames, fn_imagehash=fn_imagehash
+            ).result()
+        return imghashes_as_uint64(imghashes)
+
+
+def _multi_hash_chunk_frames(
+    raw_frames: npt.NDArray[np.uint8],
+    fn_imagehashes: Sequence[ImageHashingFunction],
+    metrics: Optional[PipelineMetrics] = None,
+) -> npt.NDArray[np.uint64]:
+    # the chunk of frames is hashed by each function, in (big-endian) columns
+    imghashes = np.empty((len(raw_frames), len(fn_imagehashes)), dtype=">u8")
+    for column, fn_imagehash in enumerate(fn_imagehashes):
+        imghashes[:, column] = _hash_chunk_frames(
+            raw_frames, fn_imagehash=fn_imagehash, metrics=metrics
+        )
+    return imghashes
+
+
+def timestamps_file(output_file: Path) -> Path:
+    """sidecar file of the timestamps (little-endian float64, in seconds) of the
+    images hashes exported (from sampled frames) in `output_file`"""
+    return output_file.with_name(f"{output_file.name}.pts")
+
+
+def _is_reusable_container(output_file: Path, header: PhashHeader) -> bool:
+    """the output file is a (complete) container exported with the same header (from
+    the same media content, with the same decoding options)"""
+    if header.source_fingerprint is None or not output_file.is_file():
+        return False
+    try:
+        with PhashFile(output_file) as phash_file:
+            exported_header = phash_file.header
+    except ValueError:
+        return False
+    return (
+        exported_header is not None
+        and replace(exported_header, nb_frames=header.nb_frames) == header
+    )
+
+
+def _sampling_name(sampling: FrameSampling) -> str:
+    """name of a sampling mode in the default export filename"""
+    if sampling.fps:
+        return f"{float(sampling.fps)}fps"
+    return "keyframes" if sampling.keyframes else "scene"
+
+
+def _resume_chunk_imghashes(
+    input_media: Path,
+    output_file: Path,
+    chunk_size: int,
+    jobs: int = 1,
+    hashing_executor: Optional[Executor] = None,
+    decode_profile: Optional[DecodeProfile] = None,
+    metrics: Optional[PipelineMetrics] = None,
+    hashing_processes: int = 0,
+) -> Optional[Tuple[int, Iterator[npt.NDArray[np.uint64]]]]:
+    """Resume images hashes from the end of a partial export file.
+
+    The last images hashes exported are computed again (from a seek on the matching
+    timestamp) to check the partial export is consistent with the media.
+
+    Returns:
+        Optional[Tuple[int, Iterator[np.ndarray]]]: the number of frames already exported
+            and the missing images hashes, or None if the export can't be resumed.
+    """
+    nb_frames_exported = output_file.stat().st_size // 8
+    nb_frames_to_verify = min(nb_frames_exported, NB_FRAMES_TO_VERIFY_ON_RESUME)
+    start_frame = nb_frames_exported - nb_frames_to_verify
+    try:
+        gen_chunk_imghashes = _gen_chunk_imghashes(
+            input_media,
+            chunk_size,
+            jobs,
+            start_frame,
+            hashing_executor,
+            decode_profile,
+            metrics,
+            hashing_processes,
+        )
+        first_chunk_imghashes = next(gen_chunk_imghashes)
+    except (ValueError, StopIteration):
+        logger.warning(f"Can't resume export of {input_media} from {output_file}")
+        return None
+
+    with output_file.open("rb") as fo:
+        fo.seek(start_frame * 8)
+        imghashes_exported = fo.read(nb_frames_to_verify * 8)
+    if first_chunk_imghashes[:nb_frames_to_verify].tobytes() != imghashes_exported:
+        logger.warning(f"{output_file} doesn't match (the end of) {input_media}")
+        return None
+
+    # drop an incomplete (last) image hash
+    os.truncate(output_file, nb_frames_exported * 8)
+    return nb_frames_exported, chain(
+        [first_chunk_imghashes[nb_frames_to_verify:]], gen_chunk_imghashes
+    )
 
 
 def export_imghash_from_media(
@@ -86,6 +755,18 @@ def export_imghash_from_media(
     output_file: Optional[Path] = None,
     chunk_nb_seconds: int = 15,
     unlink_export_file: bool = True,
+    jobs: int = 1,
+    output_dir: Optional[Path] = None,
+    progress_bar: Optional[Progress] = None,
+    hashing_executor: Optional[Executor] = None,
+    resume: bool = False,
+    cache: Optional[ImageHashesCache] = None,
+    fsync_on_checkpoint: bool = False,
+    sampling: Optional[FrameSampling] = None,
+    container: bool = False,
+    decode_profile: Optional[DecodeProfile] = None,
+    metrics: Optional[PipelineMetrics] = None,
+    hashing_processes: int = 0,
 ) -> Path:
     """
     Export images hashes from media (readable with ffmpeg)
@@ -95,13 +776,45 @@ def export_imghash_from_media(
         output_file (Optional[Path]): Path object for the output file. If not given, a temporary file is created.
         chunk_nb_seconds (int): Chunk size in seconds used for generating images hashes from media decompression.
         unlink_export_file (bool): Option for apply Path.unlink() on output file.
+        jobs (int): if greater than 1, the media is split into `jobs` segments decoded
+            and hashed in parallel (in a pool of `jobs` processes).
+        output_dir (Optional[Path]): directory of the output file (if not given),
+            default to the temporary directory.
+        progress_bar (Optional[Progress]): (started) progress bar shared between exports,
+            a new one is created and started if not given.
+        hashing_executor (Optional[Executor]): executor (shared between exports) where
+            chunks of frames are hashed, they are hashed in the calling thread if not given.
+        resume (bool): if the output file exists, resume the export from its end
+            (the output file is exported again if it doesn't match the media).
+        cache (Optional[ImageHashesCache]): cache of images hashes: if the media is
+            cached, the output file is written from the cache (without decoding the
+            media), else the cache is filled with the output file once exported.
+        fsync_on_checkpoint (bool): flush the output file to the disk after each chunk
+            of images hashes written (crash safety for a later `resume`).
+        sampling (Optional[FrameSampling]): only export the images hashes of the
+            sampled frames, with their timestamps written in a sidecar file
+            (see `timestamps_file`). Not available with `jobs`, `resume` or `cache`.
+        container (bool): write the images hashes (and their timestamps) in a container
+            (see `vhcalc.tools.phash_container`) with the media fingerprint: an existing
+            container exported (with the same options) from the same media is reused.
+            Not available with `resume`.
+        decode_profile (Optional[DecodeProfile]): ffmpeg decoding options
+            (see `vhcalc.models.DECODE_PROFILES`).
+        metrics (Optional[PipelineMetrics]): metrics where the time spent (and the
+            number of frames processed) in each stage of the export is recorded
+            (see `vhcalc.tools.metrics`).
+        hashing_processes (int): if set (and `jobs` is 1), the chunks of frames are
+            hashed in place in a shared memory by a pool of `hashing_processes`
+            processes (see `vhcalc.services.shm_hashing`), instead of
+            `hashing_executor`. Not available with `sampling`.
 
     Returns:
         pathlib.Path: Path for the output file that contain binary images hashes.
 
     """
-    # Read a video file
-    it_reader_frame, media_metadata = build_reader_frames(input_media)
+    metrics = metrics or PipelineMetrics(str(input_media))
+    with metrics.timed("probe"):
+        media_metadata = probe_media_metadata(input_media)
     nb_frames_to_read = media_metadata.nb_frames
     chunk_size = int(media_metadata.fps * chunk_nb_seconds)
 
@@ -109,36 +822,169 @@ def export_imghash_from_media(
     console.print(f"Number of frames to read: {nb_frames_to_read}")
     console.print(f"Chunk size (nb frames): {chunk_size}")
 
+    if sampling is not None:
+        for option, is_set in (
+            ("jobs", jobs > 1),
+            ("resume", resume),
+            ("cache", cache is not None),
+        ):
+            if is_set:
+                logger.warning(f"Option {option} is ignored with sampling {sampling}")
+        jobs, resume, cache = 1, False, None
+        if sampling.fps:
+            nb_frames_to_read = math.ceil(media_metadata.duration * sampling.fps)
+        console.print(f"Sampling: {sampling}")
+    if container and resume:
+        logger.warning("Option resume is ignored with container")
+        resume = False
+
     # manage export
+    extension = "vhc" if container else "phash"
     if not output_file:
         # https://bandit.readthedocs.io/en/latest/plugins/b108_hardcoded_tmp_directory.html
-        output_file = (
-            Path(gettempdir()) / f"{input_media.name}.{media_metadata.fps}fps.phash"
+        output_file = Path(output_dir or gettempdir()) / (
+            f"{input_media.name}.{_sampling_name(sampling)}.{extension}"
+            if sampling is not None
+            else f"{input_media.name}.{media_metadata.fps}fps.{extension}"
+        )
+
+    header = (
+        PhashHeader(
+            method=ImageHashingFunction.PerceptualHashing.name,
+            frame_size=FRAME_SIZE,
+            fps=(sampling.fps if sampling is not None else media_metadata.fps),
+            duration=media_metadata.duration,
+            sampling=str(sampling or ""),
+            source_fingerprint=media_fingerprint(input_media),
+            has_pts=sampling is not None,
+            decode_profile=(decode_profile or DecodeProfile()).digest,
         )
+        if container
+        else None
+    )
+    if header is not None and _is_reusable_container(output_file, header):
+        console.print(f"Images hashes already exported, output_file: {output_file}")
+        return output_file
 
-    # remove/unlink export file if exist
-    if unlink_export_file:
-        output_file.unlink(missing_ok=True)
+    cache_key = (
+        cache.key(input_media, decode_profile=decode_profile)
+        if cache is not None
+        else None
+    )
+    with metrics.timed("cache"):
+        cached_imghashes = cache.get(cache_key) if cache is not None else None
+    if cached_imghashes is not None:
+        console.print(f"Images hashes found in cache, output_file: {str(output_file)}")
+        if header is not None:
+            with PhashContainerSink(output_file, header) as container_sink:
+                container_sink.write(cached_imghashes)
+        else:
+            output_file.write_bytes(cached_imghashes)
+        return output_file
+
+    nb_frames_exported = 0
+    resumed_export = (
+        _resume_chunk_imghashes(
+            input_media,
+            output_file,
+            chunk_size,
+            jobs,
+            hashing_executor,
+            decode_profile,
+            metrics,
+            hashing_processes,
+        )
+        if resume and output_file.exists()
+        else None
+    )
+    gen_chunk_imghashes: Iterator[
+        Tuple[npt.NDArray[np.uint64], Optional[npt.NDArray[np.float64]]]
+    ]
+    if resumed_export:
+        nb_frames_exported, gen_resumed_chunk_imghashes = resumed_export
+        gen_chunk_imghashes = zip(gen_resumed_chunk_imghashes, repeat(None))
+        console.print(f"Resume export from frame: {nb_frames_exported}")
+    else:
+        # remove/unlink export file if exist
+        if unlink_export_file or resume:
+            output_file.unlink(missing_ok=True)
+            if sampling is not None:
+                timestamps_file(output_file).unlink(missing_ok=True)
+        gen_chunk_imghashes = (
+            _gen_sampled_chunk_imghashes(
+                input_media,
+                chunk_size,
+                sampling,
+                hashing_executor,
+                decode_profile,
+                metrics,
+            )
+            if sampling is not None
+            else zip(
+                _gen_chunk_imghashes(
+                    input_media,
+                    chunk_size,
+                    jobs,
+                    hashing_executor=hashing_executor,
+                    decode_profile=decode_profile,
+                    metrics=metrics,
+                    hashing_processes=hashing_processes,
+                ),
+                repeat(None),
+            )
+        )
 
     console.print(f"output_file: {str(output_file)}")
 
     # configure progress bar
-    progress_bar, pb_task_id = configure_progress_bar(
-        input_media.name, nb_frames_to_read * 8, console
-    )
-    pb_advance = chunk_size * 8
+    progress_context: AbstractContextManager[Any]
+    if progress_bar is None:
+        progress_bar, pb_task_id = configure_progress_bar(
+            input_media.name, nb_frames_to_read * 8, console
+        )
+        progress_context = progress_bar
+    else:
+        pb_task_id = add_progress_task(
+            progress_bar, input_media.name, nb_frames_to_read * 8
+        )
+        progress_context = nullcontext()
+    progress_bar.update(pb_task_id, advance=nb_frames_exported * 8)
 
-    with progress_bar:
-        gen_imghashes = map(rawframe_to_imghash, it_reader_frame)
-        gen_chunk_imghashes = chunks(gen_imghashes, chunk_size)
-        # for each chunk of frames
-        for chunk_imghashes in gen_chunk_imghashes:
-            # ... open/write and close export file in binary append mode
-            with output_file.open("ab") as fo:
-                # consume generator: chunk frame to image hash
-                for frame_hash_binary in map(imghash_to_bytes, chunk_imghashes):
-                    # and write (chunk of) images hashes result on export file
-                    fo.write(frame_hash_binary)
+    with ExitStack() as stack:
+        stack.enter_context(progress_context)
+        hash_sink: HashSink
+        timestamps_sink: Optional[HashSink] = None
+        if header is not None:
+            hash_sink = stack.enter_context(
+                PhashContainerSink(output_file, header, fsync_on_checkpoint)
+            )
+        else:
+            hash_sink = stack.enter_context(HashSink(output_file, fsync_on_checkpoint))
+            if sampling is not None:
+                timestamps_sink = stack.enter_context(
+                    HashSink(timestamps_file(output_file), fsync_on_checkpoint)
+                )
+        nbytes_exported = nb_frames_exported * 8
+        for chunk_imghashes, chunk_timestamps in gen_chunk_imghashes:
+            # write (chunk of) images hashes result on export file
+            with metrics.timed("write", len(chunk_imghashes)):
+                hash_sink.write(chunk_imghashes)
+                hash_sink.checkpoint()
+                if chunk_timestamps is not None:
+                    if isinstance(hash_sink, PhashContainerSink):
+                        hash_sink.write_timestamps(chunk_timestamps)
+                    elif timestamps_sink is not None:
+                        timestamps_sink.write(chunk_timestamps.astype("<f8"))
+                        timestamps_sink.checkpoint()
+            nbytes_exported += chunk_imghashes.nbytes
             # update progress bar synchronize with chunk progression
-            progress_bar.update(pb_task_id, advance=pb_advance, refresh=True)
+            progress_bar.update(
+                pb_task_id, advance=chunk_imghashes.nbytes, refresh=True
+            )
+        if sampling is not None:
+            # the number of sampled frames is only known once decoded
+            progress_bar.update(pb_task_id, total=nbytes_exported)
+    if cache is not None:
+        with metrics.timed("cache"), PhashFile(output_file) as phash_file:
+            cache.put(cache_key, phash_file.imghashes.tobytes())
     return output_file
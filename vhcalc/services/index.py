@@ -0,0 +1,305 @@
+"""
+On-disk similarity search (Hamming distance) index over images hashes files.
+
+Multi-index hashing: the 64 bits images hashes are split into 4 substrings of 16 bits,
+each one indexed in a table (frames sorted by substring, with the start of each
+substring bucket). If two images hashes are within a Hamming distance `d`, at least one
+of their substrings are within a distance `d // 4` (pigeonhole principle): a query only
+visits the buckets of the substrings close to its own ones, then checks the full
+distance of these candidates. Beyond a distance of 15 (substrings radius of 3), the
+buckets visited cover a large part of the tables: all the indexed frames are compared
+instead (by chunks, as in `vhcalc.services.match`).
+
+Files of an index directory:
+    - medias.json: indexed medias
+    - imghashes.npy: images hashes (N,) as 64 bits integers
+    - buckets.npy: start of each substring bucket (4, 2**16 + 1) in the tables
+    - tables.npy: frames sorted by substring (4, N)
+"""
+
+import json
+import os
+from dataclasses import asdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Final, Iterable, Tuple
+
+import numpy as np
+import numpy.typing as npt
+from loguru import logger
+
+from vhcalc.models import IndexedMedia, IndexMatch
+from vhcalc.services.match import MAX_COMPARISONS_PER_CHUNK
+from vhcalc.services.phash_file import RE_PHASH_FILENAME_FPS, PhashFile
+from vhcalc.tools.imghash import hamming_distances
+
+NB_SUBSTRINGS: Final[int] = 4
+SUBSTRING_NB_BITS: Final[int] = 64 // NB_SUBSTRINGS
+NB_BUCKETS: Final[int] = 2**SUBSTRING_NB_BITS
+# frames are indexed with 32 bits integers
+MAX_INDEX_NB_FRAMES: Final[int] = 2**32
+# maximum radius of the substrings searched in the tables: 697 substrings masks, i.e.
+# ~4% of the tables visited (2517 masks and ~15% at radius 4)
+MAX_SUBSTRING_RADIUS: Final[int] = 3
+
+
+def _substrings(imghashes: npt.NDArray[np.uint64]) -> npt.NDArray[np.int64]:
+    """substrings (NB_SUBSTRINGS, N) of images hashes"""
+    shifts = np.arange(NB_SUBSTRINGS, dtype=np.uint64)[:, None] * np.uint64(
+        SUBSTRING_NB_BITS
+    )
+    return ((imghashes[None, :] >> shifts) & np.uint64(NB_BUCKETS - 1)).astype(np.int64)
+
+
+@lru_cache(maxsize=None)
+def _substring_masks(radius: int) -> npt.NDArray[np.int64]:
+    """all the substrings masks with at most `radius` bits set"""
+    masks = np.arange(NB_BUCKETS, dtype=np.int64)
+    substring_masks = masks[np.bitwise_count(masks) <= radius]
+    substring_masks.setflags(write=False)
+    return substring_masks
+
+
+def _ragged_arange(
+    starts: npt.NDArray[np.int64], ends: npt.NDArray[np.int64]
+) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """concatenated ranges [start, end[ and the index of the range of each position
+
+    >>> _ragged_arange(np.array([2, 7, 0]), np.array([4, 7, 1]))
+    (array([2, 3, 0]), array([0, 0, 2]))
+    """
+    lengths = ends - starts
+    ranges = np.repeat(np.arange(len(starts)), lengths)
+    range_offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    return np.repeat(starts, lengths) + range_offsets, ranges
+
+
+class ImageHashesIndex:
+    """
+    Similarity search index of images hashes files, stored in `index_dir`.
+
+    Examples:
+        >>> import tempfile
+        >>> p_phash = Path(tempfile.mkdtemp()) / "media.mkv.25.0fps.phash"
+        >>> _ = p_phash.write_bytes(bytes(range(256)))
+        >>> index = ImageHashesIndex(Path(tempfile.mkdtemp()) / "index")
+        >>> index.add([p_phash])
+        [IndexedMedia(name='media.mkv', phash_file=..., first_frame=0, nb_frames=32, fps=25.0)]
+        >>> clip_imghashes = np.array([0x1011121314151617, 0x18191A1B1C1D1E1F], dtype=np.uint64)
+        >>> index.query(clip_imghashes, max_distance=0)
+        [IndexMatch(media='media.mkv', offset=2, timestamp=0.08, nb_matching_frames=2, mean_distance=0.0)]
+    """
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = index_dir
+        self.medias: list[IndexedMedia] = []
+        self.imghashes: npt.NDArray[np.uint64] = np.empty(0, dtype=np.uint64)
+        self.buckets: npt.NDArray[np.int64] = np.zeros(
+            (NB_SUBSTRINGS, NB_BUCKETS + 1), dtype=np.int64
+        )
+        self.tables: npt.NDArray[np.uint32] = np.empty(
+            (NB_SUBSTRINGS, 0), dtype=np.uint32
+        )
+        if (index_dir / "medias.json").exists():
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.imghashes)
+
+    def _load(self) -> None:
+        self.medias = [
+            IndexedMedia(**media)
+            for media in json.loads((self.index_dir / "medias.json").read_text())
+        ]
+        # arrays are mapped in memory: an index is opened instantly whatever its size
+        self.imghashes = np.load(self.index_dir / "imghashes.npy", mmap_mode="r")
+        self.buckets = np.load(self.index_dir / "buckets.npy", mmap_mode="r")
+        self.tables = np.load(self.index_dir / "tables.npy", mmap_mode="r")
+
+    def save(self) -> None:
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        # atomic writes (medias last): readers never see a partial index file
+        for name, array in (
+            ("imghashes", self.imghashes),
+            ("buckets", self.buckets),
+            ("tables", self.tables),
+        ):
+            with (self.index_dir / f"{name}.npy.tmp").open("wb") as fo:
+                np.save(fo, array)
+            os.replace(fo.name, self.index_dir / f"{name}.npy")
+        p_medias_tmp = self.index_dir / "medias.json.tmp"
+        p_medias_tmp.write_text(json.dumps([asdict(media) for media in self.medias]))
+        os.replace(p_medias_tmp, self.index_dir / "medias.json")
+
+    def add(self, phash_files: Iterable[Path]) -> list[IndexedMedia]:
+        """
+        Add images hashes files to the index (and save it).
+
+        Args:
+            phash_files (Iterable[Path]): images hashes files, already indexed files are skipped
+
+        Returns:
+            list[IndexedMedia]: medias added to the index
+        """
+        indexed_phash_files = {media.phash_file for media in self.medias}
+        medias_added: list[IndexedMedia] = []
+        imghashes = [np.asarray(self.imghashes)]
+        nb_frames = len(self)
+        for phash_file in phash_files:
+            if str(phash_file.resolve()) in indexed_phash_files:
+                logger.warning(f"{phash_file} is already indexed")
+                continue
+            with PhashFile(phash_file) as phash:
+                imghashes.append(phash.values.astype(np.uint64))
+                medias_added.append(
+                    IndexedMedia(
+                        name=RE_PHASH_FILENAME_FPS.sub("", phash_file.name),
+                        phash_file=str(phash_file.resolve()),
+                        first_frame=nb_frames,
+                        nb_frames=len(phash),
+                        fps=phash.fps,
+                    )
+                )
+            indexed_phash_files.add(str(phash_file.resolve()))
+            nb_frames += len(imghashes[-1])
+        if nb_frames > MAX_INDEX_NB_FRAMES:
+            raise ValueError(f"Too many frames to index: {nb_frames}")
+        if not medias_added:
+            return medias_added
+
+        self.medias.extend(medias_added)
+        self.imghashes = np.concatenate(imghashes)
+        substrings = _substrings(self.imghashes)
+        self.tables = np.argsort(substrings, axis=1, kind="stable").astype(np.uint32)
+        self.buckets = np.zeros((NB_SUBSTRINGS, NB_BUCKETS + 1), dtype=np.int64)
+        self.buckets[:, 1:] = np.cumsum(
+            [np.bincount(substring, minlength=NB_BUCKETS) for substring in substrings],
+            axis=1,
+        )
+        self.save()
+        return medias_added
+
+    def search(
+        self, imghashes: npt.NDArray[np.uint64], max_distance: int
+    ) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64], npt.NDArray[np.uint8]]:
+        """
+        Search the indexed frames within a Hamming distance of images hashes.
+
+        The multi-index tables are used up to a distance of
+        `(MAX_SUBSTRING_RADIUS + 1) * NB_SUBSTRINGS - 1`, all the indexed frames are
+        compared beyond it.
+
+        Args:
+            imghashes (np.ndarray): images hashes (Q,) as 64 bits integers
+            max_distance (int): maximum Hamming distance
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: for each frame found, the index of
+                the image hash searched, the index of the frame and their distance.
+        """
+        if not len(self):
+            no_frames = np.empty(0, dtype=np.int64)
+            return no_frames, no_frames, np.empty(0, dtype=np.uint8)
+        if max_distance // NB_SUBSTRINGS > MAX_SUBSTRING_RADIUS:
+            return self._scan(imghashes, max_distance)
+        masks = _substring_masks(max_distance // NB_SUBSTRINGS)
+        candidates_searched, candidates_frames = [], []
+        for table, buckets, substrings in zip(
+            self.tables, self.buckets, _substrings(imghashes)
+        ):
+            buckets_keys = (substrings[:, None] ^ masks[None, :]).reshape(-1)
+            positions, buckets_visited = _ragged_arange(
+                buckets[buckets_keys], buckets[buckets_keys + 1]
+            )
+            candidates_searched.append(buckets_visited // len(masks))
+            candidates_frames.append(table[positions].astype(np.int64))
+        searched = np.concatenate(candidates_searched)
+        frames = np.concatenate(candidates_frames)
+        distances = hamming_distances(imghashes[searched], self.imghashes[frames])
+        in_range = distances <= max_distance
+        # a frame can be found from many substrings: unique (searched, frame) pairs
+        pairs, first_found = np.unique(
+            searched[in_range] * len(self) + frames[in_range], return_index=True
+        )
+        return (
+            pairs // len(self),
+            pairs % len(self),
+            distances[in_range][first_found],
+        )
+
+    def _scan(
+        self, imghashes: npt.NDArray[np.uint64], max_distance: int
+    ) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64], npt.NDArray[np.uint8]]:
+        """same as `search`, comparing the images hashes with all the indexed frames
+        (by chunks of frames, to bound the memory used)"""
+        chunk_nb_frames = max(1, MAX_COMPARISONS_PER_CHUNK // max(len(imghashes), 1))
+        found_searched, found_frames, found_distances = [], [], []
+        for chunk_start in range(0, len(self), chunk_nb_frames):
+            distances = hamming_distances(
+                imghashes[:, None],
+                self.imghashes[None, chunk_start : chunk_start + chunk_nb_frames],
+            )
+            searched, frames = np.nonzero(distances <= max_distance)
+            found_searched.append(searched.astype(np.int64))
+            found_frames.append(frames.astype(np.int64) + chunk_start)
+            found_distances.append(distances[searched, frames])
+        searched = np.concatenate(found_searched)
+        frames = np.concatenate(found_frames)
+        # sorted as the pairs found in the tables
+        order = np.lexsort((frames, searched))
+        return searched[order], frames[order], np.concatenate(found_distances)[order]
+
+    def query(
+        self,
+        imghashes: npt.NDArray[np.uint64],
+        max_distance: int = 8,
+        top: int = 10,
+    ) -> list[IndexMatch]:
+        """
+        Search the medias (and offsets) matching the images hashes of a clip.
+
+        Each clip frame within `max_distance` of a media frame votes for the alignment
+        (media, offset) of the clip. The alignments with the most votes are returned.
+
+        Args:
+            imghashes (np.ndarray): images hashes (Q,) of the clip as 64 bits integers
+            max_distance (int): maximum Hamming distance between matching frames
+            top (int): maximum number of matches returned
+
+        Returns:
+            list[IndexMatch]: best matches first
+        """
+        clip_frames, frames, distances = self.search(imghashes, max_distance)
+        if not len(frames):
+            return []
+
+        medias_first_frames = np.array([media.first_frame for media in self.medias])
+        medias = np.searchsorted(medias_first_frames, frames, side="right") - 1
+        offsets = frames - medias_first_frames[medias] - clip_frames
+        alignments, alignment_indices, nb_matching_frames = np.unique(
+            np.stack([medias, offsets], axis=1),
+            axis=0,
+            return_inverse=True,
+            return_counts=True,
+        )
+        mean_distances = (
+            np.bincount(alignment_indices.reshape(-1), weights=distances)
+            / nb_matching_frames
+        )
+        best_alignments = np.lexsort((mean_distances, -nb_matching_frames))[:top]
+        return [
+            IndexMatch(
+                media=self.medias[media].name,
+                offset=int(offset),
+                timestamp=(
+                    int(offset) / self.medias[media].fps
+                    if self.medias[media].fps
+                    else None
+                ),
+                nb_matching_frames=int(nb_matching_frames[i]),
+                mean_distance=float(mean_distances[i]),
+            )
+            for i, (media, offset) in zip(best_alignments, alignments[best_alignments])
+        ]
@@ -0,0 +1,126 @@
+"""
+Alignment of the images hashes of a clip in the images hashes of a media.
+"""
+
+from pathlib import Path
+from typing import Final, Optional
+
+import numpy as np
+import numpy.typing as npt
+from numpy.lib.stride_tricks import sliding_window_view
+
+from vhcalc.models import Alignment, MatchingSegment
+from vhcalc.services.phash_file import PhashFile
+from vhcalc.tools.imghash import hamming_distances
+
+# number of frames comparisons (XOR + popcount) per chunk of offsets
+MAX_COMPARISONS_PER_CHUNK: Final[int] = 2**22
+
+
+def _matching_segments(
+    distances: npt.NDArray[np.uint8],
+    offset: int,
+    max_distance: int,
+    min_segment_nb_frames: int,
+) -> list[MatchingSegment]:
+    """runs of (at least `min_segment_nb_frames`) frames within `max_distance`"""
+    is_matching = np.concatenate([[0], distances <= max_distance, [0]]).astype(np.int8)
+    runs_starts = np.flatnonzero(np.diff(is_matching) == 1)
+    runs_ends = np.flatnonzero(np.diff(is_matching) == -1)
+    return [
+        MatchingSegment(
+            clip_start=int(start),
+            media_start=int(start) + offset,
+            nb_frames=int(end - start),
+        )
+        for start, end in zip(runs_starts, runs_ends)
+        if end - start >= min_segment_nb_frames
+    ]
+
+
+def align_imghashes(
+    clip_imghashes: npt.NDArray[np.uint64],
+    media_imghashes: npt.NDArray[np.uint64],
+    max_distance: int = 10,
+    min_segment_nb_frames: int = 1,
+    max_comparisons_per_chunk: int = MAX_COMPARISONS_PER_CHUNK,
+) -> Optional[Alignment]:
+    """
+    Find the best alignment of a clip in a media, from their images hashes.
+
+    The clip is slid over the media: the Hamming distances between the aligned frames
+    are computed with XOR and popcount on chunks of offsets (to bound the memory used),
+    and the offset with the lowest mean distance is the best alignment.
+
+    Args:
+        clip_imghashes (np.ndarray): images hashes (N,) of the clip as 64 bits integers
+        media_imghashes (np.ndarray): images hashes (M,) of the media as 64 bits integers
+        max_distance (int): maximum Hamming distance between matching frames
+        min_segment_nb_frames (int): minimum number of frames of a matching segment
+        max_comparisons_per_chunk (int): number of frames comparisons per chunk of offsets
+
+    Returns:
+        Optional[Alignment]: best alignment, None if the clip is empty or longer than the media
+
+    Examples:
+        >>> media_imghashes = np.arange(100, dtype=np.uint64) * np.uint64(0x0101010101010101)
+        >>> clip_imghashes = media_imghashes[40:50].copy()
+        >>> clip_imghashes[5] ^= np.uint64(0xFFFF)
+        >>> alignment = align_imghashes(clip_imghashes, media_imghashes, max_distance=4)
+        >>> alignment.offset, alignment.mean_distance
+        (40, 1.6)
+        >>> alignment.distances
+        array([ 0,  0,  0,  0,  0, 16,  0,  0,  0,  0], dtype=uint8)
+        >>> alignment.segments
+        [MatchingSegment(clip_start=0, media_start=40, nb_frames=5), MatchingSegment(clip_start=6, media_start=46, nb_frames=4)]
+    """
+    nb_clip_frames = len(clip_imghashes)
+    nb_offsets = len(media_imghashes) - nb_clip_frames + 1
+    if not nb_clip_frames or nb_offsets < 1:
+        return None
+
+    windows = sliding_window_view(media_imghashes, nb_clip_frames)
+    chunk_nb_offsets = max(1, max_comparisons_per_chunk // nb_clip_frames)
+    sum_distances = np.empty(nb_offsets, dtype=np.int64)
+    for chunk_start in range(0, nb_offsets, chunk_nb_offsets):
+        chunk_windows = windows[chunk_start : chunk_start + chunk_nb_offsets]
+        sum_distances[chunk_start : chunk_start + len(chunk_windows)] = (
+            hamming_distances(chunk_windows, clip_imghashes[None, :]).sum(
+                axis=1, dtype=np.int64
+            )
+        )
+
+    offset = int(np.argmin(sum_distances))
+    distances = hamming_distances(
+        media_imghashes[offset : offset + nb_clip_frames], clip_imghashes
+    )
+    return Alignment(
+        offset=offset,
+        mean_distance=float(sum_distances[offset] / nb_clip_frames),
+        distances=distances,
+        segments=_matching_segments(
+            distances, offset, max_distance, min_segment_nb_frames
+        ),
+    )
+
+
+def match_phash_files(
+    clip_phash_file: Path,
+    media_phash_file: Path,
+    max_distance: int = 10,
+    min_segment_nb_frames: int = 1,
+) -> Optional[Alignment]:
+    """
+    Find the best alignment of a clip in a media, from their images hashes files.
+
+    See `align_imghashes`.
+    """
+    with PhashFile(clip_phash_file) as clip_phash, PhashFile(
+        media_phash_file
+    ) as media_phash:
+        return align_imghashes(
+            clip_phash.values.astype(np.uint64),
+            media_phash.values.astype(np.uint64),
+            max_distance=max_distance,
+            min_segment_nb_frames=min_segment_nb_frames,
+        )
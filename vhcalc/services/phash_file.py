@@ -0,0 +1,198 @@
+"""
+Random access (memory-mapped) reader of binary images hashes (.phash) files and
+images hashes containers (.vhc, see `vhcalc.tools.phash_container`).
+"""
+
+import contextlib
+import math
+import mmap
+import re
+from pathlib import Path
+from types import TracebackType
+from typing import Iterator, Optional, Type, Union
+
+import numpy as np
+import numpy.typing as npt
+from imagehash import ImageHash
+
+from vhcalc.models import PhashHeader
+from vhcalc.tools.imghash import imghashes_as_uint64
+from vhcalc.tools.phash_container import HEADER_SIZE, MAGIC, unpack_header
+
+# default name of the exported files: {media name}.{fps}fps.phash (or .vhc)
+RE_PHASH_FILENAME_FPS = re.compile(r"\.(?P<fps>\d+(\.\d+)?)fps\.(phash|vhc)$")
+
+
+class PhashFile:
+    """
+    Images hashes file mapped in memory: opened instantly whatever its size, and
+    exposed as (zero-copy) numpy arrays. Images hashes are only converted to
+    `ImageHash` on access.
+
+    The frame rate (and the timestamps, if stored) of a container are read from its
+    header, a raw .phash file only has a frame rate if given or parsed from its name.
+
+    The views returned stay valid after the file is closed: the file is unmapped once
+    they are all released.
+
+    Args:
+        path (Path): path to the images hashes file
+        fps (Optional[float]): frame rate of the hashed media (to access images hashes
+            by timestamps), read from the container header or parsed from the default
+            export filename if not given.
+
+    Examples:
+        >>> import tempfile
+        >>> p_phash = Path(tempfile.mkdtemp()) / "media.mkv.25.0fps.phash"
+        >>> _ = p_phash.write_bytes(b"\\xd5\\xd5*\\xd5*\\xd4*\\xd4" * 50)
+        >>> with PhashFile(p_phash) as phash_file:
+        ...     len(phash_file), phash_file.fps
+        ...     str(phash_file[-1])
+        ...     phash_file.imghashes[:2].shape
+        ...     hex(phash_file.values[0])
+        ...     phash_file.between(0.5, 1.0).shape
+        (50, 25.0)
+        'd5d52ad52ad42ad4'
+        (2, 8)
+        '0xd5d52ad52ad42ad4'
+        (13, 8)
+    """
+
+    def __init__(self, path: Path, fps: Optional[float] = None):
+        self.path = path
+        if fps is None and (match := RE_PHASH_FILENAME_FPS.search(path.name)):
+            fps = float(match["fps"])
+        self.fps = fps
+        self.header: Optional[PhashHeader] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._imghashes: npt.NDArray[np.uint8] = np.empty((0, 8), dtype=np.uint8)
+        self._timestamps: Optional[npt.NDArray[np.float64]] = None
+        self._seek_index: npt.NDArray[np.float64] = np.empty(0, dtype="<f8")
+        self._seek_index_interval = 0
+
+    def open(self) -> "PhashFile":
+        with self.path.open("rb") as fo:
+            file_size = self.path.stat().st_size
+            # an empty file can't be mapped
+            if file_size:
+                self._mmap = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap is None:
+            return self
+        if self._mmap[: len(MAGIC)] == MAGIC:
+            self._open_container(self._mmap)
+        else:
+            self._imghashes = np.frombuffer(
+                self._mmap, dtype=np.uint8, count=file_size // 8 * 8
+            ).reshape(-1, 8)
+        return self
+
+    def _open_container(self, buffer: mmap.mmap) -> None:
+        (
+            self.header,
+            pts_offset,
+            seek_index_offset,
+            self._seek_index_interval,
+        ) = unpack_header(buffer[:HEADER_SIZE])
+        nb_frames = self.header.nb_frames
+        self._imghashes = np.frombuffer(
+            buffer, dtype=np.uint8, count=nb_frames * 8, offset=HEADER_SIZE
+        ).reshape(-1, 8)
+        if self.header.has_pts:
+            self._timestamps = np.frombuffer(
+                buffer, dtype="<f8", count=nb_frames, offset=pts_offset
+            )
+            self._seek_index = np.frombuffer(
+                buffer,
+                dtype="<f8",
+                count=-(-nb_frames // self._seek_index_interval),
+                offset=seek_index_offset,
+            )
+        if self.fps is None:
+            self.fps = self.header.fps
+
+    def close(self) -> None:
+        self._imghashes = np.empty((0, 8), dtype=np.uint8)
+        self._timestamps = None
+        self._seek_index = np.empty(0, dtype="<f8")
+        if self._mmap is not None:
+            # views (on the mapping) kept by the caller: the mapping is released
+            # with them
+            with contextlib.suppress(BufferError):
+                self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self) -> "PhashFile":
+        return self.open()
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    @property
+    def imghashes(self) -> npt.NDArray[np.uint8]:
+        """binary images hashes (N, 8), read-only view on the mapped file"""
+        return self._imghashes
+
+    @property
+    def values(self) -> npt.NDArray[np.uint64]:
+        """images hashes (N,) as (big-endian) 64 bits integers, view on the mapped file"""
+        return imghashes_as_uint64(self._imghashes)
+
+    def __len__(self) -> int:
+        return len(self._imghashes)
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[ImageHash, npt.NDArray[np.uint8]]:
+        """`ImageHash` of a frame, or binary images hashes (view) of a slice of frames"""
+        if isinstance(index, slice):
+            return self._imghashes[index]
+        return self.imghash(index)
+
+    def __iter__(self) -> Iterator[ImageHash]:
+        for index in range(len(self)):
+            yield self.imghash(index)
+
+    def imghash(self, index: int) -> ImageHash:
+        """`ImageHash` of a frame (built from its bits, without hexadecimal round-trip)"""
+        return ImageHash(np.unpackbits(self._imghashes[index]).reshape(8, 8) == 1)
+
+    @property
+    def timestamps(self) -> npt.NDArray[np.float64]:
+        """presentation timestamps (N,) of the frames (in seconds): view on the mapped
+        file if stored in the container, else computed from the frame rate"""
+        if self._timestamps is not None:
+            return self._timestamps
+        if not self.fps:
+            raise ValueError(f"Unknown frame rate for {self.path}")
+        return np.arange(len(self)) / self.fps
+
+    def frame_index(self, timestamp: float) -> int:
+        """index of the frame displayed at `timestamp` (in seconds)"""
+        if self._timestamps is not None:
+            # only the seek index and a block of timestamps are read (from the mapping)
+            block = max(
+                int(np.searchsorted(self._seek_index, timestamp, "right")) - 1, 0
+            )
+            block_start = block * self._seek_index_interval
+            block_timestamps = self._timestamps[
+                block_start : block_start + self._seek_index_interval
+            ]
+            return max(
+                block_start
+                + int(np.searchsorted(block_timestamps, timestamp, "right"))
+                - 1,
+                0,
+            )
+        if not self.fps:
+            raise ValueError(f"Unknown frame rate for {self.path}")
+        # rounded: the product of floats can be just below an integer (0.29 * 100)
+        return math.floor(round(timestamp * self.fps, 9))
+
+    def between(self, start: float, end: float) -> npt.NDArray[np.uint8]:
+        """binary images hashes (view) of the frames displayed between two timestamps"""
+        return self._imghashes[self.frame_index(start) : self.frame_index(end)]
@@ -0,0 +1,193 @@
+"""
+Media metadata probing from container/stream headers (without decoding the media).
+
+Sources (in this order):
+    - pymediainfo (libmediainfo)
+    - ffprobe JSON output (if a `ffprobe` binary is available)
+    - ffmpeg header (fps and duration, the number of frames is estimated)
+
+An exact number of frames (decoding the whole media) is only computed on request.
+Results are cached per file: in memory (keyed by path, size and modification time) and
+on local disk, next to the images hashes cache (`vhcalc.services.cache`, keyed by the
+media content fingerprint), so that they are reused between runs.
+"""
+
+import json
+import os
+import shutil
+import subprocess  # nosec
+import tempfile
+from dataclasses import asdict, replace
+from fractions import Fraction
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional
+
+from imageio_ffmpeg import count_frames_and_secs, read_frames
+from loguru import logger
+
+from vhcalc.models import MetaData
+from vhcalc.services.cache import default_cache_dir, media_fingerprint
+
+
+def probe_media_metadata(media: Path, exact_nb_frames: bool = False) -> MetaData:
+    """
+    Probe media metadata (fps, duration and number of frames) from headers.
+
+    Args:
+        media (Path): path to the media
+        exact_nb_frames (bool): decode the whole media (with ffmpeg) to get the exact
+            number of frames.
+
+    Returns:
+        MetaData: media metadata
+
+    Examples:
+        >>> probe_media_metadata(Path("tests/data/big_buck_bunny_trailer_480p.mkv"))
+        MetaData(fps=25.0, duration=33.033, nb_frames=812)
+        >>> probe_media_metadata(
+        ...     Path("tests/data/big_buck_bunny_trailer_480p.mkv"), exact_nb_frames=True
+        ... ).nb_frames
+        812
+    """
+    media_stat = media.stat()
+    # copy: the cached dataclass is shared between callers
+    return replace(
+        _probe_media_metadata(
+            str(media.resolve()),
+            media_stat.st_size,
+            media_stat.st_mtime_ns,
+            exact_nb_frames,
+        )
+    )
+
+
+@lru_cache(maxsize=1024)
+def _probe_media_metadata(
+    media: str, _size: int, _mtime_ns: int, exact_nb_frames: bool
+) -> MetaData:
+    cached_path = _cached_probe_path(Path(media), exact_nb_frames)
+    metadata = _read_cached_probe(cached_path)
+    if metadata is not None:
+        return metadata
+    metadata = (
+        _probe_with_mediainfo(media)
+        or _probe_with_ffprobe(media)
+        or _probe_with_ffmpeg_header(media)
+    )
+    if exact_nb_frames:
+        metadata.nb_frames = count_frames_and_secs(media)[0]
+    _write_cached_probe(cached_path, metadata)
+    return metadata
+
+
+def _cached_probe_path(media: Path, exact_nb_frames: bool) -> Optional[Path]:
+    fingerprint = media_fingerprint(media)
+    if fingerprint is None:
+        return None
+    suffix = ".exact" if exact_nb_frames else ""
+    return default_cache_dir() / "probe" / f"{fingerprint}{suffix}.json"
+
+
+def _read_cached_probe(cached_path: Optional[Path]) -> Optional[MetaData]:
+    if cached_path is None:
+        return None
+    try:
+        return MetaData(**json.loads(cached_path.read_text()))
+    except FileNotFoundError:
+        return None
+    except (OSError, TypeError, ValueError):
+        logger.debug(f"Can't read cached probe {cached_path}", exc_info=True)
+        return None
+
+
+def _write_cached_probe(cached_path: Optional[Path], metadata: MetaData) -> None:
+    if cached_path is None:
+        return
+    # the cache is optional: a read-only (or full) cache directory isn't an error
+    try:
+        cached_path.parent.mkdir(parents=True, exist_ok=True)
+        # atomic write: readers never see a partial file
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cached_path.parent, suffix=".tmp", delete=False
+        ) as fo:
+            json.dump(asdict(metadata), fo)
+        os.replace(fo.name, cached_path)
+    except OSError:
+        logger.debug(f"Can't cache probe {cached_path}", exc_info=True)
+
+
+def _probe_with_mediainfo(media: str) -> Optional[MetaData]:
+    try:
+        from pymediainfo import MediaInfo
+
+        media_info = MediaInfo.parse(media)
+    except (ImportError, OSError, RuntimeError):
+        logger.debug("Can't probe media with pymediainfo", exc_info=True)
+        return None
+
+    general_tracks = media_info.general_tracks
+    video_tracks = media_info.video_tracks
+    if not video_tracks:
+        return None
+    video_track = video_tracks[0]
+
+    try:
+        fps = float(video_track.frame_rate)
+        duration = (
+            float(
+                general_tracks[0].duration if general_tracks else video_track.duration
+            )
+            / 1000
+        )
+    except (TypeError, ValueError):
+        return None
+    nb_frames = (
+        int(video_track.frame_count)
+        if video_track.frame_count
+        else round(fps * duration)
+    )
+    return MetaData(fps=fps, duration=duration, nb_frames=nb_frames)
+
+
+def _probe_with_ffprobe(media: str) -> Optional[MetaData]:
+    ffprobe_exe = shutil.which("ffprobe")
+    if not ffprobe_exe:
+        return None
+    cmd = [
+        ffprobe_exe,
+        *("-v", "error"),
+        *("-select_streams", "v:0"),
+        # demuxing only (no decoding) to count packets if the stream has no frames count
+        "-count_packets",
+        *(
+            "-show_entries",
+            "stream=avg_frame_rate,nb_frames,nb_read_packets:format=duration",
+        ),
+        *("-of", "json"),
+        media,
+    ]
+    try:
+        probe: dict[str, Any] = json.loads(
+            subprocess.check_output(cmd, stderr=subprocess.DEVNULL)  # nosec
+        )
+        stream = probe["streams"][0]
+        fps = float(Fraction(stream["avg_frame_rate"]))
+        duration = float(probe["format"]["duration"])
+        nb_frames = int(stream.get("nb_frames") or stream["nb_read_packets"])
+    except (subprocess.CalledProcessError, LookupError, ValueError, ZeroDivisionError):
+        logger.debug("Can't probe media with ffprobe", exc_info=True)
+        return None
+    return MetaData(fps=fps, duration=duration, nb_frames=nb_frames)
+
+
+def _probe_with_ffmpeg_header(media: str) -> MetaData:
+    reader = read_frames(media)
+    try:
+        metadata_from_frames_reader: dict[str, Any] = next(reader)
+    finally:
+        reader.close()
+    fps = metadata_from_frames_reader["fps"]
+    duration = metadata_from_frames_reader["duration"]
+    # FIXME: not accurate/exact (use exact_nb_frames)
+    return MetaData(fps=fps, duration=duration, nb_frames=int(fps * duration))
@@ -1,16 +1,73 @@
 import datetime
+import os
+import stat
 from io import BufferedReader
 from pathlib import Path
-from typing import Any, BinaryIO, Iterator, Tuple, Union
+from typing import Any, BinaryIO, Iterator, Optional, Tuple, Union
 
-from imageio_ffmpeg import count_frames_and_secs, read_frames
+import numpy as np
+import numpy.typing as npt
+from imageio_ffmpeg import read_frames
 
-from vhcalc.models import URL, MetaData
+from vhcalc.models import URL, DecodeProfile, FrameSampling, MediaSegment, MetaData
+from vhcalc.services.probe import probe_media_metadata
 from vhcalc.tools.forked.imageio_ffmpeg_io import (
     read_frames_from_binary_stream,
+    read_frames_from_path,
     read_frames_from_url,
 )
 from vhcalc.tools.imghash import FRAME_SIZE
+from vhcalc.tools.metrics import PipelineMetrics
+
+
+def file_backed_path(stream: Union[BufferedReader, BinaryIO]) -> Optional[Path]:
+    """
+    Path of the regular file read by a binary stream (at its beginning), for ffmpeg
+    to read (and seek) the file itself instead of the stream content being pumped
+    into its stdin (e.g. a media at the end of which is its MP4 moov atom).
+
+    The path is the (resolved) name of the stream, or the file descriptor of this
+    process (`/proc/<pid>/fd/<fd>`, also opened by another process) for a stream
+    without a name of its file (stdin, `/dev/fd/<fd>`, a deleted file, ...).
+
+    Args:
+        stream (Union[BufferedReader, BinaryIO]): binary stream
+
+    Returns:
+        Optional[Path]: path of the file, or None for a stream which isn't a regular
+            file (pipe, socket, in memory, ...) or isn't at its beginning
+
+    Examples:
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> with media_path.open("rb") as fo:
+        ...     file_backed_path(fo) == media_path.resolve()
+        True
+        >>> from io import BytesIO
+        >>> file_backed_path(BytesIO(b"in memory")) is None
+        True
+    """
+    try:
+        fd = stream.fileno()
+        position = stream.tell()
+        stream_stat = os.fstat(fd)
+    except (AttributeError, OSError, ValueError):
+        return None
+    if not stat.S_ISREG(stream_stat.st_mode) or position:
+        return None
+
+    candidates = [Path(f"/proc/{os.getpid()}/fd/{fd}")]
+    name = getattr(stream, "name", None)
+    if isinstance(name, str):
+        # resolved: `/dev/fd/<fd>` (or `/proc/self/fd/<fd>`) is a descriptor of the
+        # process opening it
+        candidates.insert(0, Path(os.path.realpath(name)))
+    for candidate in candidates:
+        try:
+            if os.path.samestat(candidate.stat(), stream_stat):
+                return candidate
+        except OSError:
+            continue
+    return None
 
 
 def build_reader_frames(
@@ -18,6 +75,9 @@ def build_reader_frames(
     nb_seconds_to_extract: float = 0,
     seek_to_middle: bool = False,
     ffmpeg_reduce_verbosity: bool = False,
+    exact_nb_frames: bool = False,
+    segment: Optional[MediaSegment] = None,
+    decode_profile: Optional[DecodeProfile] = None,
 ) -> Tuple[Iterator[bytes], MetaData]:
     """
 
@@ -26,49 +86,249 @@ def build_reader_frames(
         nb_seconds_to_extract:
         seek_to_middle:
         ffmpeg_reduce_verbosity:
+        exact_nb_frames: for Path input, decode the whole media (one more time) to get
+            the exact number of frames, instead of reading it from the media headers.
+            A file-backed binary stream input is read as a Path input
+            (see `file_backed_path`).
+        segment: for Path input, only extract the frames of this segment of the media
+            (see `vhcalc.services.segments.split_media_into_segments`).
+        decode_profile: ffmpeg decoding options (default: ffmpeg defaults).
 
     Returns:
 
     """
+    return _build_reader(
+        media_input,
+        nb_seconds_to_extract=nb_seconds_to_extract,
+        seek_to_middle=seek_to_middle,
+        ffmpeg_reduce_verbosity=ffmpeg_reduce_verbosity,
+        exact_nb_frames=exact_nb_frames,
+        segment=segment,
+        decode_profile=decode_profile,
+    )
+
+
+def build_reader_frame_blocks(
+    media_input: Union[Path, Union[BufferedReader, BinaryIO], URL],
+    nb_frames_per_block: int = 0,
+    nb_seconds_per_block: float = 0,
+    nb_blocks_in_ring_buffer: int = 2,
+    nb_seconds_to_extract: float = 0,
+    seek_to_middle: bool = False,
+    ffmpeg_reduce_verbosity: bool = False,
+    exact_nb_frames: bool = False,
+    segment: Optional[MediaSegment] = None,
+    sampling: Optional[FrameSampling] = None,
+    decode_profile: Optional[DecodeProfile] = None,
+    ring_buffer: Optional[npt.NDArray[np.uint8]] = None,
+    metrics: Optional[PipelineMetrics] = None,
+) -> Tuple[Iterator[npt.NDArray[np.uint8]], MetaData]:
+    """Same as `build_reader_frames` but yields blocks of frames without copy.
+
+    Frames are read (with `readinto`) from ffmpeg stdout into a preallocated ring
+    buffer of `nb_blocks_in_ring_buffer` blocks, and each block is yielded as a view
+    with shape (nb_frames, FRAME_SIZE, FRAME_SIZE). A block is overwritten once
+    the ring buffer wraps around, so it has to be consumed (or copied) before
+    reading the next `nb_blocks_in_ring_buffer - 1` blocks.
+
+    Args:
+        media_input:
+        nb_frames_per_block: number of frames per block (the last block can be shorter)
+        nb_seconds_per_block: duration of a block, used (instead of `nb_frames_per_block`)
+            to compute the number of frames per block from the media fps.
+            Only available for Path input (the fps is known before decoding).
+        nb_blocks_in_ring_buffer: number of blocks in the ring buffer
+        nb_seconds_to_extract:
+        seek_to_middle:
+        ffmpeg_reduce_verbosity:
+        exact_nb_frames: see `build_reader_frames`
+        segment: see `build_reader_frames`
+        sampling: only decode the frames at a fixed frame rate or the keyframes
+            (the selection of frames on scene changes is not done by the reader,
+            see `vhcalc.services.sampling`).
+        decode_profile: see `build_reader_frames`
+        ring_buffer: preallocated ring buffer (e.g. in shared memory), with shape
+            (nb_frames, FRAME_SIZE * FRAME_SIZE), used instead of
+            `nb_blocks_in_ring_buffer` blocks allocated by the reader
+        metrics: for binary stream input, metrics where the pump of the stream into
+            ffmpeg stdin is recorded (`pump` and `pump_stall` stages)
+
+    Returns:
+
+    Raises:
+        ValueError: neither `nb_frames_per_block` nor `nb_seconds_per_block` is set
+
+    Examples:
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> reader, _ = build_reader_frame_blocks(media_path, nb_frames_per_block=25)
+        >>> next(reader).shape
+        (25, 32, 32)
+        >>> reader, metadata = build_reader_frame_blocks(media_path, nb_seconds_per_block=2)
+        >>> next(reader).shape[0] == int(metadata.fps * 2)
+        True
+    """
+    if nb_frames_per_block <= 0 and nb_seconds_per_block <= 0:
+        raise ValueError(
+            f"A (positive) block size is required: {nb_frames_per_block=}, {nb_seconds_per_block=}"
+        )
+    reader, metadata = _build_reader(
+        media_input,
+        nb_seconds_to_extract=nb_seconds_to_extract,
+        seek_to_middle=seek_to_middle,
+        ffmpeg_reduce_verbosity=ffmpeg_reduce_verbosity,
+        exact_nb_frames=exact_nb_frames,
+        segment=segment,
+        sampling=sampling,
+        decode_profile=decode_profile,
+        nb_frames_per_block=nb_frames_per_block,
+        nb_seconds_per_block=nb_seconds_per_block,
+        nb_blocks_in_ring_buffer=nb_blocks_in_ring_buffer,
+        ring_buffer=ring_buffer,
+        metrics=metrics,
+    )
+    return (
+        (block.reshape(-1, FRAME_SIZE, FRAME_SIZE) for block in reader),
+        metadata,
+    )
+
+
+def ffmpeg_decode_params(
+    decode_profile: Optional[DecodeProfile] = None,
+) -> Tuple[list[str], list[str], str]:
+    """
+    ffmpeg input options, output options and video filters to decode frames rescaled
+    to FRAME_SIZE x FRAME_SIZE, with the decoding options of a decode profile.
+
+    Examples:
+        >>> ffmpeg_decode_params()
+        ([], [], 'scale=width=32:height=32')
+        >>> from vhcalc.models import DECODE_PROFILES
+        >>> ffmpeg_decode_params(DECODE_PROFILES["fast"])
+        (['-skip_loop_filter', 'all'], ['-an', '-sn', '-dn'], 'scale=width=32:height=32')
+    """
+    input_params: list[str] = []
+    output_params: list[str] = []
+    # rescale output frame to 32x32
+    video_filters = f"scale=width={FRAME_SIZE}:height={FRAME_SIZE}"
+
+    if decode_profile is not None:
+        if decode_profile.threads:
+            input_params += ("-threads", str(decode_profile.threads))
+        # decoder options: input options (before `-i`)
+        if decode_profile.skip_loop_filter:
+            input_params += ("-skip_loop_filter", decode_profile.skip_loop_filter)
+        if decode_profile.skip_idct:
+            input_params += ("-skip_idct", decode_profile.skip_idct)
+        if decode_profile.scaler:
+            video_filters += f":flags={decode_profile.scaler}"
+        if decode_profile.drop_other_streams:
+            # no audio, subtitles and data streams demuxed to the output
+            output_params += ("-an", "-sn", "-dn")
+    return input_params, output_params, video_filters
+
+
+def _build_reader(
+    media_input: Union[Path, Union[BufferedReader, BinaryIO], URL],
+    nb_seconds_to_extract: float = 0,
+    seek_to_middle: bool = False,
+    ffmpeg_reduce_verbosity: bool = False,
+    exact_nb_frames: bool = False,
+    segment: Optional[MediaSegment] = None,
+    sampling: Optional[FrameSampling] = None,
+    decode_profile: Optional[DecodeProfile] = None,
+    nb_frames_per_block: int = 0,
+    nb_seconds_per_block: float = 0,
+    nb_blocks_in_ring_buffer: int = 0,
+    ring_buffer: Optional[npt.NDArray[np.uint8]] = None,
+    metrics: Optional[PipelineMetrics] = None,
+) -> Tuple[Iterator[Any], MetaData]:
     ffmpeg_seek_input_cmd: list[str] = []
     ffmpeg_seek_output_cmd: list[str] = []
-    s_media: str = ""
 
     # https://trac.ffmpeg.org/wiki/Seeking#Cuttingsmallsections
     if ffmpeg_reduce_verbosity:
         ffmpeg_seek_input_cmd += "-hide_banner -nostats -nostdin".split(" ")
 
+    if isinstance(media_input, BufferedReader):
+        # ffmpeg reads (and seeks) a regular file itself: no pump of its content
+        media_path = file_backed_path(media_input)
+        if media_path is not None:
+            media_input = media_path
+
+    media_metadata: Optional[MetaData] = None
     if isinstance(media_input, Path):
-        s_media = str(media_input)
-        # get media metadata from first yield of frames reader
-        metadata_from_frames_reader: dict[str, Any] = next(read_frames(s_media))
+        # get media metadata from container/stream headers (without decoding)
+        media_metadata = probe_media_metadata(
+            media_input, exact_nb_frames=exact_nb_frames
+        )
 
         # extract a (frame's) chunk around/in middle of the media
         if seek_to_middle:
             # it's an approximation, this command seek around/close to the middle
             ffmpeg_seek_input_cmd += (
                 "-ss",
-                str(
-                    datetime.timedelta(
-                        seconds=metadata_from_frames_reader["duration"] // 2
-                    )
-                ),
+                str(datetime.timedelta(seconds=media_metadata.duration // 2)),
             )
 
         if nb_seconds_to_extract:
             # express in number of frames to extract (more precise)
             ffmpeg_seek_output_cmd += (
                 "-frames:v",
-                str(round(nb_seconds_to_extract * metadata_from_frames_reader["fps"])),
+                str(round(nb_seconds_to_extract * media_metadata.fps)),
             )
 
-    # rescale output frame to 32x32
-    video_filters = f"scale=width={FRAME_SIZE}:height={FRAME_SIZE}"
+        # extract the frames of a segment (frame accurate)
+        if segment:
+            if segment.seek_time:
+                ffmpeg_seek_input_cmd += ("-ss", f"{segment.seek_time:.6f}")
+            ffmpeg_seek_output_cmd += (
+                *("-frames:v", str(segment.nb_frames)),
+                # no frame duplicated/dropped (to fill the gap) after the seek
+                *("-vsync", "passthrough"),
+            )
+
+        if nb_seconds_per_block:
+            nb_frames_per_block = int(nb_seconds_per_block * media_metadata.fps)
+    elif nb_seconds_per_block:
+        raise ValueError(
+            f"Can't compute a number of frames per block before decoding {type(media_input)=}"
+        )
+
+    decode_input_params, decode_output_params, video_filters = ffmpeg_decode_params(
+        decode_profile
+    )
+    ffmpeg_seek_input_cmd += decode_input_params
+    ffmpeg_seek_output_cmd += decode_output_params
+
+    if sampling and sampling.fps:
+        # drop/duplicate frames (before rescaling them) to the sampling frame rate
+        video_filters = f"fps=fps={sampling.fps},{video_filters}"
+    if sampling and sampling.keyframes:
+        # the decoder skips the other frames
+        ffmpeg_seek_input_cmd += ("-skip_frame", "nokey")
+    if sampling and not sampling.fps and "-vsync" not in ffmpeg_seek_output_cmd:
+        # no frame duplicated/dropped (to fill the gaps between keyframes, or for a
+        # variable frame rate): a frame decoded per video packet
+        ffmpeg_seek_output_cmd += ("-vsync", "passthrough")
+
+    # reading frames into a ring buffer is only handled by the (forked) readers
+    reader_params: dict[str, Any] = {}
+    if nb_blocks_in_ring_buffer:
+        reader_params = {
+            "nb_frames_per_block": nb_frames_per_block,
+            "nb_frames_in_ring_buffer": nb_frames_per_block * nb_blocks_in_ring_buffer,
+        }
+    if ring_buffer is not None:
+        reader_params = {
+            "nb_frames_per_block": nb_frames_per_block,
+            "ring_buffer": ring_buffer,
+        }
 
     if isinstance(media_input, Path):
-        fn_read_frames = read_frames
+        fn_read_frames = read_frames_from_path if reader_params else read_frames
     elif isinstance(media_input, BufferedReader):
         fn_read_frames = read_frames_from_binary_stream
+        reader_params["metrics"] = metrics
     elif isinstance(media_input, URL):
         fn_read_frames = read_frames_from_url
     else:
@@ -84,23 +344,20 @@ def build_reader_frames(
             *("-vf", video_filters),
         ],
         bits_per_pixel=8,
+        **reader_params,
     )
     # get media metadata from first yield of reader
     metadata_from_frames_reader = next(reader)
 
-    if isinstance(media_input, Path):
-        nb_frames = count_frames_and_secs(s_media)[0]
-    else:
+    if media_metadata is None:
         # FIXME: not accurate/exact => not working (very well)
-        nb_frames = int(
-            metadata_from_frames_reader["fps"] * metadata_from_frames_reader["duration"]
+        media_metadata = MetaData(
+            fps=metadata_from_frames_reader["fps"],
+            duration=metadata_from_frames_reader["duration"],
+            nb_frames=int(
+                metadata_from_frames_reader["fps"]
+                * metadata_from_frames_reader["duration"]
+            ),
         )
 
-    # build metadata dataclass
-    metadata = MetaData(
-        fps=metadata_from_frames_reader["fps"],
-        duration=metadata_from_frames_reader["duration"],
-        nb_frames=nb_frames,
-    )
-
-    return reader, metadata
+    return reader, media_metadata
@@ -0,0 +1,160 @@
+"""
+Temporal sampling of the frames of a media, with the timestamp of each sampled frame.
+
+Sampling modes (see `vhcalc.models.FrameSampling`):
+    - fixed frame rate: ffmpeg `fps` filter, a frame every 1/fps seconds
+    - keyframes: only the keyframes are decoded (`-skip_frame nokey`), their timestamps
+      are read from the media packets (demuxing only)
+    - scene changes: all the frames are decoded, and only the frames with a scene
+      change score (the one of the ffmpeg `select` filter, computed on the rescaled
+      frames) greater than the threshold are kept (the first frame is always kept).
+      Their timestamps are read from the media packets (a frame is decoded per
+      packet), or computed from the frame rate for an URL or a binary stream which
+      isn't file-backed.
+
+The media packets are read by a first (demuxing) pass: it isn't done for an URL, which
+would be downloaded twice (the keyframes sampling of an URL isn't supported).
+"""
+
+from io import BufferedReader
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from vhcalc.models import URL, DecodeProfile, FrameSampling, MetaData
+from vhcalc.services.reader_frames import build_reader_frame_blocks, file_backed_path
+from vhcalc.services.segments import probe_video_packets
+
+
+def _packets_timestamps(
+    media_input: Union[Path, Union[BufferedReader, BinaryIO], URL],
+) -> Optional[Tuple[npt.NDArray[np.float64], list[int]]]:
+    """presentation timestamps (in seconds, from the first frame) of the video packets
+    of a media (demuxed, not decoded) and the indices of its keyframes, None for an
+    URL (not downloaded twice) or a binary stream which isn't file-backed"""
+    if isinstance(media_input, URL):
+        return None
+    media = (
+        media_input if isinstance(media_input, Path) else file_backed_path(media_input)
+    )
+    if media is None:
+        return None
+    pts, keyframes, time_base = probe_video_packets(media)
+    timestamps = np.array([float((p - pts[0]) * time_base) for p in pts])
+    return timestamps, keyframes
+
+
+def _scene_scores(
+    frames: npt.NDArray[np.uint8],
+    previous_frame: Optional[npt.NDArray[np.uint8]],
+    previous_mafd: float,
+) -> Tuple[npt.NDArray[np.float64], float]:
+    """scene change scores of frames (and the mean absolute frame difference of the
+    last one), as computed by the ffmpeg `select` filter (`scene` variable)"""
+    if previous_frame is None:
+        # the first frame of the media is always kept
+        scores, last_mafd = _scene_scores(frames[1:], frames[0], previous_mafd)
+        return np.concatenate([[np.inf], scores]), last_mafd
+    frames_with_previous = np.concatenate([previous_frame[None], frames]).astype(
+        np.int16
+    )
+    mafd = np.abs(np.diff(frames_with_previous, axis=0)).mean(axis=(1, 2))
+    diff = np.abs(np.diff(mafd, prepend=previous_mafd))
+    scores = np.clip(np.minimum(mafd, diff) / 100.0, 0, 1)
+    return scores, float(mafd[-1]) if len(mafd) else previous_mafd
+
+
+def build_sampled_reader_frame_blocks(
+    media_input: Union[Path, Union[BufferedReader, BinaryIO], URL],
+    sampling: FrameSampling,
+    nb_frames_per_block: int = 15 * 25,
+    ffmpeg_reduce_verbosity: bool = False,
+    decode_profile: Optional[DecodeProfile] = None,
+) -> Tuple[Iterator[Tuple[npt.NDArray[np.uint8], npt.NDArray[np.float64]]], MetaData]:
+    """
+    Same as `build_reader_frame_blocks` for the sampled frames of a media, yielding
+    each block of frames with their timestamps (in seconds, from the first frame).
+
+    Args:
+        media_input: media to decode
+        sampling (FrameSampling): frames to sample
+        nb_frames_per_block (int): number of frames (decoded) per block
+        ffmpeg_reduce_verbosity (bool): see `build_reader_frame_blocks`
+        decode_profile (Optional[DecodeProfile]): see `build_reader_frame_blocks`
+
+    Returns:
+        Tuple[Iterator[Tuple[np.ndarray, np.ndarray]], MetaData]: the blocks of sampled
+            frames (N, FRAME_SIZE, FRAME_SIZE) with their timestamps (N,),
+            and the (not sampled) media metadata.
+
+    Examples:
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> reader, _ = build_sampled_reader_frame_blocks(
+        ...     media_path, FrameSampling(fps=5), nb_frames_per_block=50
+        ... )
+        >>> frames, timestamps = next(reader)
+        >>> frames.shape, timestamps[:3]
+        ((50, 32, 32), array([0. , 0.2, 0.4]))
+        >>> reader, _ = build_sampled_reader_frame_blocks(
+        ...     media_path, FrameSampling(keyframes=True)
+        ... )
+        >>> frames, timestamps = next(reader)
+        >>> frames.shape, timestamps[:3]
+        ((14, 32, 32), array([0.  , 7.  , 9.08]))
+    """
+    packets_timestamps: Optional[npt.NDArray[np.float64]] = None
+    keyframes_timestamps: npt.NDArray[np.float64] = np.empty(0)
+    if not sampling.fps:
+        packets = _packets_timestamps(media_input)
+        if packets is not None:
+            packets_timestamps, keyframes = packets
+            keyframes_timestamps = packets_timestamps[keyframes]
+        elif sampling.keyframes:
+            # raise (before decoding) if the keyframes timestamps can't be read
+            raise ValueError(f"Can't read the keyframes timestamps from {media_input}")
+    reader, metadata = build_reader_frame_blocks(
+        media_input,
+        nb_frames_per_block=nb_frames_per_block,
+        ffmpeg_reduce_verbosity=ffmpeg_reduce_verbosity,
+        sampling=sampling,
+        decode_profile=decode_profile,
+    )
+
+    def _gen_sampled_blocks() -> (
+        Iterator[Tuple[npt.NDArray[np.uint8], npt.NDArray[np.float64]]]
+    ):
+        nb_frames_read = 0
+        previous_frame: Optional[npt.NDArray[np.uint8]] = None
+        previous_mafd = 0.0
+        for frames in reader:
+            frames_indices = np.arange(nb_frames_read, nb_frames_read + len(frames))
+            nb_frames_read += len(frames)
+            if sampling.fps:
+                yield frames, frames_indices / sampling.fps
+            elif sampling.keyframes:
+                if nb_frames_read > len(keyframes_timestamps):
+                    raise RuntimeError(
+                        f"More keyframes decoded than keyframes packets in {media_input}"
+                    )
+                yield frames, keyframes_timestamps[frames_indices[0] : nb_frames_read]
+            else:
+                scores, previous_mafd = _scene_scores(
+                    frames, previous_frame, previous_mafd
+                )
+                # copy: the block of frames is a view into the reader ring buffer
+                previous_frame = frames[-1].copy()
+                is_scene_change = scores > (sampling.scene_threshold or 0)
+                if packets_timestamps is None:
+                    # binary stream: timestamps of a constant frame rate
+                    timestamps = frames_indices[is_scene_change] / metadata.fps
+                elif nb_frames_read > len(packets_timestamps):
+                    raise RuntimeError(
+                        f"More frames decoded than video packets in {media_input}"
+                    )
+                else:
+                    timestamps = packets_timestamps[frames_indices[is_scene_change]]
+                yield frames[is_scene_change], timestamps
+
+    return _gen_sampled_blocks(), metadata
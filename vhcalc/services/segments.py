@@ -0,0 +1,203 @@
+"""
+Split a media into segments (on keyframes boundaries) decoded and hashed in parallel.
+"""
+
+import subprocess  # nosec
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from functools import partial
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+from imageio_ffmpeg import get_ffmpeg_exe
+from loguru import logger
+
+from vhcalc.models import DecodeProfile, ImageHashingFunction, MediaSegment
+from vhcalc.services.reader_frames import build_reader_frame_blocks
+from vhcalc.tools.imghash import rawframes_to_imghashes
+
+AV_NOPTS_VALUE = -(2**63)
+
+
+def probe_video_packets(
+    media: Union[Path, str],
+) -> Tuple[list[int], list[int], Fraction]:
+    """
+    Demux (without decoding) the first video stream of a media.
+
+    Args:
+        media (Union[Path, str]): path (or URL) to the media
+
+    Returns:
+        Tuple[list[int], list[int], Fraction]: the packets presentation timestamps
+            (sorted, i.e. in frames order), the indices of the keyframes
+            and the time base of the timestamps.
+
+    Examples:
+        >>> pts, keyframes, time_base = probe_video_packets(
+        ...     Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        ... )
+        >>> len(pts), keyframes[:3], time_base
+        (812, [0, 175, 227], Fraction(1, 1000))
+    """
+    cmd = [
+        get_ffmpeg_exe(),
+        *"-hide_banner -nostats -nostdin".split(" "),
+        *("-i", str(media)),
+        *("-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"),
+    ]
+    framecrc = subprocess.check_output(cmd, stderr=subprocess.DEVNULL)  # nosec
+
+    time_base = Fraction(1)
+    packets: list[Tuple[int, bool]] = []
+    for line in framecrc.decode().splitlines():
+        if line.startswith("#tb 0:"):
+            time_base = Fraction(line.split(":", 1)[1].strip())
+        elif line and not line.startswith("#"):
+            # stream_index, dts, pts, duration, size, crc[, F=flags (if not only key)]
+            fields = [field.strip() for field in line.split(",")]
+            flags = int(fields[6].removeprefix("F="), 16) if len(fields) > 6 else 0x1
+            packets.append((int(fields[2]), bool(flags & 0x1)))
+    packets.sort()
+    pts = [packet_pts for packet_pts, _ in packets]
+    keyframes = [i for i, (_, is_keyframe) in enumerate(packets) if is_keyframe]
+    return pts, keyframes, time_base
+
+
+def split_media_into_segments(
+    media: Path, nb_segments: int, start_frame: int = 0
+) -> list[MediaSegment]:
+    """
+    Split a media (from its frame `start_frame`) into (at most) `nb_segments` segments
+    starting on keyframes (except the first one, starting on `start_frame`).
+
+    Each segment is decoded from a seek between its first frame and the previous one,
+    so concatenating the frames of the segments gives the frames of the media.
+    Media with a variable frame rate (or without timestamps) are not split.
+
+    Args:
+        media (Path): path to the media
+        nb_segments (int): number of segments wanted
+        start_frame (int): index of the first frame of the first segment
+
+    Returns:
+        list[MediaSegment]: segments of the media (sorted and contiguous)
+
+    Raises:
+        ValueError: if the media can't be decoded from `start_frame` (frame accurately)
+
+    Examples:
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> segments = split_media_into_segments(media_path, nb_segments=3)
+        >>> [(segment.start_frame, segment.nb_frames) for segment in segments]
+        [(0, 280), (280, 269), (549, 263)]
+        >>> segments = split_media_into_segments(media_path, nb_segments=2, start_frame=500)
+        >>> [(segment.start_frame, segment.nb_frames) for segment in segments]
+        [(500, 150), (650, 162)]
+    """
+    pts, keyframes, time_base = probe_video_packets(media)
+    nb_frames = len(pts)
+    pts_deltas = np.diff(pts)
+    is_seekable = (
+        nb_frames > 1
+        and AV_NOPTS_VALUE not in pts
+        and int(pts_deltas.max()) - int(pts_deltas.min()) <= 1
+    )
+    if not 0 <= start_frame < nb_frames or (start_frame and not is_seekable):
+        raise ValueError(f"Can't decode {media} from its frame {start_frame}")
+    if not is_seekable and nb_segments > 1:
+        logger.warning(f"{media} can't be split, decoded in one segment.")
+        nb_segments = 1
+
+    # keyframes closest to the ideal (same number of frames) boundaries
+    segments_keyframes = [keyframe for keyframe in keyframes if keyframe > start_frame]
+    segments_starts = sorted(
+        {start_frame}
+        | {
+            min(segments_keyframes, key=lambda keyframe: abs(keyframe - ideal_start))
+            for ideal_start in np.linspace(
+                start_frame, nb_frames, nb_segments, endpoint=False
+            )[1:]
+            if segments_keyframes
+        }
+    )
+    return [
+        MediaSegment(
+            start_frame=start,
+            nb_frames=end - start,
+            seek_time=(
+                float((pts[start - 1] + pts[start]) / 2 * time_base) if start else 0
+            ),
+        )
+        for start, end in zip(segments_starts, segments_starts[1:] + [nb_frames])
+    ]
+
+
+def _segment_to_imghashes(
+    media: Path,
+    segment: MediaSegment,
+    nb_frames_per_block: int,
+    fn_imagehash: ImageHashingFunction,
+    decode_profile: Optional[DecodeProfile] = None,
+) -> npt.NDArray[np.uint8]:
+    it_reader_chunk_frames, _ = build_reader_frame_blocks(
+        media,
+        nb_frames_per_block=nb_frames_per_block,
+        segment=segment,
+        ffmpeg_reduce_verbosity=True,
+        decode_profile=decode_profile,
+    )
+    return np.concatenate(
+        [
+            rawframes_to_imghashes(chunk_frames, fn_imagehash=fn_imagehash)
+            for chunk_frames in it_reader_chunk_frames
+        ]
+        or [np.empty((0, 8), dtype=np.uint8)]
+    )
+
+
+def segments_to_imghashes(
+    media: Path,
+    jobs: int,
+    nb_frames_per_block: int = 15 * 25,
+    fn_imagehash: ImageHashingFunction = ImageHashingFunction.PerceptualHashing,
+    start_frame: int = 0,
+    decode_profile: Optional[DecodeProfile] = None,
+) -> Iterator[npt.NDArray[np.uint8]]:
+    """
+    Compute images hashes of a media split into `jobs` segments decoded (one ffmpeg per
+    segment) and hashed in a pool of `jobs` processes.
+
+    Args:
+        media (Path): path to the media
+        jobs (int): number of segments/processes
+        nb_frames_per_block (int): number of frames hashed per block (in each process)
+        fn_imagehash (ImageHashingFunction): ImageHash function
+        start_frame (int): index of the first frame to hash
+        decode_profile (Optional[DecodeProfile]): ffmpeg decoding options
+
+    Yields:
+        np.ndarray: binary images hashes (N, 8) of each segment, in the media order.
+
+    Examples:
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> sum(map(len, segments_to_imghashes(media_path, jobs=2)))
+        812
+    """
+    segments = split_media_into_segments(
+        media, nb_segments=jobs, start_frame=start_frame
+    )
+    with ProcessPoolExecutor(max_workers=min(jobs, len(segments))) as executor:
+        # map: results are yielded in the segments order
+        yield from executor.map(
+            partial(
+                _segment_to_imghashes,
+                media,
+                nb_frames_per_block=nb_frames_per_block,
+                fn_imagehash=fn_imagehash,
+                decode_profile=decode_profile,
+            ),
+            segments,
+        )
@@ -0,0 +1,187 @@
+"""
+Hash blocks of frames in a pool of processes without copying the frames between
+processes: ffmpeg frames are read straight into slabs of a shared memory block,
+the workers hash a slab in place and write its (packed) images hashes into the
+results region of the shared memory, only slabs indices cross the processes
+boundaries.
+"""
+
+import contextlib
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BufferedReader
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Deque, Generator, Iterator, Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+
+from vhcalc.models import URL, DecodeProfile, ImageHashingFunction, MediaSegment
+from vhcalc.services.reader_frames import build_reader_frame_blocks
+from vhcalc.tools.imghash import FRAME_SIZE, imghashes_as_uint64, rawframes_to_imghashes
+from vhcalc.tools.metrics import PipelineMetrics
+
+_FRAMESIZE_BYTES = FRAME_SIZE * FRAME_SIZE
+
+# shared memory views of a worker process (set by its initializer)
+_worker_shm: Optional[SharedMemory] = None
+_worker_slabs: Optional[Tuple[npt.NDArray[np.uint8], npt.NDArray[np.uint8]]] = None
+
+
+def nb_slabs_for(processes: int) -> int:
+    """
+    Number of slabs of the shared memory for `processes` workers: a slab hashed by
+    each worker, a slab queued for each worker and the slab being read.
+
+    >>> nb_slabs_for(4)
+    9
+    """
+    return 2 * processes + 1
+
+
+def _slabs_views(
+    buffer: memoryview, nb_slabs: int, nb_frames_per_slab: int
+) -> Tuple[npt.NDArray[np.uint8], npt.NDArray[np.uint8]]:
+    # frames region: ring buffer of the frames reader (a slab per block of frames)
+    frames: npt.NDArray[np.uint8] = np.ndarray(
+        (nb_slabs * nb_frames_per_slab, _FRAMESIZE_BYTES), dtype=np.uint8, buffer=buffer
+    )
+    # results region: binary images hashes of each slab
+    results: npt.NDArray[np.uint8] = np.ndarray(
+        (nb_slabs, nb_frames_per_slab, 8),
+        dtype=np.uint8,
+        buffer=buffer,
+        offset=frames.nbytes,
+    )
+    return frames, results
+
+
+def _attach_slabs(shm_name: str, nb_slabs: int, nb_frames_per_slab: int) -> None:
+    global _worker_shm, _worker_slabs
+    # the shared memory is owned (and unlinked) by the parent process
+    _worker_shm = SharedMemory(name=shm_name)
+    assert _worker_shm.buf is not None  # nosec
+    _worker_slabs = _slabs_views(_worker_shm.buf, nb_slabs, nb_frames_per_slab)
+
+
+def _hash_slab(slab: int, nb_frames: int, fn_imagehash: ImageHashingFunction) -> float:
+    assert _worker_slabs is not None  # nosec
+    start = time.perf_counter()
+    frames, results = _worker_slabs
+    nb_frames_per_slab = results.shape[1]
+    first_frame = slab * nb_frames_per_slab
+    results[slab, :nb_frames] = rawframes_to_imghashes(
+        frames[first_frame : first_frame + nb_frames].reshape(
+            -1, FRAME_SIZE, FRAME_SIZE
+        ),
+        fn_imagehash=fn_imagehash,
+    )
+    return time.perf_counter() - start
+
+
+def _pop_imghashes(
+    pending: Deque[Tuple[int, int, "Future[float]"]],
+    results: npt.NDArray[np.uint8],
+    metrics: PipelineMetrics,
+) -> npt.NDArray[np.uint64]:
+    metrics.observe("pending_blocks", len(pending))
+    slab, nb_frames, future = pending.popleft()
+    metrics.record("hash", future.result(), nb_frames)
+    # copy: the results slab is overwritten by the next blocks
+    return imghashes_as_uint64(results[slab, :nb_frames].copy())
+
+
+def shm_hash_frame_blocks(
+    media_input: Union[Path, BufferedReader, URL],
+    nb_frames_per_block: int,
+    processes: int,
+    fn_imagehash: ImageHashingFunction = ImageHashingFunction.PerceptualHashing,
+    decode_profile: Optional[DecodeProfile] = None,
+    segment: Optional[MediaSegment] = None,
+    metrics: Optional[PipelineMetrics] = None,
+) -> Generator[npt.NDArray[np.uint64], None, None]:
+    """
+    Compute the images hashes of a media by blocks of frames, hashed in a pool of
+    `processes` processes sharing the frames (and their images hashes) with the
+    reader through a shared memory.
+
+    The blocks of frames are read (from ffmpeg) in the slabs of the shared memory
+    used as the reader ring buffer, and hashed (in order) while the next blocks are
+    read. A slab is read again once its images hashes are yielded: at most
+    `nb_slabs_for(processes) - 1` blocks are pending. The shared memory is released
+    when the generator is exhausted or closed.
+
+    Args:
+        media_input (Union[Path, BufferedReader, URL]): media to decode
+        nb_frames_per_block (int): number of frames per block (i.e. per slab)
+        processes (int): number of hashing processes
+        fn_imagehash (ImageHashingFunction): ImageHash function
+        decode_profile (Optional[DecodeProfile]): ffmpeg decoding options
+        segment (Optional[MediaSegment]): only decode the frames of a segment
+        metrics (Optional[PipelineMetrics]): metrics where the read stage, the hash
+            stage (time spent in the workers), the `pending_blocks` gauge and the
+            pump of a binary stream (see `build_reader_frame_blocks`) are recorded
+
+    Yields:
+        npt.NDArray[np.uint64]: images hashes of the next block of frames
+
+    Examples:
+        >>> media_path = Path("tests/data/big_buck_bunny_trailer_480p.mkv")
+        >>> chunks_imghashes = list(shm_hash_frame_blocks(media_path, 375, processes=2))
+        >>> [len(chunk_imghashes) for chunk_imghashes in chunks_imghashes]
+        [375, 375, 62]
+        >>> hex(chunks_imghashes[0][0])
+        '0xd5d52ad52ad42ad4'
+    """
+    metrics = metrics or PipelineMetrics(str(media_input))
+    nb_slabs = nb_slabs_for(processes)
+    shm = SharedMemory(
+        create=True, size=nb_slabs * nb_frames_per_block * (_FRAMESIZE_BYTES + 8)
+    )
+    assert shm.buf is not None  # nosec
+    frames, results = _slabs_views(shm.buf, nb_slabs, nb_frames_per_block)
+    it_reader_blocks: Optional[Iterator[npt.NDArray[np.uint8]]] = None
+    block: Optional[npt.NDArray[np.uint8]] = None
+    pending: Deque[Tuple[int, int, "Future[float]"]] = deque()
+    # the workers processes are started (and attached) on the first block submitted.
+    # They aren't forked from this process: a forked worker would inherit (and keep
+    # open) the ffmpeg stdin pipe of a binary stream, ffmpeg would never get its EOF
+    executor = ProcessPoolExecutor(
+        processes,
+        mp_context=multiprocessing.get_context("forkserver"),
+        initializer=_attach_slabs,
+        initargs=(shm.name, nb_slabs, nb_frames_per_block),
+    )
+    try:
+        it_reader_blocks, _ = build_reader_frame_blocks(
+            media_input,
+            nb_frames_per_block=nb_frames_per_block,
+            ring_buffer=frames,
+            segment=segment,
+            decode_profile=decode_profile,
+            metrics=metrics,
+        )
+        for index, block in enumerate(
+            metrics.timed_iter("read", it_reader_blocks, count=len)
+        ):
+            slab = index % nb_slabs
+            future = executor.submit(_hash_slab, slab, len(block), fn_imagehash)
+            pending.append((slab, len(block), future))
+            # the next block is read in the slab of the oldest pending block
+            if len(pending) == nb_slabs:
+                yield _pop_imghashes(pending, results, metrics)
+        while pending:
+            yield _pop_imghashes(pending, results, metrics)
+    finally:
+        # the workers are detached from the shared memory once they exit
+        executor.shutdown(cancel_futures=True)
+        # release the views on the shared memory (the reader ring buffer included)
+        del frames, results, block, it_reader_blocks
+        # the views can still be referenced by the traceback of a reader error:
+        # the memory is then released with them, its name is unlinked anyway
+        with contextlib.suppress(BufferError):
+            shm.close()
+        shm.unlink()
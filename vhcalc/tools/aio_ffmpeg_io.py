@@ -0,0 +1,131 @@
+"""
+asyncio reader of raw frames decoded by ffmpeg from an (async) binary stream.
+
+Same as `vhcalc.tools.forked.imageio_ffmpeg_io.read_frames_from_binary_stream`, but
+the ffmpeg process is driven by the event loop (`asyncio.create_subprocess_exec`):
+its stdin is fed, and its stdout and stderr are read, by tasks instead of threads,
+so a single process can run many ffmpeg pipelines concurrently.
+"""
+
+import asyncio
+import collections
+import contextlib
+import subprocess  # nosec
+from typing import AsyncGenerator, AsyncIterable, Deque, Final, Optional
+
+import numpy as np
+import numpy.typing as npt
+from imageio_ffmpeg import get_ffmpeg_exe
+
+# number of (last) lines of the ffmpeg log reported on errors
+NB_STDERR_LINES: Final[int] = 20
+
+
+async def _write_to_input_stream(
+    stdin: asyncio.StreamWriter, byte_chunks: AsyncIterable[bytes]
+) -> None:
+    try:
+        async for chunk in byte_chunks:
+            stdin.write(chunk)
+            # backpressure: wait for ffmpeg to consume its input
+            await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg has stopped reading its input (e.g. the frames reader is closed)
+        pass
+    finally:
+        stdin.close()
+
+
+async def _catch_log(stderr: asyncio.StreamReader, log_lines: Deque[str]) -> None:
+    # the log is drained (ffmpeg blocks on a full stderr pipe), its end is kept
+    while line := await stderr.readline():
+        log_lines.append(line.decode(errors="replace").rstrip())
+
+
+async def aread_frame_blocks_from_stream(
+    byte_chunks: AsyncIterable[bytes],
+    framesize_bytes: int,
+    nb_frames_per_block: int,
+    pix_fmt: str = "gray",
+    input_params: Optional[list[str]] = None,
+    output_params: Optional[list[str]] = None,
+) -> AsyncGenerator[npt.NDArray[np.uint8], None]:
+    """
+    Decode an async binary stream with ffmpeg and yield blocks of raw frames.
+
+    Args:
+        byte_chunks (AsyncIterable[bytes]): content of the media (e.g. chunks of an
+            HTTP upload), sent to ffmpeg stdin
+        framesize_bytes (int): size of a (rescaled) frame in bytes, set by the output
+            parameters (e.g. a scale filter)
+        nb_frames_per_block (int): number of frames per block (the last block can be
+            shorter)
+        pix_fmt (str): pixel format of the frames
+        input_params (Optional[list[str]]): ffmpeg input options
+        output_params (Optional[list[str]]): ffmpeg output options
+
+    Yields:
+        npt.NDArray[np.uint8]: next block of frames, with shape
+            (nb_frames, framesize_bytes), owning its memory
+
+    Raises:
+        RuntimeError: ffmpeg failed (with the end of its log) or the stream ended
+            before a full frame could be read
+    """
+    cmd = [
+        get_ffmpeg_exe(),
+        *("-hide_banner", "-nostats", "-loglevel", "error"),
+        *(input_params or []),
+        *("-i", "pipe:0"),
+        *("-pix_fmt", pix_fmt, "-vcodec", "rawvideo", "-f", "image2pipe"),
+        *(output_params or []),
+        "-",
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    assert process.stdin and process.stdout and process.stderr  # nosec
+    log_lines: Deque[str] = collections.deque(maxlen=NB_STDERR_LINES)
+    writer = asyncio.ensure_future(_write_to_input_stream(process.stdin, byte_chunks))
+    log_catcher = asyncio.ensure_future(_catch_log(process.stderr, log_lines))
+    block_size_bytes = framesize_bytes * nb_frames_per_block
+    try:
+        while True:
+            try:
+                block = await process.stdout.readexactly(block_size_bytes)
+            except asyncio.IncompleteReadError as error:
+                # end of the stream: last (shorter) block
+                block = error.partial
+            nb_frames, nb_bytes_left = divmod(len(block), framesize_bytes)
+            if nb_bytes_left:
+                raise RuntimeError(
+                    "End of file reached before full frame could be read."
+                )
+            if nb_frames:
+                yield np.frombuffer(block, dtype=np.uint8).reshape(
+                    nb_frames, framesize_bytes
+                )
+            if len(block) < block_size_bytes:
+                break
+
+        # raise the errors of the input stream
+        await writer
+        if await process.wait():
+            await log_catcher
+            log = "\n".join(log_lines)
+            raise RuntimeError(
+                f"ffmpeg failed (exit code: {process.returncode})\n"
+                f"=== stderr ===\n{log}"
+            )
+    finally:
+        writer.cancel()
+        if process.returncode is None:
+            # the frames reader is closed (or failed) before the end of the stream
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+            await process.wait()
+        log_catcher.cancel()
+        await asyncio.gather(writer, log_catcher, return_exceptions=True)
@@ -0,0 +1,181 @@
+"""
+Vectorized (batch) versions of the `imagehash` functions used by vhcalc.
+
+Each function takes a stack of gray frames `(N, FRAME_SIZE, FRAME_SIZE)` (uint8)
+and returns the packed images hashes `(N, 8)` (uint8), bit-identical to
+`imghash_to_bytes(fn_imagehash(Image.fromarray(frame)))` for each frame.
+
+- [Pillow: libImaging/Resample.c](https://github.com/python-pillow/Pillow/blob/main/src/libImaging/Resample.c)
+- [imagehash: __init__.py](https://github.com/JohannesBuchner/imagehash/blob/master/imagehash/__init__.py)
+"""
+
+import math
+from functools import lru_cache
+from typing import Callable, Final
+
+import imagehash
+import numpy as np
+import numpy.typing as npt
+import pywt
+import scipy.fftpack
+
+HASH_SIZE: Final[int] = 8
+
+# Pillow fixed point precision used for 8 bits per channel images
+_PIL_PRECISION_BITS: Final[int] = 32 - 8 - 2
+_PIL_LANCZOS_SUPPORT: Final[float] = 3.0
+
+
+def _pil_sinc(x: float) -> float:
+    if x == 0.0:
+        return 1.0
+    x = x * math.pi
+    return math.sin(x) / x
+
+
+def _pil_lanczos(x: float) -> float:
+    if -3.0 <= x < 3.0:
+        return _pil_sinc(x) * _pil_sinc(x / 3)
+    return 0.0
+
+
+@lru_cache(maxsize=None)
+def _pil_lanczos_coeffs(in_size: int, out_size: int) -> npt.NDArray[np.int64]:
+    """Dense (out_size, in_size) matrix of the fixed point coefficients computed by Pillow
+    (`precompute_coeffs` + `normalize_coeffs_8bpc`) for a LANCZOS resampling.
+
+    >>> _pil_lanczos_coeffs(32, 8).shape
+    (8, 32)
+    >>> int(_pil_lanczos_coeffs(32, 8).sum(axis=1).min()) >= (1 << 22) - 32
+    True
+    """
+    scale = filterscale = in_size / out_size
+    filterscale = max(filterscale, 1.0)
+    support = _PIL_LANCZOS_SUPPORT * filterscale
+
+    coeffs = np.zeros((out_size, in_size), dtype=np.int64)
+    for xx in range(out_size):
+        center = (xx + 0.5) * scale
+        ss = 1.0 / filterscale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size) - xmin
+        weights = [_pil_lanczos((x + xmin - center + 0.5) * ss) for x in range(xmax)]
+        ww = sum(weights)
+        for x, w in enumerate(weights):
+            if ww != 0.0:
+                w /= ww
+            coeffs[xx, x + xmin] = (
+                int(-0.5 + w * (1 << _PIL_PRECISION_BITS))
+                if w < 0
+                else int(0.5 + w * (1 << _PIL_PRECISION_BITS))
+            )
+    return coeffs
+
+
+def _pil_clip8(acc: npt.NDArray[np.int64]) -> npt.NDArray[np.uint8]:
+    clipped: npt.NDArray[np.uint8] = np.clip(acc >> _PIL_PRECISION_BITS, 0, 255).astype(
+        np.uint8
+    )
+    return clipped
+
+
+def resize_lanczos(
+    frames: npt.NDArray[np.uint8], width: int, height: int
+) -> npt.NDArray[np.uint8]:
+    """Resize a stack of gray frames like `PIL.Image.resize((width, height), LANCZOS)`.
+
+    >>> frames = np.random.default_rng(0).integers(0, 256, (4, 32, 32), dtype=np.uint8)
+    >>> from PIL import Image
+    >>> all(
+    ...     np.array_equal(
+    ...         resized,
+    ...         np.asarray(Image.fromarray(frame).resize((9, 8), Image.Resampling.LANCZOS)),
+    ...     )
+    ...     for frame, resized in zip(frames, resize_lanczos(frames, 9, 8))
+    ... )
+    True
+    """
+    _, in_height, in_width = frames.shape
+    if (in_width, in_height) == (width, height):
+        return frames
+    half = np.int64(1 << (_PIL_PRECISION_BITS - 1))
+    # two-pass resize, horizontal pass first (like Pillow)
+    if in_width != width:
+        frames = _pil_clip8(
+            frames.astype(np.int64) @ _pil_lanczos_coeffs(in_width, width).T + half
+        )
+    if in_height != height:
+        frames = _pil_clip8(
+            _pil_lanczos_coeffs(in_height, height) @ frames.astype(np.int64) + half
+        )
+    return frames
+
+
+def _pack_hashes(diff: npt.NDArray[np.bool_]) -> npt.NDArray[np.uint8]:
+    return np.packbits(diff.reshape(len(diff), -1), axis=1)
+
+
+def _median_per_frame(values: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    return np.median(values.reshape(len(values), -1), axis=1)[:, None, None]
+
+
+def average_hash(frames: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+    """Batch version of `imagehash.average_hash`"""
+    pixels = resize_lanczos(frames, HASH_SIZE, HASH_SIZE)
+    avg = pixels.reshape(len(pixels), -1).mean(axis=1)[:, None, None]
+    return _pack_hashes(pixels > avg)
+
+
+def phash(frames: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+    """Batch version of `imagehash.phash`
+
+    The DCT is the one used by `imagehash` (scipy.fftpack) applied on the whole stack,
+    a DCT through a matrix product doesn't produce the same floating point noise and
+    flips bits on flat frames (where all the AC coefficients are close to the median).
+    """
+    pixels = resize_lanczos(frames, HASH_SIZE * 4, HASH_SIZE * 4)
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(pixels, axis=1), axis=2)
+    dctlowfreq = dct[:, :HASH_SIZE, :HASH_SIZE]
+    return _pack_hashes(dctlowfreq > _median_per_frame(dctlowfreq))
+
+
+def phash_simple(frames: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+    """Batch version of `imagehash.phash_simple`"""
+    pixels = resize_lanczos(frames, HASH_SIZE * 4, HASH_SIZE * 4)
+    dct = scipy.fftpack.dct(pixels)
+    dctlowfreq = dct[:, :HASH_SIZE, 1 : HASH_SIZE + 1]
+    avg = np.array([frame_dctlowfreq.mean() for frame_dctlowfreq in dctlowfreq])
+    return _pack_hashes(dctlowfreq > avg[:, None, None])
+
+
+def dhash(frames: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+    """Batch version of `imagehash.dhash`"""
+    pixels = resize_lanczos(frames, HASH_SIZE + 1, HASH_SIZE)
+    return _pack_hashes(pixels[:, :, 1:] > pixels[:, :, :-1])
+
+
+def whash(frames: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+    """Batch version of `imagehash.whash` (with default parameters: haar mode)"""
+    image_scale = max(2 ** int(np.log2(min(frames.shape[1:]))), HASH_SIZE)
+    ll_max_level = int(np.log2(image_scale))
+    dwt_level = ll_max_level - int(np.log2(HASH_SIZE))
+
+    pixels = resize_lanczos(frames, image_scale, image_scale) / 255.0
+    # Remove low level frequency LL(max_ll)
+    coeffs = list(pywt.wavedec2(pixels, "haar", level=ll_max_level, axes=(1, 2)))
+    coeffs[0] *= 0
+    pixels = pywt.waverec2(coeffs, "haar", axes=(1, 2))
+    # Use LL(K) as freq, where K is log2(HASH_SIZE)
+    dwt_low = pywt.wavedec2(pixels, "haar", level=dwt_level, axes=(1, 2))[0]
+    return _pack_hashes(dwt_low > _median_per_frame(dwt_low))
+
+
+BATCH_IMGHASH_FUNCTIONS: Final[
+    dict[Callable[..., imagehash.ImageHash], Callable[[np.ndarray], np.ndarray]]
+] = {
+    imagehash.average_hash: average_hash,
+    imagehash.phash: phash,
+    imagehash.phash_simple: phash_simple,
+    imagehash.dhash: dhash,
+    imagehash.whash: whash,
+}
@@ -0,0 +1,283 @@
+"""
+Benchmark of the decode → hash → write pipeline, stage by stage, on synthetic videos
+(generated with the ffmpeg `testsrc` source).
+
+Stages timed (each one on the frames of the previous ones, already in memory):
+    - decode: ffmpeg decoding only (frames discarded by the null muxer)
+    - read[profile]: frames decoded, rescaled and read (copied) from ffmpeg stdout,
+      for each decode profile (see `vhcalc.models.DECODE_PROFILES`)
+    - rawframe_to_imghash[method]: images hashes computed frame by frame (PIL)
+    - rawframes_to_imghashes[method]: images hashes computed in batch (numpy)
+    - imghash_to_bytes: images hashes converted to binary
+    - write: binary images hashes written (`HashSink`)
+
+Run with `python -m vhcalc.tools.benchmark` (or `invoke bench`), results are saved as
+JSON to compare runs (`--compare`), with the peak resident set size of the benchmark
+process (and of its children): the peak of the whole run, not of a stage.
+"""
+
+import argparse
+import json
+import platform
+import resource
+import subprocess  # nosec
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from importlib.metadata import version
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence
+
+import numpy as np
+import numpy.typing as npt
+from imageio_ffmpeg import get_ffmpeg_exe
+
+from vhcalc.models import DECODE_PROFILES, ImageHashingFunction
+from vhcalc.services.reader_frames import build_reader_frame_blocks
+from vhcalc.tools.hash_sink import HashSink
+from vhcalc.tools.imghash import (
+    bytes_to_imghash,
+    imghash_to_bytes,
+    rawframe_to_imghash,
+    rawframes_to_imghashes,
+)
+
+
+@dataclass
+class StageResult:
+    """`nb_frames` processed by a stage in `seconds` (best of the repeats)"""
+
+    name: str
+    nb_frames: int
+    seconds: float
+    fps: float
+
+
+def generate_testsrc_video(
+    output_file: Path,
+    duration: float = 10,
+    size: str = "854x480",
+    rate: float = 25,
+    codec: str = "libx264",
+) -> Path:
+    """Generate a synthetic video with the ffmpeg `testsrc` source"""
+    subprocess.run(  # nosec
+        [
+            get_ffmpeg_exe(),
+            *("-hide_banner", "-loglevel", "error", "-y"),
+            *(
+                "-f",
+                "lavfi",
+                "-i",
+                f"testsrc=duration={duration}:size={size}:rate={rate}",
+            ),
+            *("-c:v", codec, "-pix_fmt", "yuv420p"),
+            str(output_file),
+        ],
+        check=True,
+    )
+    return output_file
+
+
+def _peak_rss_kib(who: int) -> int:
+    # peak of the process lifetime: a stage can't be measured alone
+    # ru_maxrss is in bytes on macOS, in KiB on Linux
+    max_rss = resource.getrusage(who).ru_maxrss
+    return max_rss // 1024 if sys.platform == "darwin" else max_rss
+
+
+def _time_stage(
+    name: str, nb_frames: int, fn_stage: Callable[[], Any], repeat: int
+) -> StageResult:
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn_stage()
+        seconds = min(seconds, time.perf_counter() - start)
+    return StageResult(
+        name=name,
+        nb_frames=nb_frames,
+        seconds=seconds,
+        fps=nb_frames / seconds if seconds else float("inf"),
+    )
+
+
+def _read_frames(media: Path, **kwargs: Any) -> npt.NDArray[np.uint8]:
+    reader, _ = build_reader_frame_blocks(
+        media, nb_frames_per_block=375, ffmpeg_reduce_verbosity=True, **kwargs
+    )
+    # copy: the blocks are views into the reader ring buffer
+    return np.concatenate([frames.copy() for frames in reader])
+
+
+def benchmark_pipeline(
+    media: Path,
+    methods: Sequence[ImageHashingFunction] = (ImageHashingFunction.PerceptualHashing,),
+    repeat: int = 1,
+) -> list[StageResult]:
+    """
+    Time each stage of the pipeline on a media.
+
+    Args:
+        media (Path): media to decode and hash
+        methods (Sequence[ImageHashingFunction]): images hashing methods benchmarked
+        repeat (int): number of runs of each stage (the best one is kept)
+
+    Returns:
+        list[StageResult]: results of the stages, in the pipeline order
+    """
+    frames = _read_frames(media)
+    nb_frames = len(frames)
+    results = [
+        _time_stage(
+            "decode",
+            nb_frames,
+            lambda: subprocess.run(  # nosec
+                [
+                    get_ffmpeg_exe(),
+                    "-nostdin",
+                    "-i",
+                    str(media),
+                    "-an",
+                    "-f",
+                    "null",
+                    "-",
+                ],
+                check=True,
+                capture_output=True,
+            ),
+            repeat,
+        )
+    ]
+    results += [
+        _time_stage(
+            f"read[{name}]",
+            nb_frames,
+            lambda: _read_frames(media, decode_profile=decode_profile),
+            repeat,
+        )
+        for name, decode_profile in DECODE_PROFILES.items()
+    ]
+
+    for method in methods:
+        results.append(
+            _time_stage(
+                f"rawframe_to_imghash[{method.name}]",
+                nb_frames,
+                lambda: [
+                    rawframe_to_imghash(frame.tobytes(), fn_imagehash=method)
+                    for frame in frames
+                ],
+                repeat,
+            )
+        )
+        results.append(
+            _time_stage(
+                f"rawframes_to_imghashes[{method.name}]",
+                nb_frames,
+                lambda: rawframes_to_imghashes(frames, fn_imagehash=method),
+                repeat,
+            )
+        )
+    bin_imghashes = rawframes_to_imghashes(frames)
+    imghashes = [
+        bytes_to_imghash(bin_imghash.tobytes()) for bin_imghash in bin_imghashes
+    ]
+    results.append(
+        _time_stage(
+            "imghash_to_bytes",
+            nb_frames,
+            lambda: [imghash_to_bytes(imghash) for imghash in imghashes],
+            repeat,
+        )
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        def _write() -> None:
+            output_file = Path(tmp_dir) / "bench.phash"
+            output_file.unlink(missing_ok=True)
+            with HashSink(output_file) as hash_sink:
+                # one write per chunk of frames, as in the exports
+                for chunk in range(0, nb_frames, 375):
+                    hash_sink.write(bin_imghashes[chunk : chunk + 375])
+
+        results.append(_time_stage("write", nb_frames, _write, repeat))
+    return results
+
+
+def compare_results(
+    results: list[dict[str, Any]], previous_results: list[dict[str, Any]]
+) -> dict[str, float]:
+    """speedup (ratio of frames per second) of each stage from a previous run
+
+    >>> compare_results([{"name": "write", "fps": 300.0}], [{"name": "write", "fps": 200.0}])
+    {'write': 1.5}
+    """
+    previous_fps = {result["name"]: result["fps"] for result in previous_results}
+    return {
+        result["name"]: result["fps"] / previous_fps[result["name"]]
+        for result in results
+        if previous_fps.get(result["name"])
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--output", type=Path, default=Path("benchmark.json"))
+    parser.add_argument("--compare", type=Path, help="previous results (JSON)")
+    parser.add_argument("--media", type=Path, help="default: testsrc synthetic video")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--size", default="854x480")
+    parser.add_argument("--rate", type=float, default=25)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--methods",
+        nargs="+",
+        choices=ImageHashingFunction.names(),
+        default=[ImageHashingFunction.PerceptualHashing.name],
+    )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        media = args.media or generate_testsrc_video(
+            Path(tmp_dir) / "testsrc.mkv", args.duration, args.size, args.rate
+        )
+        results = benchmark_pipeline(
+            media,
+            methods=[ImageHashingFunction[method] for method in args.methods],
+            repeat=args.repeat,
+        )
+    report = {
+        "vhcalc": version("vhcalc"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "media": str(args.media) if args.media else "testsrc",
+        "size": args.size,
+        "rate": args.rate,
+        "duration": args.duration,
+        "stages": [asdict(result) for result in results],
+        "peak_rss_kib": _peak_rss_kib(resource.RUSAGE_SELF),
+        "peak_children_rss_kib": _peak_rss_kib(resource.RUSAGE_CHILDREN),
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+
+    speedups = (
+        compare_results(
+            report["stages"], json.loads(args.compare.read_text())["stages"]
+        )
+        if args.compare
+        else {}
+    )
+    for result in results:
+        speedup = f" (x{speedups[result.name]:.2f})" if result.name in speedups else ""
+        print(f"{result.name:<45} {result.fps:>10.1f} fps{speedup}")
+    print(
+        f"peak RSS: {report['peak_rss_kib']} KiB"
+        f" (children: {report['peak_children_rss_kib']} KiB)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,129 @@
+import os
 import subprocess
 import threading
 import time
 from typing import BinaryIO
 
+import numpy as np
 from imageio_ffmpeg import get_ffmpeg_exe
 from imageio_ffmpeg._parsing import LogCatcher, parse_ffmpeg_header
 from imageio_ffmpeg._utils import _popen_kwargs, logger
 
+from vhcalc.tools.stdin_pump import pump_to_pipe
+
+
+def read_frames_as_bytes(stream: BinaryIO, framesize_bytes: int):
+    """
+    Yield each frame read from `stream` as a new bytes object.
+
+    Example:
+
+        >>> from io import BytesIO
+        >>> list(read_frames_as_bytes(BytesIO(b"abcdef"), 3))
+        [b'abc', b'def']
+    """
+    while True:
+        bb = bytes()
+        while len(bb) < framesize_bytes:
+            extra_bytes = stream.read(framesize_bytes - len(bb))
+            if not extra_bytes:
+                if len(bb) == 0:
+                    return
+                else:
+                    raise RuntimeError(
+                        "End of file reached before full frame could be read."
+                    )
+            bb += extra_bytes
+        yield bb
+
+
+def read_frames_into_ring_buffer(
+    stream: BinaryIO,
+    framesize_bytes: int,
+    nb_frames_in_ring_buffer=None,
+    nb_frames_per_block=None,
+    ring_buffer=None,
+):
+    """
+    Read frames from `stream` with readinto() into a preallocated ring buffer.
+
+    If `nb_frames_per_block` is None, it yields each frame as a np.ndarray view
+    (shape: (framesize_bytes,)) into the ring buffer, otherwise it yields blocks of
+    frames (shape: (nb_frames, framesize_bytes)), the last one can be shorter.
+
+    No bytes object is allocated per frame, but a yielded view is only valid until
+    the ring buffer wraps around (i.e. `nb_frames_in_ring_buffer` frames later):
+    consumers keeping frames longer than that need to copy them.
+
+    Parameters:
+        stream (BinaryIO): stream (with readinto() method) to read frames from.
+        framesize_bytes (int): size of a frame in bytes.
+        nb_frames_in_ring_buffer (int): number of frames in the ring buffer.
+            Must be a multiple of `nb_frames_per_block`. Default to 2 blocks.
+        nb_frames_per_block (int): number of frames per yielded block.
+        ring_buffer (np.ndarray): preallocated ring buffer (e.g. in shared memory),
+            uint8 array with shape (nb_frames_in_ring_buffer, framesize_bytes).
+
+    Example:
+
+        >>> from io import BytesIO
+        >>> gen = read_frames_into_ring_buffer(BytesIO(b"abcdefgh"), 2, 4, 3)
+        >>> [block.tobytes() for block in gen]
+        Traceback (most recent call last):
+        ...
+        AssertionError: nb_frames_in_ring_buffer must be a multiple of nb_frames_per_block
+        >>> gen = read_frames_into_ring_buffer(BytesIO(b"abcdefgh"), 2, 4, 2)
+        >>> [block.tobytes() for block in gen]
+        [b'abcd', b'efgh']
+        >>> gen = read_frames_into_ring_buffer(BytesIO(b"abcdef"), 2, 4)
+        >>> [frame.tobytes() for frame in gen]
+        [b'ab', b'cd', b'ef']
+    """
+    frames_per_block = nb_frames_per_block or 1
+    if ring_buffer is not None:
+        assert ring_buffer.shape[1:] == (
+            framesize_bytes,
+        ), "ring_buffer rows must have the size of a frame"
+        nb_frames_in_ring_buffer = len(ring_buffer)
+    nb_frames_in_ring_buffer = nb_frames_in_ring_buffer or 2 * frames_per_block
+    assert (
+        nb_frames_in_ring_buffer % frames_per_block == 0
+    ), "nb_frames_in_ring_buffer must be a multiple of nb_frames_per_block"
+
+    if ring_buffer is None:
+        ring_buffer = np.empty(
+            (nb_frames_in_ring_buffer, framesize_bytes), dtype=np.uint8
+        )
+    ring_buffer_views = [
+        (
+            ring_buffer[i : i + frames_per_block],
+            memoryview(ring_buffer[i : i + frames_per_block]).cast("B"),
+        )
+        for i in range(0, nb_frames_in_ring_buffer, frames_per_block)
+    ]
+    block_size_bytes = frames_per_block * framesize_bytes
+
+    while True:
+        for block, mv_block in ring_buffer_views:
+            nb_bytes_read = 0
+            while nb_bytes_read < block_size_bytes:
+                n = stream.readinto(mv_block[nb_bytes_read:])
+                if not n:
+                    break
+                nb_bytes_read += n
+            nb_frames_read, nb_bytes_left = divmod(nb_bytes_read, framesize_bytes)
+            if nb_bytes_left:
+                raise RuntimeError(
+                    "End of file reached before full frame could be read."
+                )
+            if nb_frames_per_block is None:
+                if nb_frames_read:
+                    yield block[0]
+            elif nb_frames_read:
+                yield block[:nb_frames_read]
+            if nb_bytes_read < block_size_bytes:
+                return
+
 
 def read_frames_from_binary_stream(
     bin_io_stream: BinaryIO,
@@ -15,7 +132,11 @@ def read_frames_from_binary_stream(
     input_params=None,
     output_params=None,
     bits_per_pixel=None,
-    chunk_size_for_input_stream_reading: int = 8_192,
+    chunk_size_for_input_stream_reading=None,
+    nb_frames_in_ring_buffer=None,
+    nb_frames_per_block=None,
+    ring_buffer=None,
+    metrics=None,
 ):
     """
     Create a generator to iterate over the frames in a video file.
@@ -30,7 +151,9 @@ def read_frames_from_binary_stream(
     * duration: duration in seconds. Can be zero if it could not be detected.
 
     After that, it yields frames until the end of the video is reached. Each
-    frame is a bytes object.
+    frame is a bytes object, or a view (np.ndarray) into a reusable ring buffer
+    if `nb_frames_in_ring_buffer` or `nb_frames_per_block` is given
+    (see read_frames_into_ring_buffer()).
 
     This function makes no assumptions about the number of frames in
     the data. For one because this is hard to predict exactly, but also
@@ -58,7 +181,16 @@ def read_frames_from_binary_stream(
         bpp (int): DEPRECATED, USE bits_per_pixel INSTEAD. The number of bytes per pixel in the output frames.
             This depends on the given pix_fmt. Some pixel formats like yuv420p have 12 bits per pixel
             and cannot be set in bytes as integer. For this reason the bpp argument is deprecated.
-        chunk_size_for_input_stream_reading (int): size (in bits) used for chunk reading from input stream
+        chunk_size_for_input_stream_reading (int): size (in bytes) of the transfers from the input
+            stream into ffmpeg stdin, default to the size of the pipe buffer (see
+            vhcalc.tools.stdin_pump.pump_to_pipe()).
+        nb_frames_in_ring_buffer (int): number of frames of the ring buffer used for reading frames
+            without copy (see read_frames_into_ring_buffer()).
+        nb_frames_per_block (int): if given, yields blocks of (up to) this number of frames.
+        ring_buffer (np.ndarray): preallocated ring buffer (see read_frames_into_ring_buffer()).
+        metrics (PipelineMetrics): metrics where the time spent pumping the input stream
+            (and its number of bytes) is recorded as the `pump` stage, and the time spent
+            waiting for ffmpeg to drain its stdin as the `pump_stall` stage.
     """
 
     # ----- Input args
@@ -105,20 +237,29 @@ def read_frames_from_binary_stream(
     # [cpython/Lib/subprocess.py: def communicate(...)](https://github.com/python/cpython/blob/main/Lib/subprocess.py#L1174)
     # [Send input from one threaded subprocess to another](https://stackoverflow.com/questions/41287291/send-input-from-one-threaded-subprocess-to-another)
     def write_to_input_stream(_process, _bin_io_stream: BinaryIO):
-        logger.info(
-            f"starting to write to input stream ({chunk_size_for_input_stream_reading=} octets)"
-        )
-        # [Read file in chunks - RAM-usage, reading strings from binary files](https://stackoverflow.com/a/63563264)
+        logger.info("starting to write to input stream")
+        # written straight into the pipe (sendfile/splice for a file-backed stream),
+        # without the copy and the flush of stdin (python) buffer
         try:
-            while chunk := _bin_io_stream.read(chunk_size_for_input_stream_reading):
-                _process.stdin.write(chunk)
-                _process.stdin.flush()
+            stats = pump_to_pipe(
+                _bin_io_stream,
+                _process.stdin.fileno(),
+                buffer_size=chunk_size_for_input_stream_reading,
+            )
         # to prevent error occurred in doctest (at the end)
         except BrokenPipeError:
             pass
+        else:
+            logger.info(
+                f"input stream pumped with {stats.method}: {stats.nb_bytes} octets in "
+                f"{stats.seconds:.3f}s ({stats.throughput / 2**20:.1f} MiB/s), "
+                f"stalled {stats.stall_seconds:.3f}s"
+            )
+            if metrics is not None:
+                metrics.record("pump", stats.seconds, stats.nb_bytes)
+                metrics.record("pump_stall", stats.stall_seconds)
         finally:
             _process.stdin.close()
-            pass
 
     thread_write_to_input_stream = threading.Thread(
         target=write_to_input_stream, args=(process, bin_io_stream)
@@ -167,21 +308,24 @@ def read_frames_from_binary_stream(
         framesize_bytes = int(framesize_bytes)
         framenr = 0
 
+        if nb_frames_in_ring_buffer or nb_frames_per_block or ring_buffer is not None:
+            gen_frames = read_frames_into_ring_buffer(
+                process.stdout,
+                framesize_bytes,
+                nb_frames_in_ring_buffer=nb_frames_in_ring_buffer,
+                nb_frames_per_block=nb_frames_per_block,
+                ring_buffer=ring_buffer,
+            )
+        else:
+            gen_frames = read_frames_as_bytes(process.stdout, framesize_bytes)
+
         while True:
             framenr += 1
             try:
-                bb = bytes()
-                while len(bb) < framesize_bytes:
-                    extra_bytes = process.stdout.read(framesize_bytes - len(bb))
-                    if not extra_bytes:
-                        if len(bb) == 0:
-                            return
-                        else:
-                            raise RuntimeError(
-                                "End of file reached before full frame could be read."
-                            )
-                    bb += extra_bytes
-                yield bb
+                frame = next(gen_frames, None)
+                if frame is None:
+                    return
+                yield frame
             except Exception as err:
                 err1 = str(err)
                 err2 = log_catcher.get_text(0.4)
@@ -258,6 +402,9 @@ def read_frames_from_url(
     input_params=None,
     output_params=None,
     bits_per_pixel=None,
+    nb_frames_in_ring_buffer=None,
+    nb_frames_per_block=None,
+    ring_buffer=None,
 ):
     """
     Create a generator to iterate over the frames in a video file.
@@ -272,7 +419,9 @@ def read_frames_from_url(
     * duration: duration in seconds. Can be zero if it could not be detected.
 
     After that, it yields frames until the end of the video is reached. Each
-    frame is a bytes object.
+    frame is a bytes object, or a view (np.ndarray) into a reusable ring buffer
+    if `nb_frames_in_ring_buffer` or `nb_frames_per_block` is given
+    (see read_frames_into_ring_buffer()).
 
     This function makes no assumptions about the number of frames in
     the data. For one because this is hard to predict exactly, but also
@@ -300,6 +449,10 @@ def read_frames_from_url(
         bpp (int): DEPRECATED, USE bits_per_pixel INSTEAD. The number of bytes per pixel in the output frames.
             This depends on the given pix_fmt. Some pixel formats like yuv420p have 12 bits per pixel
             and cannot be set in bytes as integer. For this reason the bpp argument is deprecated.
+        nb_frames_in_ring_buffer (int): number of frames of the ring buffer used for reading frames
+            without copy (see read_frames_into_ring_buffer()).
+        nb_frames_per_block (int): if given, yields blocks of (up to) this number of frames.
+        ring_buffer (np.ndarray): preallocated ring buffer (see read_frames_into_ring_buffer()).
     """
 
     # ----- Input args
@@ -369,21 +522,24 @@ def read_frames_from_url(
         framesize_bytes = int(framesize_bytes)
         framenr = 0
 
+        if nb_frames_in_ring_buffer or nb_frames_per_block or ring_buffer is not None:
+            gen_frames = read_frames_into_ring_buffer(
+                process.stdout,
+                framesize_bytes,
+                nb_frames_in_ring_buffer=nb_frames_in_ring_buffer,
+                nb_frames_per_block=nb_frames_per_block,
+                ring_buffer=ring_buffer,
+            )
+        else:
+            gen_frames = read_frames_as_bytes(process.stdout, framesize_bytes)
+
         while True:
             framenr += 1
             try:
-                bb = bytes()
-                while len(bb) < framesize_bytes:
-                    extra_bytes = process.stdout.read(framesize_bytes - len(bb))
-                    if not extra_bytes:
-                        if len(bb) == 0:
-                            return
-                        else:
-                            raise RuntimeError(
-                                "End of file reached before full frame could be read."
-                            )
-                    bb += extra_bytes
-                yield bb
+                frame = next(gen_frames, None)
+                if frame is None:
+                    return
+                yield frame
             except Exception as err:
                 err1 = str(err)
                 err2 = log_catcher.get_text(0.4)
@@ -442,3 +598,14 @@ def read_frames_from_url(
             else:  # stop_policy == "kill"
                 # Just kill it
                 process.kill()
+
+
+def read_frames_from_path(path, **kwargs):
+    """
+    Same as read_frames_from_url() for a local media file: ffmpeg handles a path
+    as any other input url (used to get the ring buffer reading mode on files).
+    """
+    path = str(path)
+    if not os.path.isfile(path):
+        raise IOError("{} not found! Wrong path?".format(path))
+    return read_frames_from_url(path, **kwargs)
@@ -0,0 +1,83 @@
+"""
+Writer of binary images hashes (.phash) files.
+"""
+
+import os
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Optional, Type, Union
+
+import numpy as np
+import numpy.typing as npt
+
+
+class HashSink:
+    """
+    Append chunks of binary images hashes to a file, opened once (unbuffered).
+
+    Each chunk is written from its (contiguous) buffer without copy, with one `write`
+    syscall (or a few, on partial writes). The data written is only flushed to the
+    disk by `checkpoint` if `fsync_on_checkpoint` is set.
+
+    Examples:
+        >>> import tempfile
+        >>> output_file = Path(tempfile.mkdtemp()) / "export.phash"
+        >>> with HashSink(output_file) as sink:
+        ...     sink.write(np.full((2, 8), 0xD5, dtype=np.uint8))
+        ...     sink.write(b"\\x2a" * 8)
+        ...     sink.checkpoint()
+        >>> output_file.read_bytes().hex()
+        'd5d5d5d5d5d5d5d5d5d5d5d5d5d5d5d52a2a2a2a2a2a2a2a'
+        >>> sink.nbytes_written
+        24
+    """
+
+    def __init__(self, output_file: Path, fsync_on_checkpoint: bool = False):
+        self.output_file = output_file
+        self.fsync_on_checkpoint = fsync_on_checkpoint
+        self.nbytes_written = 0
+        self._fd: Optional[int] = None
+
+    def open(self) -> "HashSink":
+        self._fd = os.open(
+            self.output_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        return self
+
+    def write(self, imghashes: Union[npt.NDArray[Any], bytes]) -> None:
+        """Append a chunk of images hashes ((N, 8) array or bytes), or of any array
+        (written as its raw bytes)"""
+        if self._fd is None:
+            raise ValueError(f"{self.output_file} is not opened")
+        if isinstance(imghashes, bytes):
+            imghashes = np.frombuffer(imghashes, dtype=np.uint8)
+        buffer = np.ascontiguousarray(imghashes).reshape(-1).view(np.uint8).data
+        while buffer:
+            nbytes_written = os.write(self._fd, buffer)
+            self.nbytes_written += nbytes_written
+            buffer = buffer[nbytes_written:]
+
+    def checkpoint(self) -> None:
+        """Flush the images hashes written to the disk (if `fsync_on_checkpoint`)"""
+        if self._fd is not None and self.fsync_on_checkpoint:
+            os.fsync(self._fd)
+
+    def close(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            self.checkpoint()
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "HashSink":
+        return self.open()
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        self.close()
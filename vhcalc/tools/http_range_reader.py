@@ -0,0 +1,302 @@
+"""
+Python-side fetcher of an HTTP(S) media: the resource is pulled by range requests
+over a persistent (keep-alive) connection, into a read-ahead buffer filled by a
+fetcher thread, and the download is resumed (from the last byte received) after a
+disconnection. Its binary stream feeds ffmpeg stdin (see
+`vhcalc.tools.forked.imageio_ffmpeg_io.read_frames_from_binary_stream`), instead of
+ffmpeg pulling the URL itself.
+"""
+
+import http.client
+import io
+import queue
+import re
+import threading
+import time
+from typing import Any, Final, Optional
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+from vhcalc.tools.metrics import PipelineMetrics
+
+DEFAULT_RANGE_SIZE: Final[int] = 1024 * 1024
+DEFAULT_READ_AHEAD: Final[int] = 8 * 1024 * 1024
+DEFAULT_MAX_RETRIES: Final[int] = 5
+DEFAULT_RETRY_DELAY: Final[float] = 0.5
+DEFAULT_TIMEOUT: Final[float] = 10.0
+
+# end of the resource, queued by the fetcher thread
+_END: Final = object()
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+# errors of a request that can be retried (on a new connection)
+_RETRYABLE_ERRORS: Final = (OSError, http.client.HTTPException)
+
+
+class HTTPRangeReader(io.RawIOBase):
+    """
+    Raw binary stream of an HTTP(S) resource, fetched by ranges of `range_size` bytes
+    in a thread, up to `read_ahead` bytes ahead of the reader.
+
+    The ranges are requested on the same (keep-alive) connection. A failed request
+    (disconnection, timeout, server error) is retried on a new connection, up to
+    `max_retries` times (with an exponential backoff). A range partially received is
+    resumed from its first byte not received. A server without range requests
+    support (200 response) is streamed from the beginning, a retry skips the bytes
+    already received.
+
+    Args:
+        url (str): HTTP(S) URL of the resource
+        range_size (int): size (in bytes) of a range request
+        read_ahead (int): size (in bytes) of the read-ahead buffer (at least a range)
+        max_retries (int): maximum number of consecutive retries of a request
+        retry_delay (float): delay (in seconds) before the first retry, doubled
+            after each consecutive retry
+        timeout (float): timeout (in seconds) of the socket operations
+        metrics (Optional[PipelineMetrics]): metrics where the time spent fetching
+            each range (and its number of bytes) is recorded as the `fetch` stage
+
+    Attributes:
+        size (Optional[int]): size of the resource, if known
+        nb_requests (int): number of requests sent
+        nb_retries (int): number of requests retried
+    """
+
+    def __init__(
+        self,
+        url: str,
+        range_size: int = DEFAULT_RANGE_SIZE,
+        read_ahead: int = DEFAULT_READ_AHEAD,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+        timeout: float = DEFAULT_TIMEOUT,
+        metrics: Optional[PipelineMetrics] = None,
+    ):
+        super().__init__()
+        split_url = urlsplit(url)
+        if split_url.scheme not in ("http", "https") or not split_url.hostname:
+            raise ValueError(f"Can't fetch {url=} with HTTP range requests")
+        self.url = url
+        self.range_size = range_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.metrics = metrics
+        self.size: Optional[int] = None
+        self.nb_requests = 0
+        self.nb_retries = 0
+
+        self._split_url = split_url
+        self._target = (split_url.path or "/") + (
+            f"?{split_url.query}" if split_url.query else ""
+        )
+        self._connection: Optional[http.client.HTTPConnection] = None
+        # body of a 200 response (the server doesn't handle range requests)
+        self._streamed_response: Optional[http.client.HTTPResponse] = None
+
+        self._chunks: "queue.Queue[Any]" = queue.Queue(
+            maxsize=max(1, read_ahead // range_size)
+        )
+        self._buffer = memoryview(b"")
+        self._stop = threading.Event()
+        self._fetcher = threading.Thread(
+            target=self._fetch, name="http-range-fetcher", daemon=True
+        )
+        self._fetcher.start()
+
+    @property
+    def name(self) -> str:
+        return self.url
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if not self._buffer:
+            chunk = self._chunks.get()
+            if chunk is _END:
+                # the next reads are at the end too
+                self._chunks.put(_END)
+                return 0
+            if isinstance(chunk, BaseException):
+                # the fetcher thread is stopped: the next reads fail too
+                self._chunks.put(chunk)
+                raise chunk
+            self._buffer = memoryview(chunk)
+        nb_bytes = min(len(buffer), len(self._buffer))
+        memoryview(buffer).cast("B")[:nb_bytes] = self._buffer[:nb_bytes]
+        self._buffer = self._buffer[nb_bytes:]
+        return nb_bytes
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            # unblock the fetcher thread waiting for a slot of the read-ahead buffer
+            while self._fetcher.is_alive():
+                try:
+                    self._chunks.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            self._fetcher.join()
+            self._close_connection()
+        super().close()
+
+    def _put(self, element: Any) -> bool:
+        # wait for a slot of the read-ahead buffer, unless the reader is closed
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(element, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch(self) -> None:
+        offset = 0
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                chunk = self._fetch_with_retries(offset)
+                if self.metrics is not None:
+                    self.metrics.record(
+                        "fetch", time.perf_counter() - start, len(chunk)
+                    )
+                if not chunk:
+                    break
+                if not self._put(chunk):
+                    return
+                offset += len(chunk)
+                if self.size is not None and offset >= self.size:
+                    break
+        except BaseException as error:
+            self._put(error)
+        else:
+            self._put(_END)
+        finally:
+            self._close_connection()
+
+    def _fetch_with_retries(self, offset: int) -> bytes:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._fetch_range(offset)
+            except _RETRYABLE_ERRORS as error:
+                # retried on a new connection
+                self._close_connection()
+                if attempt == self.max_retries or self._stop.is_set():
+                    raise
+                self.nb_retries += 1
+                logger.warning(f"Retry to fetch {self.url} from {offset=}: {error!r}")
+                time.sleep(self.retry_delay * 2**attempt)
+        raise AssertionError("unreachable")
+
+    def _fetch_range(self, offset: int) -> bytes:
+        if self._streamed_response is not None:
+            return self._read_streamed_response(offset)
+
+        if self._connection is None:
+            connection_class: type[http.client.HTTPConnection] = (
+                http.client.HTTPSConnection
+                if self._split_url.scheme == "https"
+                else http.client.HTTPConnection
+            )
+            self._connection = connection_class(
+                self._split_url.netloc, timeout=self.timeout
+            )
+        self.nb_requests += 1
+        self._connection.request(
+            "GET",
+            self._target,
+            headers={"Range": f"bytes={offset}-{offset + self.range_size - 1}"},
+        )
+        response = self._connection.getresponse()
+        if response.status == 206:
+            content_range = _CONTENT_RANGE.fullmatch(
+                response.getheader("Content-Range", "")
+            )
+            if content_range and content_range[3] != "*":
+                self.size = int(content_range[3])
+            try:
+                # the whole body is read: the connection can be reused
+                return response.read()
+            except http.client.IncompleteRead as error:
+                if not error.partial:
+                    raise
+                # resumed on a new connection, from the first byte not received
+                self._close_connection()
+                self.nb_retries += 1
+                logger.warning(f"Resume {self.url} from {offset + len(error.partial)}")
+                return error.partial
+        if response.status == 416:
+            # range not satisfiable: the offset is the end of the resource
+            response.read()
+            return b""
+        if response.status == 200:
+            logger.info(f"{self.url} is streamed (no range requests support)")
+            self._streamed_response = response
+            length = response.getheader("Content-Length")
+            self.size = int(length) if length is not None else None
+            # skip the bytes already received (before a disconnection)
+            nb_bytes_to_skip = offset
+            while nb_bytes_to_skip:
+                skipped = response.read(min(nb_bytes_to_skip, self.range_size))
+                if not skipped:
+                    raise http.client.IncompleteRead(skipped, nb_bytes_to_skip)
+                nb_bytes_to_skip -= len(skipped)
+            return self._read_streamed_response(offset)
+        response.read()
+        error_message = f"HTTP error {response.status} ({response.reason}): {self.url}"
+        if response.status >= 500:
+            # server errors can be transient
+            raise ConnectionError(error_message)
+        # not retried
+        raise RuntimeError(error_message)
+
+    def _read_streamed_response(self, offset: int) -> bytes:
+        assert self._streamed_response is not None  # nosec
+        chunk = self._streamed_response.read(self.range_size)
+        if not chunk and self.size is not None and offset < self.size:
+            # a body read by parts and cut before its end isn't an error of http.client
+            raise http.client.IncompleteRead(chunk, self.size - offset)
+        return chunk
+
+    def _close_connection(self) -> None:
+        self._streamed_response = None
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def open_url(
+    url: str,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    read_ahead: int = DEFAULT_READ_AHEAD,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    metrics: Optional[PipelineMetrics] = None,
+) -> io.BufferedReader:
+    """
+    Open an HTTP(S) URL as a buffered binary stream, fetched by an `HTTPRangeReader`.
+    The stream can be read as a media file binary stream (e.g. by
+    `vhcalc.services.imghashes.b2u_stream_to_imghashes`).
+
+    Args:
+        url (str): HTTP(S) URL of the resource
+        range_size (int): see `HTTPRangeReader`
+        read_ahead (int): see `HTTPRangeReader`
+        max_retries (int): see `HTTPRangeReader`
+        metrics (Optional[PipelineMetrics]): see `HTTPRangeReader`
+
+    Returns:
+        io.BufferedReader: binary stream of the resource (to close)
+    """
+    return io.BufferedReader(
+        HTTPRangeReader(
+            url,
+            range_size=range_size,
+            read_ahead=read_ahead,
+            max_retries=max_retries,
+            metrics=metrics,
+        ),
+        buffer_size=range_size,
+    )
@@ -1,11 +1,14 @@
-import binascii
-from typing import Callable, Final
+import math
+from typing import Callable, Final, Union
 
 import imagehash
 import numpy as np
+import numpy.typing as npt
 from imagehash import ImageHash
 from PIL import Image
 
+from vhcalc.tools.batch_imghash import BATCH_IMGHASH_FUNCTIONS
+
 FRAME_SIZE: Final[int] = 32
 
 
@@ -26,8 +29,8 @@ def imghash_to_bytes(imghash: ImageHash) -> bytes:
     >>> imghash_to_bytes(img_hash)
     b'\\xd5\\x00\\x00\\x00\\x00\\x00\\x00\\x00'
     """
-    bin_array_to_hex = str(imghash)
-    return binascii.a2b_hex(bin_array_to_hex)
+    # the bits packed (most significant first), as the hexadecimal `str(imghash)`
+    return np.packbits(imghash.hash).tobytes()
 
 
 def bytes_to_imghash(raw_bytes: bytes) -> ImageHash:
@@ -54,7 +57,19 @@ def bytes_to_imghash(raw_bytes: bytes) -> ImageHash:
         >>> str(imghash_reconstructed)
         'd500000000000000'
     """
-    return imagehash.hex_to_hash(binascii.b2a_hex(raw_bytes).decode())
+    hash_size = math.isqrt(len(raw_bytes) * 8)
+    bits = np.unpackbits(np.frombuffer(raw_bytes, dtype=np.uint8))
+    return ImageHash(bits.reshape(hash_size, hash_size) == 1)
+
+
+def uint64_to_imghash(value: int) -> ImageHash:
+    """`ImageHash` of an image hash as 64 bits integer (e.g. an item of
+    `imghashes_as_uint64`), only built for the API compatibility
+
+    >>> str(uint64_to_imghash(0xD5D52AD52AD42AD4))
+    'd5d52ad52ad42ad4'
+    """
+    return bytes_to_imghash(int(value).to_bytes(8, "big"))
 
 
 def rawframe_to_imghash(
@@ -83,3 +98,87 @@ def rawframe_to_imghash(
             ).reshape(frame_width, frame_height)
         )
     )
+
+
+def rawframes_to_imghashes(
+    raw_frames: npt.NDArray[np.uint8],
+    fn_imagehash: Callable[[Image.Image], ImageHash] = imagehash.phash,
+) -> npt.NDArray[np.uint8]:
+    """Apply an image hashing function on a stack of raw image frames.
+
+    Args:
+        raw_frames (np.ndarray): stack of gray frames with shape (N, height, width)
+        fn_imagehash (Callable): ImageHash function (or ImageHashingFunction member)
+
+    Returns:
+        np.ndarray: binary images hashes with shape (N, 8), each row is equal to
+            `imghash_to_bytes(rawframe_to_imghash(raw_frame, fn_imagehash=fn_imagehash))`
+
+    Examples:
+        >>> raw_frames = np.full((2, FRAME_SIZE, FRAME_SIZE), 128, dtype=np.uint8)
+        >>> rawframes_to_imghashes(raw_frames).tobytes()
+        b'\\x80\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x80\\x00\\x00\\x00\\x00\\x00\\x00\\x00'
+    """
+    # unwrap ImageHashingFunction (DocEnum) members
+    fn_imagehash = getattr(fn_imagehash, "value", fn_imagehash)
+    fn_batch_imagehash = BATCH_IMGHASH_FUNCTIONS.get(fn_imagehash)
+    if fn_batch_imagehash is not None:
+        return fn_batch_imagehash(raw_frames)
+    # no vectorized version: fallback on PIL.Image per frame
+    _, frame_height, frame_width = raw_frames.shape
+    imghashes_bits = np.array(
+        [
+            rawframe_to_imghash(
+                raw_frame,
+                frame_width=frame_width,
+                frame_height=frame_height,
+                fn_imagehash=fn_imagehash,
+            ).hash
+            for raw_frame in raw_frames
+        ],
+        dtype=bool,
+    ).reshape(len(raw_frames), -1)
+    # all the bits packed at once (no conversion per image hash)
+    return np.packbits(imghashes_bits, axis=1).reshape(-1, 8)
+
+
+def imghashes_as_uint64(
+    imghashes: Union[npt.NDArray[np.uint8], bytes],
+) -> npt.NDArray[np.uint64]:
+    """View (without copy) binary images hashes ((N, 8) array or bytes) as big-endian
+    64 bits integers: the compact representation of images hashes in the services,
+    with the same memory layout as the .phash files.
+
+    Examples:
+        >>> imghashes = imghashes_as_uint64(b'\\xd5\\xd5*\\xd5*\\xd4*\\xd4' * 2)
+        >>> [hex(value) for value in imghashes], imghashes.tobytes()[:8]
+        (['0xd5d52ad52ad42ad4', '0xd5d52ad52ad42ad4'], b'\\xd5\\xd5*\\xd5*\\xd4*\\xd4')
+    """
+    if isinstance(imghashes, bytes):
+        return np.frombuffer(imghashes, dtype=">u8")
+    return np.ascontiguousarray(imghashes).reshape(-1).view(">u8")
+
+
+def imghashes_to_uint64(
+    imghashes: Union[npt.NDArray[np.uint8], bytes],
+) -> npt.NDArray[np.uint64]:
+    """Convert binary images hashes ((N, 8) array or bytes) to (native) 64 bits integers.
+
+    Examples:
+        >>> [hex(value) for value in imghashes_to_uint64(b'\\xd5\\xd5*\\xd5*\\xd4*\\xd4' * 2)]
+        ['0xd5d52ad52ad42ad4', '0xd5d52ad52ad42ad4']
+    """
+    return imghashes_as_uint64(imghashes).astype(np.uint64)
+
+
+def hamming_distances(
+    imghashes: npt.NDArray[np.uint64], other_imghashes: npt.NDArray[np.uint64]
+) -> npt.NDArray[np.uint8]:
+    """Hamming distances between (broadcast) images hashes as 64 bits integers.
+
+    Examples:
+        >>> imghashes = np.array([0b1011, 0xFFFF], dtype=np.uint64)
+        >>> hamming_distances(imghashes, np.uint64(0b0001))
+        array([ 2, 15], dtype=uint8)
+    """
+    return np.bitwise_count(np.bitwise_xor(imghashes, other_imghashes))
@@ -0,0 +1,172 @@
+"""
+Instrumentation of the images hashes pipeline: time spent and items processed per
+stage (probe, read, hash, write, ...), gauges (queue depths) and CPU time of the child
+processes, emitted as JSON lines (one line per media).
+"""
+
+import json
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Final, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# a stage operation (e.g. waiting for a block of frames from ffmpeg) longer than this
+# is counted as a stall
+STALL_SECONDS: Final[float] = 1.0
+
+# JSON lines are appended by many (concurrent) exports to the same metrics file
+_metrics_file_lock = threading.Lock()
+
+
+@dataclass
+class StageMetrics:
+    """`count` items processed by `nb_calls` operations in `seconds` (the longest one
+    in `max_seconds`), `stalls` operations longer than `STALL_SECONDS`"""
+
+    seconds: float = 0.0
+    count: int = 0
+    nb_calls: int = 0
+    max_seconds: float = 0.0
+    stalls: int = 0
+
+
+@dataclass
+class GaugeMetrics:
+    """statistics of the values observed for a gauge (e.g. a queue depth)"""
+
+    last: float = 0.0
+    min: float = float("inf")
+    max: float = float("-inf")
+    sum: float = 0.0
+    nb_observations: int = 0
+
+
+@dataclass
+class PipelineMetrics:
+    """
+    Metrics of the images hashes pipeline of a media.
+
+    `children_cpu_seconds` is the CPU time of the child processes of this process
+    terminated (and waited for) during the measure (`RUSAGE_CHILDREN`): the ffmpeg
+    (and ffprobe) processes of the media, but also the hashing worker processes
+    (`jobs`, `hashing_processes`). It is process-wide: it isn't recorded
+    (`children_cpu=False`) when other medias are exported at the same time, their
+    child processes would be counted too.
+
+    Examples:
+        >>> metrics = PipelineMetrics("media.mkv")
+        >>> with metrics.timed("hash", count=375):
+        ...     pass
+        >>> list(metrics.timed_iter("read", [b"ab", b"c"], count=len))
+        [b'ab', b'c']
+        >>> metrics.observe("hash_queue_depth", 2)
+        >>> metrics.stages["read"].count, metrics.stages["read"].nb_calls
+        (3, 2)
+        >>> sorted(metrics.to_dict())
+        ['children_cpu_seconds', 'elapsed_seconds', 'gauges', 'media', 'stages', 'started_at']
+        >>> "children_cpu_seconds" in PipelineMetrics("media.mkv", children_cpu=False).to_dict()
+        False
+    """
+
+    media: str
+    children_cpu: bool = True
+    stages: dict[str, StageMetrics] = field(default_factory=dict)
+    gauges: dict[str, GaugeMetrics] = field(default_factory=dict)
+    started_at: float = field(default_factory=time.time)
+    _start: float = field(default_factory=time.perf_counter, init=False, repr=False)
+    _children_cpu_start: float = field(
+        default_factory=lambda: _children_cpu_seconds(), init=False, repr=False
+    )
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def record(self, stage: str, seconds: float, count: int = 0) -> None:
+        """Record an operation of a stage (thread-safe)"""
+        with self._lock:
+            stage_metrics = self.stages.setdefault(stage, StageMetrics())
+            stage_metrics.seconds += seconds
+            stage_metrics.count += count
+            stage_metrics.nb_calls += 1
+            stage_metrics.max_seconds = max(stage_metrics.max_seconds, seconds)
+            stage_metrics.stalls += seconds > STALL_SECONDS
+
+    @contextmanager
+    def timed(self, stage: str, count: int = 0) -> Iterator[None]:
+        """Record the operation run in the context"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, count)
+
+    def timed_iter(
+        self,
+        stage: str,
+        iterable: Iterable[T],
+        count: Callable[[T], int] = lambda _: 1,
+    ) -> Iterator[T]:
+        """Record the time spent waiting for each item of an iterable (and its count)"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.record(stage, time.perf_counter() - start, count(item))
+            yield item
+
+    def observe(self, gauge: str, value: float) -> None:
+        """Observe the value of a gauge (thread-safe)"""
+        with self._lock:
+            gauge_metrics = self.gauges.setdefault(gauge, GaugeMetrics())
+            gauge_metrics.last = value
+            gauge_metrics.min = min(gauge_metrics.min, value)
+            gauge_metrics.max = max(gauge_metrics.max, value)
+            gauge_metrics.sum += value
+            gauge_metrics.nb_observations += 1
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            children_cpu_metrics = (
+                {
+                    "children_cpu_seconds": _children_cpu_seconds()
+                    - self._children_cpu_start
+                }
+                if self.children_cpu
+                else {}
+            )
+            return {
+                "media": self.media,
+                "started_at": self.started_at,
+                "elapsed_seconds": time.perf_counter() - self._start,
+                **children_cpu_metrics,
+                "stages": {
+                    stage: asdict(stage_metrics)
+                    for stage, stage_metrics in self.stages.items()
+                },
+                "gauges": {
+                    gauge: {
+                        **asdict(gauge_metrics),
+                        "mean": gauge_metrics.sum / gauge_metrics.nb_observations,
+                    }
+                    for gauge, gauge_metrics in self.gauges.items()
+                },
+            }
+
+    def write(self, metrics_file: Path) -> None:
+        """Append the metrics as a JSON line to `metrics_file`"""
+        line = json.dumps(self.to_dict()) + "\n"
+        with _metrics_file_lock, metrics_file.open("a") as fo:
+            fo.write(line)
+
+
+def _children_cpu_seconds() -> float:
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return children_usage.ru_utime + children_usage.ru_stime
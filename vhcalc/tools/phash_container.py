@@ -0,0 +1,213 @@
+"""
+Writer of images hashes container (.vhc) files.
+
+Layout of a container file (little-endian, except the images hashes):
+    - header (`HEADER_STRUCT`): magic, version, flags, frame size, hashing method,
+      sampling, fps, duration, number of frames, offsets of the columns, seek index
+      interval, fingerprint of the source media and digest of the decoding options
+    - images hashes column: 8 bytes (big-endian) per frame, as in .phash files
+    - presentation timestamps column (optional): float64 (in seconds) per frame
+    - seek index (if timestamps are stored): timestamp of every
+      `seek_index_interval` frame, to find the frame displayed at a timestamp
+      without reading the whole timestamps column
+
+Every column is 8 bytes aligned: the file can be read from a memory mapping
+(see `vhcalc.services.phash_file.PhashFile`) without parsing it.
+"""
+
+import os
+import struct
+from pathlib import Path
+from types import TracebackType
+from typing import Final, Optional, Tuple, Type
+
+import numpy as np
+import numpy.typing as npt
+
+from vhcalc.models import PhashHeader
+from vhcalc.tools.hash_sink import HashSink
+
+MAGIC: Final[bytes] = b"VHCPHASH"
+VERSION: Final[int] = 2
+# magic, version, flags, frame size, method, sampling, fps, duration, nb frames,
+# pts offset, seek index offset, seek index interval, source fingerprint, decode
+# profile digest
+HEADER_STRUCT: Final[struct.Struct] = struct.Struct("<8sHHH2x32s32sddQQQQ32s8s")
+HEADER_SIZE: Final[int] = HEADER_STRUCT.size
+# the container is complete (written up to its seek index)
+FLAG_COMPLETE: Final[int] = 1 << 0
+FLAG_HAS_PTS: Final[int] = 1 << 1
+DEFAULT_SEEK_INDEX_INTERVAL: Final[int] = 256
+
+
+def pack_header(
+    header: PhashHeader,
+    pts_offset: int = 0,
+    seek_index_offset: int = 0,
+    seek_index_interval: int = 0,
+    complete: bool = True,
+) -> bytes:
+    """binary header of a container
+
+    >>> header = PhashHeader(method="PerceptualHashing", frame_size=32, fps=25.0)
+    >>> len(pack_header(header)) == HEADER_SIZE
+    True
+    >>> unpack_header(pack_header(header))[0] == header
+    True
+    """
+    flags = (FLAG_COMPLETE if complete else 0) | (FLAG_HAS_PTS if header.has_pts else 0)
+    return HEADER_STRUCT.pack(
+        MAGIC,
+        VERSION,
+        flags,
+        header.frame_size,
+        header.method.encode(),
+        header.sampling.encode(),
+        header.fps or 0.0,
+        header.duration or 0.0,
+        header.nb_frames,
+        pts_offset,
+        seek_index_offset,
+        seek_index_interval,
+        bytes.fromhex(header.source_fingerprint or ""),
+        bytes.fromhex(header.decode_profile),
+    )
+
+
+def unpack_header(buffer: bytes) -> Tuple[PhashHeader, int, int, int]:
+    """
+    Parse the binary header of a container.
+
+    Returns:
+        Tuple[PhashHeader, int, int, int]: the header, the offset of the timestamps
+            column, the offset of the seek index and the seek index interval.
+
+    Raises:
+        ValueError: not a (complete) container, or unsupported version
+    """
+    if len(buffer) < HEADER_SIZE or not buffer.startswith(MAGIC):
+        raise ValueError("Not an images hashes container")
+    (
+        _magic,
+        version,
+        flags,
+        frame_size,
+        method,
+        sampling,
+        fps,
+        duration,
+        nb_frames,
+        pts_offset,
+        seek_index_offset,
+        seek_index_interval,
+        source_fingerprint,
+        decode_profile,
+    ) = HEADER_STRUCT.unpack_from(buffer)
+    if version != VERSION:
+        raise ValueError(f"Unsupported images hashes container version: {version}")
+    if not flags & FLAG_COMPLETE:
+        raise ValueError("Incomplete images hashes container")
+    header = PhashHeader(
+        method=method.rstrip(b"\0").decode(),
+        frame_size=frame_size,
+        fps=fps or None,
+        duration=duration or None,
+        sampling=sampling.rstrip(b"\0").decode(),
+        source_fingerprint=(
+            source_fingerprint.hex() if any(source_fingerprint) else None
+        ),
+        nb_frames=nb_frames,
+        has_pts=bool(flags & FLAG_HAS_PTS),
+        decode_profile=decode_profile.hex() if any(decode_profile) else "",
+    )
+    return header, pts_offset, seek_index_offset, seek_index_interval
+
+
+class PhashContainerSink(HashSink):
+    """
+    Write a container: chunks of images hashes are appended (as with `HashSink`) after
+    the header, the timestamps (if `header.has_pts`) are buffered and written (with the
+    seek index) on close. The header is only marked complete on close (without error),
+    so an interrupted export is never read as a valid container.
+
+    Examples:
+        >>> import tempfile
+        >>> from vhcalc.services.phash_file import PhashFile
+        >>> output_file = Path(tempfile.mkdtemp()) / "export.vhc"
+        >>> header = PhashHeader(method="PerceptualHashing", frame_size=32, has_pts=True)
+        >>> with PhashContainerSink(output_file, header, seek_index_interval=2) as sink:
+        ...     sink.write(np.full((3, 8), 0xD5, dtype=np.uint8))
+        ...     sink.write_timestamps(np.array([0.0, 7.0, 9.08]))
+        >>> with PhashFile(output_file) as phash_file:
+        ...     phash_file.header.nb_frames, phash_file.timestamps.tolist()
+        ...     phash_file.frame_index(8.5)
+        (3, [0.0, 7.0, 9.08])
+        1
+    """
+
+    def __init__(
+        self,
+        output_file: Path,
+        header: PhashHeader,
+        fsync_on_checkpoint: bool = False,
+        seek_index_interval: int = DEFAULT_SEEK_INDEX_INTERVAL,
+    ):
+        super().__init__(output_file, fsync_on_checkpoint)
+        self.header = header
+        self.seek_index_interval = seek_index_interval
+        self._timestamps: list[npt.NDArray[np.float64]] = []
+
+    def open(self) -> "PhashContainerSink":
+        self.output_file.unlink(missing_ok=True)
+        super().open()
+        self.write(pack_header(self.header, complete=False))
+        return self
+
+    def write_timestamps(self, timestamps: npt.NDArray[np.float64]) -> None:
+        """Add the timestamps (in seconds) of a chunk of images hashes"""
+        self._timestamps.append(np.asarray(timestamps, dtype="<f8"))
+
+    def _finalize(self) -> None:
+        nb_frames = (self.nbytes_written - HEADER_SIZE) // 8
+        pts_offset = seek_index_offset = seek_index_interval = 0
+        if self.header.has_pts:
+            timestamps = np.concatenate([np.empty(0, dtype="<f8"), *self._timestamps])
+            if len(timestamps) != nb_frames:
+                raise ValueError(
+                    f"{len(timestamps)} timestamps for {nb_frames} images hashes"
+                )
+            pts_offset = self.nbytes_written
+            self.write(timestamps)
+            seek_index_offset = self.nbytes_written
+            seek_index_interval = self.seek_index_interval
+            self.write(timestamps[::seek_index_interval])
+        self.header.nb_frames = nb_frames
+        # the file is opened in append mode: the header is written with another fd
+        fd = os.open(self.output_file, os.O_WRONLY)
+        try:
+            os.pwrite(
+                fd,
+                pack_header(
+                    self.header, pts_offset, seek_index_offset, seek_index_interval
+                ),
+                0,
+            )
+            if self.fsync_on_checkpoint:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def __enter__(self) -> "PhashContainerSink":
+        return self.open()
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ) -> None:
+        try:
+            if exc_type is None:
+                self._finalize()
+        finally:
+            self.close()
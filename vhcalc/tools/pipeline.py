@@ -0,0 +1,120 @@
+"""
+Pipelined (producer/consumer) processing of blocks of frames: a reader thread pulls
+the blocks (i.e. waits for ffmpeg) while the previous blocks are processed (hashed)
+by the workers of an executor, so decoding and hashing overlap.
+"""
+
+import queue
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Final, Iterable, Iterator, Optional, TypeVar
+
+from vhcalc.tools.metrics import PipelineMetrics
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_MAX_PENDING: Final[int] = 2
+
+# end of the blocks pulled by the reader thread
+_END: Final = object()
+
+
+def ring_buffer_size(max_pending: int) -> int:
+    """
+    Number of blocks of a reader ring buffer (see
+    `vhcalc.services.reader_frames.build_reader_frame_blocks`) for its blocks to be
+    consumed by `pipelined_map` without copy: `max_pending` blocks queued, one
+    waited for by the consumer, one waiting for a queue slot and one being read.
+
+    >>> ring_buffer_size(DEFAULT_MAX_PENDING)
+    5
+    """
+    return max_pending + 3
+
+
+def pipelined_map(
+    fn: Callable[[T], R],
+    iterable: Iterable[T],
+    executor: Executor,
+    max_pending: int = DEFAULT_MAX_PENDING,
+    metrics: Optional[PipelineMetrics] = None,
+) -> Iterator[R]:
+    """
+    Same as `map(fn, iterable)`, but the items are pulled from `iterable` by a reader
+    thread and `fn` is applied in `executor`.
+
+    The results are yielded in the order of the items. At most `max_pending` items are
+    submitted ahead of the result being yielded (backpressure): the reader thread
+    waits for a slot, which bounds the memory used by the pipeline. Items yielded as
+    views into a ring buffer have to stay valid while they are processed, see
+    `ring_buffer_size`.
+
+    An exception raised by `iterable` or `fn` is raised by the consumer (in order).
+    If the consumer stops early (the generator is closed), the reader thread stops and
+    the pending items are cancelled.
+
+    Args:
+        fn (Callable[[T], R]): function applied to each item (in `executor`)
+        iterable (Iterable[T]): items, pulled in a reader thread
+        executor (Executor): executor (shared or not) where `fn` is applied
+        max_pending (int): maximum number of items submitted but not yet consumed
+        metrics (Optional[PipelineMetrics]): the number of pending items is observed
+            as the `pending_blocks` gauge before each result is consumed
+
+    Yields:
+        R: result of `fn` for each item, in order
+
+    Examples:
+        >>> from concurrent.futures import ThreadPoolExecutor
+        >>> with ThreadPoolExecutor(max_workers=2) as executor:
+        ...     list(pipelined_map(lambda x: x * x, range(5), executor))
+        [0, 1, 4, 9, 16]
+    """
+    pending: "queue.Queue[Any]" = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+
+    def _put(element: Any) -> bool:
+        # wait for a slot, unless the consumer has stopped
+        while not stop.is_set():
+            try:
+                pending.put(element, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read() -> None:
+        try:
+            for item in iterable:
+                if not _put(executor.submit(fn, item)):
+                    return
+        except BaseException as error:
+            _put(error)
+        else:
+            _put(_END)
+
+    reader = threading.Thread(target=_read, name="pipeline-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            if metrics is not None:
+                metrics.observe("pending_blocks", pending.qsize())
+            element = pending.get()
+            if element is _END:
+                return
+            if isinstance(element, BaseException):
+                raise element
+            future: "Future[R]" = element
+            yield future.result()
+    finally:
+        stop.set()
+        # unblock the reader thread and cancel the pending items
+        while reader.is_alive() or not pending.empty():
+            try:
+                element = pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if isinstance(element, Future):
+                element.cancel()
+        reader.join()
@@ -26,10 +26,8 @@ class TimeElapsedOverRemainingColumn(TimeRemainingColumn):
         return Text(f"{str(elapsed_delta)}/{remaining}", style="progress.remaining")
 
 
-def configure_progress_bar(
-    filename: str, total: int, console: Optional[Console] = None
-) -> Tuple[Progress, TaskID]:
-    progress = Progress(
+def build_progress_bar(console: Optional[Console] = None) -> Progress:
+    return Progress(
         TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
         BarColumn(bar_width=None),
         "[progress.percentage]{task.percentage:>3.1f}%",
@@ -41,8 +39,18 @@ def configure_progress_bar(
         TimeElapsedOverRemainingColumn(),
         console=console or get_console(),
     )
+
+
+def add_progress_task(progress: Progress, filename: str, total: int) -> TaskID:
     task_id = progress.add_task(
         "build&export images hashes", filename=filename, start=True
     )
     progress.update(task_id, total=total)
-    return progress, task_id
+    return task_id
+
+
+def configure_progress_bar(
+    filename: str, total: int, console: Optional[Console] = None
+) -> Tuple[Progress, TaskID]:
+    progress = build_progress_bar(console)
+    return progress, add_progress_task(progress, filename, total)
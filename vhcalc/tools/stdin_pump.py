@@ -0,0 +1,222 @@
+"""
+Pump of a media binary stream into the ffmpeg stdin pipe, with as few copies and
+syscalls as possible: the pipe buffer is enlarged (`F_SETPIPE_SZ`), a file-backed
+stream is sent by the kernel (`os.sendfile` for a regular file, `os.splice` for a
+pipe or a socket) and the other streams are read into a large reusable buffer.
+"""
+
+import io
+import os
+import select
+import stat
+import sys
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Final, Optional
+
+if sys.platform != "win32":
+    import fcntl
+
+# size of the pipe buffer requested (the default Linux maximum, see
+# /proc/sys/fs/pipe-max-size), i.e. of the transfers into the pipe
+PIPE_SIZE: Final[int] = 1024 * 1024
+# size of the transfers if the pipe size is unknown
+DEFAULT_BUFFER_SIZE: Final[int] = 64 * 1024
+
+# Linux fcntl commands, exposed by the fcntl module since Python 3.10
+_F_SETPIPE_SZ: Final[int] = 1031
+_F_GETPIPE_SZ: Final[int] = 1032
+
+
+@dataclass
+class PumpStats:
+    """`nb_bytes` pumped with `method` in `seconds`, `stall_seconds` of which waiting
+    for the pipe to be drained (by ffmpeg)"""
+
+    method: str = ""
+    nb_bytes: int = 0
+    seconds: float = 0.0
+    stall_seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """bytes per second"""
+        return self.nb_bytes / self.seconds if self.seconds else 0.0
+
+
+def set_pipe_size(pipe_fd: int, size: int = PIPE_SIZE) -> int:
+    """
+    Enlarge the buffer of a pipe (Linux only, up to /proc/sys/fs/pipe-max-size for
+    an unprivileged process).
+
+    Returns:
+        int: size of the pipe buffer, 0 if unknown
+    """
+    if sys.platform == "win32":
+        return 0
+    try:
+        return fcntl.fcntl(pipe_fd, _F_SETPIPE_SZ, size)
+    except OSError:
+        try:
+            return fcntl.fcntl(pipe_fd, _F_GETPIPE_SZ)
+        except OSError:
+            return 0
+
+
+class _PipeWriter:
+    """Non-blocking transfers into a pipe: the waits for the pipe to be drained are
+    the stalls of the pump."""
+
+    def __init__(self, pipe_fd: int, stats: PumpStats):
+        self.pipe_fd = pipe_fd
+        self.stats = stats
+        self.poller: Optional["select.poll"] = None
+        if hasattr(select, "poll"):
+            os.set_blocking(pipe_fd, False)
+            self.poller = select.poll()
+            self.poller.register(pipe_fd, select.POLLOUT)
+
+    def transfer(self, fn_transfer: Callable[[], int]) -> int:
+        """Number of bytes transferred by `fn_transfer` (retried once the pipe is
+        writable)"""
+        while True:
+            start = time.perf_counter()
+            try:
+                nb_bytes = fn_transfer()
+                if self.poller is None:
+                    # blocking transfers: a wait for the pipe isn't distinguished
+                    self.stats.stall_seconds += time.perf_counter() - start
+                self.stats.nb_bytes += nb_bytes
+                return nb_bytes
+            except BlockingIOError:
+                assert self.poller is not None  # nosec
+                # the pipe is full: wait for ffmpeg to read it
+                self.poller.poll()
+                self.stats.stall_seconds += time.perf_counter() - start
+
+    def write(self, data: memoryview) -> None:
+        while data:
+            nb_bytes = self.transfer(lambda: os.write(self.pipe_fd, data))
+            data = data[nb_bytes:]
+
+
+def _source_fd(stream: BinaryIO) -> Optional[int]:
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def pump_to_pipe(
+    stream: BinaryIO, pipe_fd: int, buffer_size: Optional[int] = None
+) -> PumpStats:
+    """
+    Write the content of `stream` (from its position to its end) into a pipe.
+
+    - a regular file is sent with `os.sendfile` (no copy in user space),
+    - a pipe or a socket is spliced (`os.splice`, Linux and Python >= 3.10),
+    - the other streams (or if the kernel refuses the transfer) are read into a
+      reusable buffer (`readinto`), written with `os.write` (no flush).
+
+    The transfers have the size of the pipe buffer (enlarged by `set_pipe_size`).
+
+    Args:
+        stream (BinaryIO): binary stream to pump
+        pipe_fd (int): file descriptor of the write end of the pipe (set
+            non-blocking to measure the stalls)
+        buffer_size (Optional[int]): size of the transfers, default to the size of
+            the pipe buffer
+
+    Returns:
+        PumpStats: statistics of the pump
+
+    Raises:
+        BrokenPipeError: the read end of the pipe is closed
+
+    Examples:
+        >>> read_fd, write_fd = os.pipe()
+        >>> stats = pump_to_pipe(io.BytesIO(b"media content"), write_fd)
+        >>> os.close(write_fd)
+        >>> os.read(read_fd, 1024), stats.method, stats.nb_bytes
+        (b'media content', 'readinto', 13)
+        >>> os.close(read_fd)
+    """
+    start = time.perf_counter()
+    pipe_size = set_pipe_size(pipe_fd)
+    buffer_size = buffer_size or pipe_size or DEFAULT_BUFFER_SIZE
+    stats = PumpStats()
+    writer = _PipeWriter(pipe_fd, stats)
+    try:
+        source_fd = _source_fd(stream)
+        mode = os.fstat(source_fd).st_mode if source_fd is not None else 0
+        if source_fd is not None and stat.S_ISREG(mode) and hasattr(os, "sendfile"):
+            _pump_with_sendfile(stream, source_fd, writer, buffer_size)
+        elif (
+            source_fd is not None
+            and (stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode))
+            and hasattr(os, "splice")
+        ):
+            _pump_with_splice(stream, source_fd, writer, buffer_size)
+        else:
+            _pump_with_readinto(stream, writer, buffer_size)
+    finally:
+        stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def _pump_with_sendfile(
+    stream: BinaryIO, source_fd: int, writer: _PipeWriter, buffer_size: int
+) -> None:
+    writer.stats.method = "sendfile"
+    # sent from the stream position (its buffered bytes included)
+    offset = stream.tell()
+    try:
+        while nb_bytes := writer.transfer(
+            lambda: os.sendfile(writer.pipe_fd, source_fd, offset, buffer_size)
+        ):
+            offset += nb_bytes
+    except OSError as error:
+        if isinstance(error, BrokenPipeError) or writer.stats.nb_bytes:
+            raise
+        # e.g. EINVAL: not supported by the filesystem
+        _pump_with_readinto(stream, writer, buffer_size)
+        return
+    # the stream is consumed
+    stream.seek(offset)
+
+
+def _pump_with_splice(
+    stream: BinaryIO, source_fd: int, writer: _PipeWriter, buffer_size: int
+) -> None:
+    writer.stats.method = "splice"
+    if isinstance(stream, io.BufferedReader):
+        # the bytes already read (buffered) from the source are written first
+        buffered = stream.peek()
+        writer.write(memoryview(buffered))
+        stream.read(len(buffered))
+    try:
+        while writer.transfer(
+            lambda: os.splice(source_fd, writer.pipe_fd, buffer_size)
+        ):
+            pass
+    except OSError as error:
+        if isinstance(error, BrokenPipeError) or writer.stats.nb_bytes:
+            raise
+        _pump_with_readinto(stream, writer, buffer_size)
+
+
+def _pump_with_readinto(
+    stream: BinaryIO, writer: _PipeWriter, buffer_size: int
+) -> None:
+    writer.stats.method = "readinto"
+    buffer = memoryview(bytearray(buffer_size))
+    readinto = getattr(stream, "readinto", None)
+    while True:
+        if readinto is not None:
+            nb_bytes = readinto(buffer)
+            data = buffer[:nb_bytes] if nb_bytes else buffer[:0]
+        else:
+            data = memoryview(stream.read(buffer_size))
+        if not data:
+            return
+        writer.write(data)